@@ -0,0 +1,59 @@
+"""Measures the time to generate the Compose file of a large topology."""
+
+import argparse
+import time
+
+from wotemu.topology.models import (Broker, Network, Node, NodeApp, Service,
+                                    Topology)
+
+
+def build_topology(num_nodes, num_networks, num_services, num_brokers):
+    networks = [Network(name="net_{}".format(idx)) for idx in range(num_networks)]
+    services = [Service(name="srv_{}".format(idx), image="redis") for idx in range(num_services)]
+
+    brokers = [
+        Broker(name="broker_{}".format(idx), networks=[networks[idx]])
+        for idx in range(num_brokers)
+    ]
+
+    node_app = NodeApp(path="/root/app.py", http=True)
+
+    nodes = [
+        Node(
+            name="node_{}".format(idx),
+            app=node_app,
+            networks=[networks[idx % num_networks]],
+            services=[services[idx % num_services]])
+        for idx in range(num_nodes)
+    ]
+
+    return Topology(nodes=nodes, brokers=brokers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--nodes", type=int, default=5000)
+    parser.add_argument("--networks", type=int, default=500)
+    parser.add_argument("--services", type=int, default=1000)
+    parser.add_argument("--brokers", type=int, default=10)
+    parser.add_argument("--max-secs", type=float, default=None)
+    args = parser.parse_args()
+
+    topology = build_topology(
+        num_nodes=args.nodes,
+        num_networks=args.networks,
+        num_services=args.services,
+        num_brokers=args.brokers)
+
+    ini = time.perf_counter()
+    topology.to_compose_dict()
+    elapsed = time.perf_counter() - ini
+
+    print("Compose generation ({} nodes): {:.2f} s".format(args.nodes, elapsed))
+
+    if args.max_secs is not None and elapsed > args.max_secs:
+        raise SystemExit("Slower than {} s".format(args.max_secs))
+
+
+if __name__ == "__main__":
+    main()
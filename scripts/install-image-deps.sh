@@ -10,6 +10,6 @@ iptables \
 tshark \
 wget \
 curl \
-mosquitto \
-dnsutils \
-cgroup-tools
\ No newline at end of file
+libcurl4-openssl-dev \
+libssl-dev \
+mosquitto
\ No newline at end of file
@@ -75,6 +75,9 @@ setuptools.setup(
             "motor>=2.3,<3.0",
             "opencv-python>=4.5,<4.6",
             "face-recognition>=1.3,<1.4"
+        ],
+        "http": [
+            "pycurl>=7.43,<8.0"
         ]
     }
 )
@@ -0,0 +1,140 @@
+import time
+
+import pytest
+from wotemu.enums import BuiltinApps, NetworkConditions
+from wotemu.topology.analysis import (ISSUE_CONFIG, ISSUE_LINK,
+                                      ISSUE_RESOURCES, ISSUE_TARGET,
+                                      parse_memory, parse_rate)
+from wotemu.topology.models import (Broker, Network, Node, NodeApp,
+                                    NodeGroup, NodeResources, Topology)
+
+
+def test_parse_units():
+    assert parse_rate("50kbit") == pytest.approx(50e3)
+    assert parse_rate("15mbit") == pytest.approx(15e6)
+    assert parse_rate("1mbps") == pytest.approx(8e6)
+    assert parse_rate(1000) == pytest.approx(1000)
+    assert parse_memory("150M") == pytest.approx(150 * 1024 ** 2)
+    assert parse_memory("1gb") == pytest.approx(1024 ** 3)
+
+    with pytest.raises(ValueError):
+        parse_rate("10 furlongs")
+
+
+def test_analyze_saturated_broker_network():
+    net_gprs = Network(name="gprs", conditions=NetworkConditions.GPRS)
+    net_cable = Network(name="cable", conditions=NetworkConditions.CABLE)
+    broker = Broker(name="broker", networks=[net_gprs])
+
+    clock = Node(
+        name="clock",
+        app=NodeApp(path=BuiltinApps.CLOCK, mqtt=True, params={"interval": 1}),
+        networks=[net_gprs],
+        broker=broker)
+
+    subscribers = NodeGroup(
+        name="subscribers",
+        app=NodeApp(
+            path=BuiltinApps.SUBSCRIBER,
+            mqtt=True,
+            params={"servient_host": "clock.gprs", "thing_id": "urn:clock"}),
+        networks=[net_gprs],
+        broker=broker,
+        size=200)
+
+    readers = Node(
+        name="reader",
+        app=NodeApp(
+            path=BuiltinApps.READER,
+            params={"servient_host": "clock.cable", "thing_id": "urn:clock"}),
+        networks=[net_cable],
+        scale=2)
+
+    analysis = Topology(nodes=[clock, subscribers, readers]).analyze()
+    saturated = [item.network for item in analysis.saturated_links]
+
+    assert saturated == [net_gprs.name]
+    assert analysis.links[net_gprs.name].sources == 201
+    assert analysis.links[net_cable.name].load > 0
+    assert analysis.links[net_cable.name].utilization < 0.01
+    assert any(item.kind == ISSUE_LINK and broker.name in item.message for item in analysis.issues)
+    assert not analysis.ok
+
+
+def test_analyze_resources_and_targets():
+    network = Network(name="wifi", conditions=NetworkConditions.WIFI)
+
+    server = Node(
+        name="server",
+        app=NodeApp(path=BuiltinApps.WORKER, http=True),
+        networks=[network],
+        resources=NodeResources(cpu_limit=0.1, mem_limit="64M"))
+
+    callers = Node(
+        name="caller",
+        app=NodeApp(
+            path=BuiltinApps.CALLER,
+            params={"servient_host": "server.wifi", "thing_id": "urn:worker", "lambd": 10}),
+        networks=[network],
+        scale=10)
+
+    readers = NodeGroup(
+        name="readers",
+        app=NodeApp(
+            path=BuiltinApps.READER,
+            params={"servient_host": "missing_{slot}.wifi", "thing_id": "urn:thing"}),
+        networks=[network],
+        size=2)
+
+    analysis = Topology(nodes=[server, callers, readers]).analyze()
+    kinds = [(item.kind, item.name) for item in analysis.issues]
+
+    assert kinds.count((ISSUE_RESOURCES, server.name)) == 2
+    assert kinds.count((ISSUE_TARGET, readers.name)) == 2
+    assert not analysis.saturated_links
+    assert analysis.to_dict()["issues"]
+
+
+def test_analyze_declared_load_and_scale():
+    networks = [
+        Network(name="net_{}".format(idx), conditions=NetworkConditions.REGULAR_3G)
+        for idx in range(100)
+    ]
+
+    custom_app = NodeApp(
+        path="/root/app.py",
+        http=True,
+        load={"rate": 100, "size": 4096})
+
+    nodes = [
+        Node(name="node_{}".format(idx), app=custom_app, networks=[networks[idx % 100]])
+        for idx in range(5000)
+    ]
+
+    top = Topology(nodes=nodes)
+
+    ini = time.perf_counter()
+    analysis = top.analyze()
+    elapsed = time.perf_counter() - ini
+
+    assert len(analysis.saturated_links) == 100
+    assert analysis.links["net_0"].sources == 50
+    assert elapsed < 1.0
+
+
+def test_analyze_invalid_values():
+    network = Network(name="net", netem=['{"rate": "1mibit"}'])
+
+    clock = Node(
+        name="clock",
+        app=NodeApp(path=BuiltinApps.CLOCK, http=True, params={"interval": "often"}),
+        networks=[network],
+        resources=NodeResources(mem_limit="lots"))
+
+    topology = Topology(nodes=[clock])
+    analysis = topology.analyze()
+    names = sorted(issue.name for issue in analysis.issues if issue.kind == ISSUE_CONFIG)
+
+    assert names == ["clock", "clock", "net"]
+    assert analysis.links["net"].capacity is None
+    assert topology.to_compose_dict()
@@ -0,0 +1,68 @@
+import os
+import tempfile
+import time
+import uuid
+
+import numpy
+import pytest
+from wotemu.calibration import CalibrationStore, CpuCalibration
+from wotemu.storage.manager import close_redis_managers, get_redis_manager
+from wotemu.topology.cpu import CpuSpeedModel
+
+
+def _build_calibration(**kwargs):
+    model = CpuSpeedModel.from_poly(numpy.poly1d([1000.0, 5.0]))
+    return CpuCalibration(node_id=uuid.uuid4().hex, model=model, **kwargs)
+
+
+def test_calibration_store_local():
+    path = os.path.join(tempfile.mkdtemp(), "calibrations.json")
+    store = CalibrationStore(path=path, max_age=3600)
+    calibration = _build_calibration()
+
+    assert store.get_local(calibration.node_id) is None
+
+    store.put_local(calibration)
+    stored = store.get_local(calibration.node_id)
+
+    assert stored.to_dict() == calibration.to_dict()
+    assert stored.speed_model(0.5) == pytest.approx(505.0)
+
+    store_reopened = CalibrationStore(path=path, max_age=3600)
+    assert store_reopened.get_local(calibration.node_id)
+
+
+def test_calibration_store_stale():
+    path = os.path.join(tempfile.mkdtemp(), "calibrations.json")
+    store = CalibrationStore(path=path, max_age=3600)
+
+    calibration_old = _build_calibration(created_at=time.time() - 7200)
+    store.put_local(calibration_old)
+    assert store.get_local(calibration_old.node_id) is None
+
+    calibration_cores = _build_calibration(cpu_count=os.cpu_count() + 1)
+    store.put_local(calibration_cores)
+    assert store.get_local(calibration_cores.node_id) is None
+
+    assert calibration_old.is_stale(max_age=3600)
+    assert not calibration_old.is_stale(max_age=None)
+
+
+@pytest.mark.asyncio
+async def test_calibration_store_redis(redis):
+    redis_url = "redis://{}:{}".format(*redis.address)
+    pool = await get_redis_manager(redis_url).get()
+
+    path_one = os.path.join(tempfile.mkdtemp(), "calibrations.json")
+    path_two = os.path.join(tempfile.mkdtemp(), "calibrations.json")
+    store_one = CalibrationStore(path=path_one)
+    store_two = CalibrationStore(path=path_two)
+    calibration = _build_calibration()
+
+    await store_one.put(calibration, redis=pool)
+
+    assert store_two.get_local(calibration.node_id) is None
+    assert await store_two.get(calibration.node_id, redis=pool)
+    assert store_two.get_local(calibration.node_id)
+
+    await close_redis_managers()
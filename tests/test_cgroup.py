@@ -0,0 +1,135 @@
+import os
+
+import pytest
+from wotemu.monitor.cgroup import (CGROUP_V1, CGROUP_V2, CgroupReader,
+                                   CgroupReadError, detect_cgroup_version)
+
+
+def _write(root, name, content):
+    path = os.path.join(root, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    with open(path, "w") as fh:
+        fh.write(content)
+
+    return path
+
+
+@pytest.fixture
+def cgroup_v1(tmp_path):
+    root = str(tmp_path)
+    _write(root, "cpu,cpuacct/cpuacct.usage", "1500000000\n")
+    _write(root, "cpu,cpuacct/cpu.cfs_quota_us", "50000\n")
+    _write(root, "cpu,cpuacct/cpu.cfs_period_us", "100000\n")
+    _write(root, "memory/memory.usage_in_bytes", "1048576\n")
+    _write(root, "memory/memory.limit_in_bytes", "9223372036854771712\n")
+    return root
+
+
+@pytest.fixture
+def cgroup_v2(tmp_path):
+    root = str(tmp_path)
+    _write(root, "cgroup.controllers", "cpu memory\n")
+    _write(root, "cpu.stat", "usage_usec 1500000\nuser_usec 1000000\n")
+    _write(root, "cpu.max", "max 100000\n")
+    _write(root, "memory.current", "2097152\n")
+    _write(root, "memory.max", "max\n")
+    return root
+
+
+def test_cgroup_v1(cgroup_v1):
+    assert detect_cgroup_version(cgroup_v1) == CGROUP_V1
+
+    reader = CgroupReader(root=cgroup_v1)
+
+    assert reader.cpu_usage_nanos() == 1500000000
+    assert reader.cpu_quota_period() == (50000, 100000)
+    assert reader.memory_usage_bytes() == 1048576
+    assert reader.memory_limit_bytes() == 9223372036854771712
+
+    _write(cgroup_v1, "memory/memory.usage_in_bytes", "2048\n")
+    assert reader.memory_usage_bytes() == 2048
+
+    reader.close()
+
+
+def test_cgroup_v2(cgroup_v2):
+    assert detect_cgroup_version(cgroup_v2) == CGROUP_V2
+
+    reader = CgroupReader(root=cgroup_v2)
+
+    assert reader.cpu_usage_nanos() == 1500000000
+    assert reader.cpu_quota_period() == (-1, 100000)
+    assert reader.memory_usage_bytes() == 2097152
+    assert reader.memory_limit_bytes() is None
+
+    reader.close()
+
+
+def test_cgroup_missing(tmp_path):
+    reader = CgroupReader(root=str(tmp_path), version=CGROUP_V2)
+
+    with pytest.raises(CgroupReadError):
+        reader.memory_usage_bytes()
+
+
+def test_cgroup_throttling(cgroup_v1, tmp_path_factory):
+    _write(
+        cgroup_v1, "cpu,cpuacct/cpu.stat",
+        "nr_periods 120\nnr_throttled 30\nthrottled_time 4500000\n")
+
+    reader_v1 = CgroupReader(root=cgroup_v1)
+
+    assert reader_v1.cpu_throttling() == {
+        "nr_periods": 120,
+        "nr_throttled": 30,
+        "throttled_nanos": 4500000
+    }
+
+    reader_v1.close()
+
+    root_v2 = str(tmp_path_factory.mktemp("v2"))
+    _write(root_v2, "cgroup.controllers", "cpu memory\n")
+
+    _write(root_v2, "cpu.stat", (
+        "usage_usec 1500000\nuser_usec 1000000\nsystem_usec 500000\n"
+        "nr_periods 10\nnr_throttled 4\nthrottled_usec 2500\n"))
+
+    reader_v2 = CgroupReader(root=root_v2)
+
+    assert reader_v2.cpu_throttling() == {
+        "nr_periods": 10,
+        "nr_throttled": 4,
+        "throttled_nanos": 2500000
+    }
+
+    reader_v2.close()
+
+
+def test_cgroup_pressure(cgroup_v2):
+    _write(cgroup_v2, "memory.pressure", (
+        "some avg10=1.50 avg60=0.75 avg300=0.10 total=12345\n"
+        "full avg10=0.25 avg60=0.00 avg300=0.00 total=678\n"))
+
+    reader = CgroupReader(root=cgroup_v2)
+    psi = reader.pressure("memory")
+
+    assert psi["some"] == {"avg10": 1.5, "avg60": 0.75, "avg300": 0.1, "total": 12345.0}
+    assert psi["full"]["avg10"] == pytest.approx(0.25)
+
+    reader.close()
+
+
+def test_cgroup_memory_stat(cgroup_v2):
+    _write(cgroup_v2, "memory.stat", (
+        "anon 1048576\nfile 2097152\npgfault 9876\npgmajfault 12\n"
+        "invalid line here\n"))
+
+    reader = CgroupReader(root=cgroup_v2)
+    stat = reader.memory_stat()
+
+    assert stat["pgfault"] == 9876
+    assert stat["pgmajfault"] == 12
+    assert "invalid" not in stat
+
+    reader.close()
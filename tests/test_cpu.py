@@ -0,0 +1,114 @@
+import random
+
+import numpy
+import pytest
+from wotemu.topology.cpu import (MODEL_PIECEWISE, MODEL_POLY, CpuCalibrator,
+                                 CpuSpeedModel, get_cpu_core_scale,
+                                 select_cpu_speed_model)
+
+
+def _linear_samples(slope=1000.0, noise=0.0, num=6):
+    return [(0.0, 0.0)] + [
+        (cpus, slope * cpus + random.uniform(-noise, noise))
+        for cpus in numpy.linspace(0.1, 1.0, num=num)
+    ]
+
+
+def test_cpu_speed_model_poly():
+    model = CpuSpeedModel.fit_poly(_linear_samples(), degree=1)
+
+    assert model.kind == MODEL_POLY
+    assert model(0.5) == pytest.approx(500.0)
+    assert model.solve(250.0) == pytest.approx(0.25)
+    assert model.metrics["r2"] == pytest.approx(1.0)
+
+    model_copy = CpuSpeedModel.from_dict(model.to_dict())
+
+    assert model_copy(0.75) == pytest.approx(model(0.75))
+
+
+def test_cpu_speed_model_piecewise():
+    samples = [(0.0, 0.0), (0.5, 800.0), (1.0, 1000.0)]
+    model = CpuSpeedModel.fit_piecewise(samples)
+
+    assert model.kind == MODEL_PIECEWISE
+    assert model(0.25) == pytest.approx(400.0)
+    assert model.solve(900.0) == pytest.approx(0.75)
+    assert model.solve(1200.0) == pytest.approx(1.5)
+
+    with pytest.raises(ValueError):
+        CpuSpeedModel(kind="unknown", params={})
+
+
+def test_select_cpu_speed_model():
+    samples_linear = _linear_samples(noise=5.0) * 2
+    assert select_cpu_speed_model(samples_linear).kind == MODEL_POLY
+
+    samples_saturated = [
+        (cpus, min(cpus, 0.5) * 2000.0 + random.uniform(-5.0, 5.0))
+        for cpus in numpy.linspace(0.0, 1.0, num=11)
+    ] * 2
+
+    model = select_cpu_speed_model(samples_saturated)
+
+    assert model.metrics["adj_r2"] > 0.95
+    assert model.solve(500.0) == pytest.approx(0.25, abs=0.05)
+
+
+def test_cpu_calibrator_early_stop():
+    calls = []
+
+    def benchmark(cpus, cpuset, duration):
+        calls.append((cpus, cpuset))
+        return 1000.0 * cpus + random.uniform(-1.0, 1.0)
+
+    calibrator = CpuCalibrator(
+        num=6,
+        tolerance=0.05,
+        max_rounds=5,
+        cores=[1, 2, 3],
+        benchmark=benchmark)
+
+    model = calibrator.run()
+
+    assert calibrator.rounds == 1
+    assert len(calls) == 6
+    assert {cpuset for _, cpuset in calls}.issubset({1, 2, 3})
+    assert get_cpu_core_scale(500.0, model=model) == pytest.approx(0.5, abs=0.01)
+
+
+def test_cpu_calibrator_max_rounds():
+    def benchmark(cpus, cpuset, duration):
+        return 1000.0 * cpus + random.uniform(-300.0, 300.0)
+
+    calibrator = CpuCalibrator(
+        num=4,
+        tolerance=1e-6,
+        max_rounds=3,
+        cores=[0],
+        benchmark=benchmark)
+
+    calibrator.run()
+
+    assert calibrator.rounds == 3
+    assert len(calibrator.samples) == 1 + 3 * 4
+
+
+def test_cpu_core_scale_poly():
+    poly = numpy.poly1d([1000.0, 0.0])
+    assert get_cpu_core_scale(300.0, core_poly=poly) == pytest.approx(0.3)
+
+    with pytest.warns(Warning):
+        get_cpu_core_scale(2000.0, core_poly=poly)
+
+
+def test_cpu_core_scale_concave_poly():
+    poly = numpy.poly1d([-600.0, 1200.0, 0.0])
+    model = CpuSpeedModel.from_poly(poly)
+
+    assert get_cpu_core_scale(300.0, model=model) == pytest.approx(1.0 - numpy.sqrt(0.5))
+
+    with pytest.warns(Warning):
+        cpus = get_cpu_core_scale(700.0, model=model)
+
+    assert cpus == pytest.approx(700.0 / 600.0)
@@ -0,0 +1,158 @@
+import asyncio
+import time
+
+import numpy
+import pytest
+import wotemu.monitor.cpuspeed
+from wotemu.monitor.cpuspeed import CpuSpeedController
+from wotemu.topology.cpu import CpuSpeedModel
+
+_SLOPE = 1000.0
+
+
+class _FakeCgroup:
+    def __init__(self, fraction, quota=0.2):
+        self.fraction = fraction
+        self.quota = quota
+
+    def cpu_quota_period(self):
+        return int(self.quota * 100000), 100000
+
+    def cpu_usage_nanos(self):
+        return int(self.fraction * time.perf_counter() * 1e9)
+
+    def cpu_throttling(self):
+        return {"nr_periods": 10, "nr_throttled": 2, "throttled_time": 0}
+
+
+def _run_probe(duration):
+    time.sleep(duration)
+    return 1000, 1.0
+
+
+def _build_controller(cgroup, **kwargs):
+    model = CpuSpeedModel.from_poly(numpy.poly1d([_SLOPE, 0.0]))
+
+    return CpuSpeedController(
+        target_speed=200.0,
+        model=model,
+        cgroup=cgroup,
+        container_id="container",
+        probe=0.05,
+        **kwargs)
+
+
+def test_cpu_speed_controller_next_fraction():
+    controller = _build_controller(_FakeCgroup(0.2), max_fraction=0.5)
+
+    assert controller.target_fraction == pytest.approx(0.2)
+    assert controller._next_fraction(0.2, 205.0) == pytest.approx(0.2)
+    assert controller._next_fraction(0.2, 100.0) == pytest.approx(0.3)
+    assert controller._next_fraction(0.2, 400.0) == pytest.approx(0.15)
+    assert controller._next_fraction(0.4, 20.0) == pytest.approx(0.5)
+    assert controller._next_fraction(0.2, 0.0) == pytest.approx(0.2)
+
+
+@pytest.mark.asyncio
+async def test_cpu_speed_controller_step(monkeypatch):
+    cgroup = _FakeCgroup(fraction=0.1, quota=0.2)
+    controller = _build_controller(cgroup)
+    updates = []
+
+    monkeypatch.setattr(wotemu.monitor.cpuspeed, "_run_probe", _run_probe)
+    monkeypatch.setattr(controller, "_update_quota", updates.append)
+
+    record = await controller.step()
+
+    assert record["corrected"]
+    assert record["quota_before"] == pytest.approx(0.2)
+    assert record["quota_after"] > record["quota_before"]
+    assert record["speed"] < controller.target_speed
+    assert len(updates) == 1
+    assert updates[0] == pytest.approx(record["quota_after"], abs=1e-3)
+    assert controller.stats["corrections"] == 1
+
+    cgroup.fraction = 0.2
+    record = await controller.step()
+
+    assert not record["corrected"]
+    assert len(updates) == 1
+    assert controller.stats["probes"] == 2
+
+
+@pytest.mark.asyncio
+async def test_cpu_speed_controller_run(monkeypatch):
+    controller = _build_controller(_FakeCgroup(fraction=0.2))
+    records = []
+
+    async def async_cb(items):
+        records.extend(items)
+
+    monkeypatch.setattr(wotemu.monitor.cpuspeed, "_run_probe", _run_probe)
+    monkeypatch.setattr(controller, "_update_quota", lambda fraction: None)
+
+    task = asyncio.ensure_future(controller.run(async_cb, interval=0.01))
+    await asyncio.sleep(0.3)
+    task.cancel()
+    await task
+
+    assert len(records) > 0
+    assert controller.stats["errors"] == 0
+
+
+def test_cpu_speed_controller_baseline(monkeypatch):
+    monkeypatch.setattr(wotemu.monitor.cpuspeed, "_run_probe", _run_probe)
+
+    controller = _build_controller(_FakeCgroup(fraction=0.2), baseline=2000.0)
+    measure = controller._measure()
+
+    # Contention present on the first probe is measured against the calibration
+
+    assert measure["efficiency"] == pytest.approx(0.5)
+    assert measure["speed"] == pytest.approx(100.0, rel=0.1)
+
+    controller = _build_controller(_FakeCgroup(fraction=0.2))
+    controller.calibrate_baseline()
+
+    assert controller._measure()["efficiency"] == pytest.approx(1.0)
+
+
+@pytest.mark.asyncio
+async def test_cpu_speed_controller_docker_client(monkeypatch):
+    clients = []
+
+    class _FakeDockerClient:
+        def __init__(self, base_url=None):
+            self.closed = False
+            self.containers = self
+            clients.append(self)
+
+        def get(self, container_id):
+            return self
+
+        def update(self, **kwargs):
+            return kwargs
+
+        def close(self):
+            self.closed = True
+
+    monkeypatch.setattr(wotemu.monitor.cpuspeed, "_run_probe", _run_probe)
+    monkeypatch.setattr(wotemu.monitor.cpuspeed.docker, "DockerClient", _FakeDockerClient)
+
+    controller = _build_controller(
+        _FakeCgroup(fraction=0.1),
+        docker_url="unix://docker.sock")
+
+    async def async_cb(items):
+        pass
+
+    for _ in range(3):
+        controller._update_quota(0.3)
+
+    task = asyncio.ensure_future(controller.run(async_cb, interval=0.01))
+    await asyncio.sleep(0.2)
+    task.cancel()
+    await task
+
+    assert len(clients) == 1
+    assert clients[0].closed
@@ -0,0 +1,66 @@
+import time
+
+from wotemu.dockerapi import CachedDockerAPI
+
+
+class _FakeClient:
+    def __init__(self):
+        self.calls = 0
+
+    def tasks(self):
+        self.calls += 1
+
+        return [
+            {"ID": "t1", "ServiceID": "s1", "DesiredState": "running"},
+            {"ID": "t2", "ServiceID": "s1", "DesiredState": "shutdown"},
+            {"ID": "t3", "ServiceID": "s2", "DesiredState": "running"}
+        ]
+
+    def services(self):
+        return [
+            {"ID": "s1", "Spec": {"Name": "stack_app"}},
+            {"ID": "s2", "Spec": {"Name": "stack_other"}}
+        ]
+
+
+def _build_api(ttl):
+    api = CachedDockerAPI("tcp://localhost:2375", ttl=ttl)
+    api._client = _FakeClient()
+    return api
+
+
+def test_docker_api_cache_ttl():
+    api = _build_api(ttl=0.2)
+
+    api.tasks()
+    api.tasks()
+    assert api.client.calls == 1
+    assert api.stats["hits"] == 1
+
+    time.sleep(0.3)
+    api.tasks()
+    assert api.client.calls == 2
+
+
+def test_docker_api_find_tasks():
+    api = _build_api(ttl=60)
+
+    tasks = api.find_tasks(service="stack_app", desired_state="running")
+    assert [item["ID"] for item in tasks] == ["t1"]
+    assert api.inspect_task("stack_other.1.t3")["ID"] == "t3"
+    assert api.client.calls == 1
+
+
+def test_docker_api_fresh():
+    api = _build_api(ttl=60)
+
+    api.tasks()
+    tasks = api.find_tasks(service="stack_app", fresh=True)
+
+    assert len(tasks) == 2
+    assert api.client.calls == 2
+
+    # Fresh results refresh the cache
+
+    api.tasks()
+    assert api.client.calls == 2
@@ -0,0 +1,33 @@
+import pytest
+import tornado.httpclient
+import tornado.simple_httpclient
+from wotemu.httpclient import (configure_http_client, get_http_client,
+                               is_keep_alive_supported)
+
+
+@pytest.fixture
+def reset_http_client():
+    yield
+    tornado.httpclient.AsyncHTTPClient.configure(None)
+
+
+@pytest.mark.asyncio
+async def test_http_client_shared(reset_http_client):
+    configure_http_client(max_clients=20, keep_alive=False)
+
+    configured = tornado.httpclient.AsyncHTTPClient.configured_class()
+    assert configured is tornado.simple_httpclient.SimpleAsyncHTTPClient
+    assert get_http_client() is get_http_client()
+    assert get_http_client().max_clients == 20
+
+
+@pytest.mark.asyncio
+async def test_http_client_keep_alive(reset_http_client):
+    if not is_keep_alive_supported():
+        pytest.skip("pycurl is not installed")
+
+    configure_http_client(max_clients=20, max_host_connections=2, keep_alive=True)
+
+    configured = tornado.httpclient.AsyncHTTPClient.configured_class()
+    assert configured.__name__ == "PooledCurlAsyncHTTPClient"
+    assert get_http_client() is get_http_client()
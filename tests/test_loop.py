@@ -0,0 +1,34 @@
+import asyncio
+import time
+
+import pytest
+from wotemu.monitor.loop import monitor_loop
+
+
+@pytest.mark.asyncio
+async def test_monitor_loop_slow_callbacks():
+    items = []
+
+    async def async_cb(data):
+        items.extend(data)
+
+    loop = asyncio.get_running_loop()
+    debug = loop.get_debug()
+
+    task = asyncio.ensure_future(monitor_loop(
+        async_cb,
+        sleep=0.05,
+        group_size=1,
+        slow_callback_duration=0.05))
+
+    await asyncio.sleep(0.1)
+    loop.call_soon(time.sleep, 0.15)
+    await asyncio.sleep(0.3)
+    task.cancel()
+    await task
+
+    assert loop.get_debug() == debug
+    assert len(items) > 0
+    assert all(item["tasks"] >= 1 for item in items)
+    assert max(item["loop_lag"] for item in items) >= 0.05
+    assert sum(item["slow_callbacks"] for item in items) >= 1
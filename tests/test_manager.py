@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+from wotemu.storage.manager import (RedisManager, RedisUnavailable,
+                                    close_redis_managers, get_redis_manager)
+
+_UNREACHABLE_URL = "redis://127.0.0.1:1"
+
+
+def _redis_url(redis):
+    return "redis://{}:{}".format(*redis.address)
+
+
+@pytest.mark.asyncio
+async def test_manager_shared_pool(redis):
+    redis_url = _redis_url(redis)
+    manager = get_redis_manager(redis_url)
+
+    assert manager is get_redis_manager(redis_url)
+
+    pools = await asyncio.gather(*[manager.get() for _ in range(10)])
+
+    assert all(pool is pools[0] for pool in pools)
+    assert await pools[0].ping()
+    assert manager.stats["connects"] == 1
+
+    await manager.report_error(Exception("Test"))
+    assert not manager.is_connected
+
+    with pytest.raises(RedisUnavailable):
+        await manager.get()
+
+    await asyncio.sleep(manager.stats["backoff"] + 0.1)
+
+    assert await (await manager.get()).ping()
+    assert manager.stats["connects"] == 2
+
+    await close_redis_managers()
+
+
+@pytest.mark.asyncio
+async def test_manager_backoff():
+    manager = RedisManager(_UNREACHABLE_URL, health_interval=0)
+
+    with pytest.raises(Exception):
+        await manager.get()
+
+    first_backoff = manager.stats["backoff"]
+    assert first_backoff > 0
+
+    with pytest.raises(RedisUnavailable):
+        await manager.get()
+
+    assert manager.stats["failures"] == 1
+
+    await asyncio.sleep(first_backoff + 0.1)
+
+    with pytest.raises(Exception):
+        await manager.get()
+
+    assert manager.stats["failures"] == 2
+    assert manager.stats["backoff"] == first_backoff * 2
+
+    await manager.close()
@@ -0,0 +1,87 @@
+import asyncio
+import uuid
+
+import pytest
+import wotemu.config
+import wotemu.utils
+from wotemu.readiness import ReadinessNotifier, is_ready, wait_ready
+from wotemu.storage.manager import close_redis_managers
+
+
+def _redis_url(redis):
+    return "redis://{}:{}".format(*redis.address)
+
+
+@pytest.mark.asyncio
+async def test_readiness_wait(redis):
+    redis_url = _redis_url(redis)
+    hosts = [uuid.uuid4().hex[:12] for _ in range(3)]
+    thing_id = uuid.uuid4().hex
+
+    notifiers = [ReadinessNotifier(redis_url, host=host) for host in hosts]
+
+    waiter = asyncio.ensure_future(wait_ready(
+        redis_url=redis_url,
+        hosts=hosts,
+        thing_ids=[thing_id],
+        timeout=5))
+
+    await asyncio.sleep(0.2)
+
+    for notifier in notifiers:
+        await notifier.notify_thing(thing_id)
+
+    await asyncio.sleep(0.2)
+    assert not waiter.done()
+
+    for notifier in notifiers:
+        await notifier.notify_servient()
+
+    await asyncio.wait_for(waiter, 5)
+
+    for host in hosts:
+        assert await is_ready(redis, host, thing_ids=[thing_id])
+
+    for notifier in notifiers:
+        await notifier.clear()
+
+    assert not (await is_ready(redis, hosts[0]))
+
+    await close_redis_managers()
+
+
+@pytest.mark.asyncio
+async def test_readiness_timeout(redis):
+    redis_url = _redis_url(redis)
+    notifier = ReadinessNotifier(redis_url, host=uuid.uuid4().hex[:12])
+    await notifier.notify_servient()
+
+    await wait_ready(redis_url=redis_url, hosts=[notifier.host], timeout=2)
+
+    with pytest.raises(asyncio.TimeoutError):
+        await wait_ready(
+            redis_url=redis_url,
+            hosts=[notifier.host],
+            thing_ids=[uuid.uuid4().hex],
+            timeout=0.5)
+
+    await close_redis_managers()
+
+
+@pytest.mark.asyncio
+async def test_wait_node_untranslated_name(monkeypatch):
+    conf = wotemu.config.get_env_config()._replace(redis_url="redis://redis")
+    pinged = []
+
+    async def wait_ready(*args, **kwargs):
+        raise AssertionError("Readiness records are indexed by container hostname")
+
+    async def ping_catalogue_timeout(catalogue_url, **kwargs):
+        pinged.append(catalogue_url)
+
+    monkeypatch.setattr(wotemu.utils, "_wait_ready", wait_ready)
+    monkeypatch.setattr(wotemu.utils, "_ping_catalogue_timeout", ping_catalogue_timeout)
+
+    await wotemu.utils.wait_node(conf, "service_vip", find_replicas=False)
+
+    assert pinged == ["http://service_vip:{}".format(conf.port_catalogue)]
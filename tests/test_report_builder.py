@@ -1,9 +1,11 @@
 import tempfile
+import time
 import xml.etree.ElementTree as ET
 
 import html5lib
 import pytest
 from wotemu.report.builder import ReportBuilder
+from wotemu.report.reader import _build_telemetry_df
 
 
 @pytest.mark.asyncio
@@ -14,6 +16,32 @@ async def test_build_task_mem_figure(redis_reader, redis_test_data):
     assert fig
 
 
+class _CpuControlReader:
+    async def get_cpu_control_df(self, task):
+        now = time.time()
+
+        return _build_telemetry_df([
+            {
+                "time": now + idx,
+                "target_speed": 200.0,
+                "speed": 150.0 + 20 * idx,
+                "quota_before": 0.2,
+                "quota_after": 0.25 if idx == 0 else 0.2,
+                "corrected": idx == 0
+            }
+            for idx in range(3)
+        ])
+
+
+@pytest.mark.asyncio
+async def test_build_task_cpu_control_figure():
+    builder = ReportBuilder(reader=_CpuControlReader())
+    fig = await builder.build_task_cpu_control_figure(task="task")
+
+    assert fig
+    assert len(fig.data) == 4
+
+
 @pytest.mark.asyncio
 async def test_build_report(redis_reader):
     builder = ReportBuilder(reader=redis_reader)
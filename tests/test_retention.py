@@ -0,0 +1,128 @@
+import json
+import time
+import uuid
+
+import pytest
+from wotemu.enums import RedisPrefixes
+from wotemu.storage.retention import (ROLLUP_AGE_FACTOR, RetentionEnforcer,
+                                      get_key_family, get_memory_key,
+                                      get_rollup_key, parse_policies,
+                                      rollup_items)
+
+
+def _packet_key():
+    return "{}:{}:{}".format(
+        RedisPrefixes.NAMESPACE.value,
+        RedisPrefixes.PACKET.value,
+        uuid.uuid4().hex)
+
+
+def test_parse_policies():
+    policies = parse_policies(json.dumps({
+        RedisPrefixes.PACKET.value: {"max_age": 60, "rollup": 5}
+    }))
+
+    assert policies[RedisPrefixes.PACKET.value].max_age == 60
+    assert policies[RedisPrefixes.PACKET.value].rollup == 5
+    assert parse_policies(None) == {}
+
+    with pytest.raises(ValueError):
+        parse_policies({"unknown": {"max_len": 10}})
+
+    with pytest.raises(ValueError):
+        parse_policies({RedisPrefixes.PACKET.value: {"max_len": 10, "rollup": 0}})
+
+    policy = policies[RedisPrefixes.PACKET.value]
+
+    assert policy.rollup_max_age == 60 * ROLLUP_AGE_FACTOR
+    assert policy.rollup_max_len is None
+
+
+def test_key_family():
+    key = _packet_key()
+
+    assert get_key_family(key) == RedisPrefixes.PACKET.value
+    assert get_key_family("other:packet:host") is None
+    assert get_key_family(get_rollup_key(key)) == RedisPrefixes.ROLLUP.value
+
+
+def test_rollup_items():
+    items = [
+        ({"time": 10.0, "len": 100, "proto": "tcp"}, 10.0),
+        ({"time": 12.0, "len": 200, "proto": "udp"}, 12.0),
+        ({"time": 21.0, "len": 50, "flag": True}, 21.0)
+    ]
+
+    rows = rollup_items(items, bucket=10)
+
+    assert [row["time"] for row in rows] == [10, 20]
+    assert rows[0]["len"] == 150
+    assert rows[0]["count"] == 2
+    assert "proto" not in rows[0]
+    assert "flag" not in rows[1]
+
+
+@pytest.mark.asyncio
+async def test_retention_enforce(redis):
+    key = _packet_key()
+    now = time.time()
+    num_old = 20
+    num_new = 10
+
+    for idx in range(num_old):
+        tstamp = now - 1000 + idx
+        await redis.zadd(key, tstamp, json.dumps({"time": tstamp, "len": idx}))
+
+    for idx in range(num_new):
+        tstamp = now - idx
+        await redis.zadd(key, tstamp, json.dumps({"time": tstamp, "len": idx}))
+
+    enforcer = RetentionEnforcer({
+        RedisPrefixes.PACKET.value: {"max_age": 100, "rollup": 60}
+    }, interval=0)
+
+    enforcer.track([key, "wotemu:unknown:key"])
+    await enforcer.run(redis)
+
+    assert await redis.zcard(key) == num_new
+
+    rollups = await redis.zrange(get_rollup_key(key))
+    rollups = [json.loads(item) for item in rollups]
+
+    assert sum(item["count"] for item in rollups) == num_old
+    assert enforcer.stats["trimmed"] == num_old
+    assert await redis.zcard(get_memory_key()) >= 1
+
+
+@pytest.mark.asyncio
+async def test_retention_rollup_max_len(redis):
+    key = _packet_key()
+    rollup_key = get_rollup_key(key)
+    ini = 1000.0
+
+    enforcer = RetentionEnforcer({
+        RedisPrefixes.PACKET.value: {"max_len": 30, "rollup": 10, "rollup_max_len": 8}
+    }, interval=0)
+
+    async def add_items(start, stop):
+        for idx in range(start, stop):
+            tstamp = ini + idx
+            await redis.zadd(key, tstamp, json.dumps({"time": tstamp, "len": idx}))
+
+        enforcer.track([key])
+        await enforcer.run(redis)
+
+    await add_items(0, 95)
+
+    # The bucket of the newest record over the limit is kept
+
+    assert await redis.zcard(key) == 35
+
+    await add_items(95, 140)
+
+    rollups = [json.loads(item) for item in await redis.zrange(rollup_key)]
+
+    assert await redis.zcard(key) == 40
+    assert len(rollups) == 8
+    assert all(item["count"] == 10 for item in rollups)
+    assert len(set(item["time"] for item in rollups)) == len(rollups)
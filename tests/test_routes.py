@@ -0,0 +1,116 @@
+import json
+
+import pytest
+from wotemu.cli.chaos import build_netem_batch
+from wotemu.cli.routes import build_ip_batch, build_iptables_ruleset
+from wotemu.enums import NETEM_CONDITIONS, NetworkConditions
+
+_ROUTES = [
+    {"ifname": "eth1", "addr": "10.0.1.5", "cidr": "10.0.1.0/24", "gateway": "10.0.1.2"},
+    {"ifname": "eth2", "addr": "10.0.2.5", "cidr": "10.0.2.0/24", "gateway": "10.0.2.2"}
+]
+
+
+def test_build_ip_batch():
+    cmds = build_ip_batch(_ROUTES, rtindex=200, rtable_mark=1)
+
+    assert len(cmds) == 3
+    assert all(cmd.startswith("route replace") for cmd in cmds[:2])
+    assert "table 200" in cmds[0]
+    assert cmds[-1] == "rule add fwmark 0x1 table 200"
+
+    cmds_rule = build_ip_batch(_ROUTES, rtindex=200, rtable_mark=1, add_rule=False)
+
+    assert not any(cmd.startswith("rule") for cmd in cmds_rule)
+
+
+def test_build_iptables_ruleset():
+    ports_tcp = [80, 81, 80] + list(range(9000, 9020))
+
+    lines = build_iptables_ruleset(
+        _ROUTES,
+        ports_tcp=ports_tcp,
+        ports_udp=[5683],
+        chain="WOTEMU_OUTPUT",
+        rtable_mark=1)
+
+    rules = [line for line in lines if line.startswith("-A WOTEMU_OUTPUT")]
+
+    assert lines[0] == "*mangle"
+    assert lines[1] == ":WOTEMU_OUTPUT - [0:0]"
+    assert lines[-1] == "COMMIT"
+    assert "-A OUTPUT -j WOTEMU_OUTPUT" in lines
+
+    # 22 unique TCP ports in 2 multiport chunks plus 1 UDP
+    # chunk, for both directions on each of the 2 interfaces
+
+    assert len(rules) == (2 + 1) * 2 * 2
+    assert all("-j MARK --set-mark 1" in rule for rule in rules)
+    assert any("--dports 80,81,9000" in rule for rule in rules)
+
+    lines_jump = build_iptables_ruleset(
+        _ROUTES,
+        ports_tcp=[80],
+        ports_udp=[],
+        chain="WOTEMU_OUTPUT",
+        rtable_mark=1,
+        add_jump=False)
+
+    assert not any(line.startswith("-A OUTPUT") for line in lines_jump)
+
+
+def test_build_netem_batch():
+    cmds = build_netem_batch("eth0", {"latency": 100, "jitter": 10, "rate": "1mbit"})
+
+    assert len(cmds) == 2
+    assert cmds[0].startswith("qdisc add dev eth0 root handle 1: netem delay 100ms 10ms")
+    assert cmds[1].startswith("qdisc add dev eth0 parent 1: handle 2: tbf rate 1mbit")
+
+    cmds_rate = build_netem_batch("eth0", {"rate": "1mbit"})
+
+    assert len(cmds_rate) == 1
+    assert cmds_rate[0].startswith("qdisc add dev eth0 root handle 1: tbf")
+    assert build_netem_batch("eth0", {}) == []
+
+
+def test_build_netem_batch_impairments():
+    netem_args = {
+        "latency": 100,
+        "loss": {"model": "gemodel", "p": 2, "r": 20, "loss_bad": 90},
+        "duplicate": 0.5,
+        "reorder": {"percent": 25, "correlation": 50, "gap": 5},
+        "corrupt": 0.1
+    }
+
+    cmds = build_netem_batch("eth0", netem_args)
+
+    assert cmds == [(
+        "qdisc add dev eth0 root handle 1: netem delay 100ms "
+        "loss gemodel 2% 20% 90% duplicate 0.5% "
+        "reorder 25% 50% gap 5 corrupt 0.1%"
+    )]
+
+    cmds_random = build_netem_batch("eth0", {
+        "loss": {"model": "random", "percent": 1, "correlation": 25}
+    })
+
+    assert cmds_random == [
+        "qdisc add dev eth0 root handle 1: netem delay 0ms loss random 1% 25%"
+    ]
+
+    with pytest.raises(ValueError):
+        build_netem_batch("eth0", {"loss": {"model": "unknown"}})
+
+
+def test_netem_conditions():
+    for conditions, netem in NETEM_CONDITIONS.items():
+        netem_args = json.loads(netem[0])
+        cmds = build_netem_batch("eth0", netem_args)
+        is_lossy = conditions.value.endswith("_LOSSY")
+
+        assert len(cmds) == 2
+        assert (" loss " in cmds[0]) == is_lossy
+
+    assert NETEM_CONDITIONS[NetworkConditions.WIFI] == [
+        '{"latency": 25, "jitter": 5, "rate": "50mbit"}'
+    ]
@@ -0,0 +1,177 @@
+import asyncio
+import json
+import os
+import tempfile
+
+import pytest
+import wotemu.cli.chaos
+from wotemu.cli.chaos import (STATE_CLEARED, build_netem_batch, run_schedule,
+                              stop_chaos)
+from wotemu.topology.compose import ENV_KEY_NETWORK_NAME
+from wotemu.topology.models import Network, Node, NodeApp, Topology
+from wotemu.topology.schedule import (KEY_SCHEDULE, SCHEDULE_MAX_BYTES,
+                                      SCHEDULE_TARGET, get_netem_shape,
+                                      get_schedule_states, normalize_schedule,
+                                      read_schedule_csv)
+
+_TRACE = """time,latency,jitter,rate,loss
+0,40,10,15000,
+0.5,80,,5000,1.5
+1.5,,,,0
+"""
+
+
+@pytest.fixture
+def trace_path():
+    fd, path = tempfile.mkstemp(suffix=".csv")
+
+    with os.fdopen(fd, "w") as fh:
+        fh.write(_TRACE)
+
+    yield path
+
+    os.remove(path)
+
+
+def test_read_schedule_csv(trace_path):
+    schedule = read_schedule_csv(trace_path)
+
+    assert len(schedule) == 3
+    assert schedule[0] == {"time": 0.0, "latency": 40.0, "jitter": 10.0, "rate": "15000.0kbit", "loss": None}
+    assert schedule[2]["loss"] == 0.0
+
+
+def test_schedule_states(trace_path):
+    base = {"latency": 100, "jitter": 20, "rate": "1mbit"}
+    states = get_schedule_states(base, normalize_schedule(trace_path))
+
+    assert [offset for offset, _ in states] == [0.0, 0.5, 1.5]
+    assert states[0][1] == {"latency": 40.0, "jitter": 10.0, "rate": "15000.0kbit"}
+    assert states[1][1] == {"latency": 80.0, "jitter": 10.0, "rate": "5000.0kbit", "loss": 1.5}
+    assert states[2][1]["loss"] == 0.0
+    assert get_netem_shape([state for _, state in states]) == (True, True)
+
+    with pytest.raises(ValueError):
+        normalize_schedule([{"time": 1, "bandwidth": 10}])
+
+    with pytest.raises(ValueError):
+        normalize_schedule([{"latency": 10}])
+
+
+def test_build_netem_batch_change():
+    shape = (True, True)
+    cmds = build_netem_batch("eth0", {"latency": 50}, action="change", shape=shape)
+
+    assert cmds == [
+        "qdisc change dev eth0 root handle 1: netem delay 50ms",
+        "qdisc change dev eth0 parent 1: handle 2: tbf rate 10gbit burst 100kbit latency 20ms"
+    ]
+
+    cmds_loss = build_netem_batch("eth0", {"latency": 50, "jitter": 5, "loss": 2}, shape=(True, False))
+
+    assert cmds_loss == [
+        "qdisc add dev eth0 root handle 1: netem delay 50ms 5ms 0% distribution normal loss random 2%"
+    ]
+
+
+def test_network_schedule_compose(trace_path):
+    network = Network(name="lte", netem=[json.dumps({"latency": 40})], schedule=trace_path)
+    node = Node(name="node", app=NodeApp(path="/root/app.py", http=True), networks=[network])
+    services = Topology(nodes=[node]).to_compose_dict()["services"]
+    gateway = services[network.name_gateway]
+    netem = json.loads(gateway["command"][1])
+
+    assert netem["latency"] == 40
+    assert netem[KEY_SCHEDULE] == SCHEDULE_TARGET
+    assert gateway["environment"][ENV_KEY_NETWORK_NAME] == network.name
+    assert gateway["configs"] == [{"source": network.schedule_config, "target": SCHEDULE_TARGET}]
+
+
+def test_network_schedule_long_trace(tmp_path):
+    rows = ["time,latency,rate,loss"] + [
+        "{:.1f},{},{},{}".format(idx * 0.1, 20 + idx % 50, 1000 + idx % 4000, idx % 3)
+        for idx in range(5000)
+    ]
+
+    trace_path = tmp_path / "trace.csv"
+    trace_path.write_text("\n".join(rows))
+
+    network = Network(name="lte", schedule=str(trace_path))
+    node = Node(name="node", app=NodeApp(path="/root/app.py", http=True), networks=[network])
+    topology = Topology(nodes=[node])
+    compose = topology.to_compose_dict()
+    gateway = compose["services"][network.name_gateway]
+
+    assert all(len(arg) < 1024 for arg in gateway["command"])
+    assert compose["configs"][network.schedule_config]["file"] == "./" + network.schedule_file
+
+    topology.write_schedule_files(str(tmp_path))
+    schedule_path = tmp_path / network.schedule_file
+
+    assert os.path.getsize(str(schedule_path)) < SCHEDULE_MAX_BYTES
+
+    states = get_schedule_states({}, str(schedule_path))
+
+    assert len(states) == 5000
+    assert states[-1][1] == {"latency": 69.0, "rate": "1999.0kbit", "loss": 1.0}
+
+
+@pytest.mark.asyncio
+async def test_run_schedule():
+    schedule = [
+        {"time": 0.1, "latency": 80},
+        {"time": 0.2, "latency": 120, "rate": "1mbit"}
+    ]
+
+    states = get_schedule_states({"latency": 40}, schedule)
+    shape = get_netem_shape([state for _, state in states])
+    applied = []
+    recorded = []
+
+    async def record_cb(state):
+        recorded.append(state)
+
+    task = asyncio.ensure_future(run_schedule(
+        nic="eth0",
+        states=states,
+        shape=shape,
+        record_cb=record_cb,
+        apply_cb=applied.append))
+
+    await asyncio.sleep(0.4)
+    task.cancel()
+
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    assert [item["latency"] for item in recorded] == [40, 80, 120]
+    assert len(applied) == 2
+    assert all(cmd.startswith("qdisc change") for cmds in applied for cmd in cmds)
+    assert "tbf rate 1mbit" in applied[-1][-1]
+
+
+@pytest.mark.asyncio
+async def test_stop_chaos(monkeypatch):
+    calls = []
+
+    async def record_cb(state):
+        calls.append(("record", state))
+
+    async def stop_writers():
+        calls.append(("stop_writers", None))
+
+    async def close_redis_managers():
+        calls.append(("close_redis_managers", None))
+
+    monkeypatch.setattr(wotemu.cli.chaos, "_call", lambda cmd: calls.append(("call", cmd)))
+    monkeypatch.setattr(wotemu.cli.chaos, "stop_writers", stop_writers)
+    monkeypatch.setattr(wotemu.cli.chaos, "close_redis_managers", close_redis_managers)
+
+    await stop_chaos(nic="eth0", record_cb=record_cb)
+
+    assert calls == [
+        ("call", "tc qdisc del dev eth0 root"),
+        ("record", STATE_CLEARED),
+        ("stop_writers", None),
+        ("close_redis_managers", None)
+    ]
@@ -0,0 +1,143 @@
+import asyncio
+import os
+import tempfile
+import time
+import uuid
+
+import pytest
+from wotemu.storage.base import read_telemetry
+from wotemu.storage.manager import close_redis_managers, get_redis_manager
+from wotemu.storage.spool import TelemetrySpool
+from wotemu.storage.writer import TelemetryWriter
+
+_UNREACHABLE_URL = "redis://127.0.0.1:1"
+
+
+def _redis_url(redis):
+    return "redis://{}:{}".format(*redis.address)
+
+
+@pytest.fixture
+def spool_path():
+    with tempfile.TemporaryDirectory() as dir_path:
+        yield os.path.join(dir_path, "spool.jsonl")
+
+
+def test_spool_replay(spool_path):
+    spool = TelemetrySpool(path=spool_path, max_bytes=1024 * 1024)
+    batch = [("key", {"idx": idx}) for idx in range(10)]
+
+    assert spool.append(batch) == len(batch)
+    assert spool.has_pending
+
+    chunk, offset = spool.read(4)
+    assert chunk == batch[:4]
+    spool.commit(offset, len(chunk))
+
+    chunk, offset = spool.read(100)
+    assert chunk == batch[4:]
+    spool.commit(offset, len(chunk))
+
+    assert not spool.has_pending
+    assert os.path.getsize(spool_path) == 0
+    assert spool.stats["replayed"] == len(batch)
+
+
+def test_spool_bounded(spool_path):
+    max_bytes = 256
+    spool = TelemetrySpool(path=spool_path, max_bytes=max_bytes)
+    batch = [("key", {"idx": idx, "val": "x" * 20}) for idx in range(50)]
+
+    num_spooled = spool.append(batch)
+
+    assert 0 < num_spooled < len(batch)
+    assert os.path.getsize(spool_path) <= max_bytes
+    assert spool.stats["lost"] == len(batch) - num_spooled
+
+    reopened = TelemetrySpool(path=spool_path, max_bytes=max_bytes)
+    assert reopened.pending_bytes == os.path.getsize(spool_path)
+
+
+@pytest.mark.asyncio
+async def test_writer_spool(spool_path):
+    writer = TelemetryWriter(
+        redis_url=_UNREACHABLE_URL,
+        flush_interval=60,
+        spool_path=spool_path)
+
+    num_items = 20
+
+    for idx in range(num_items):
+        writer.put_nowait("key", {"time": time.time(), "idx": idx})
+
+    await writer.stop()
+    await close_redis_managers()
+
+    assert writer.stats["failed"] == num_items
+    assert writer.stats["spool"]["spooled"] == num_items
+    assert writer.stats["spool"]["lost"] == 0
+
+
+@pytest.mark.asyncio
+async def test_writer_spool_replay(redis, spool_path):
+    key = uuid.uuid4().hex
+    num_items = 20
+
+    spool = TelemetrySpool(path=spool_path, max_bytes=1024 * 1024)
+    spool.append([(key, {"time": time.time(), "idx": idx}) for idx in range(num_items)])
+
+    writer = TelemetryWriter(
+        redis_url=_redis_url(redis),
+        flush_size=5,
+        flush_interval=0.1,
+        spool_path=spool_path)
+
+    writer.put_nowait(key, {"time": time.time(), "idx": num_items})
+
+    await asyncio.sleep(0.5)
+    await writer.stop()
+    await close_redis_managers()
+
+    assert writer.stats["spool"]["replayed"] == num_items
+    assert len(await read_telemetry(redis, key)) == num_items + 1
+
+
+@pytest.mark.asyncio
+async def test_writer_timeout_skips_replay(monkeypatch, spool_path):
+    spool = TelemetrySpool(path=spool_path, max_bytes=1024 * 1024)
+    spool.append([("key", {"idx": idx}) for idx in range(10)])
+
+    writer = TelemetryWriter(
+        redis_url=_UNREACHABLE_URL,
+        flush_interval=60,
+        write_timeout=0.05,
+        spool_path=spool_path)
+
+    errors = []
+    writes = []
+
+    async def _open():
+        writer._redis = object()
+
+    async def _write_batch(batch):
+        writes.append(batch)
+        await asyncio.sleep(1)
+
+    async def report_error(ex=None):
+        errors.append(ex)
+
+    monkeypatch.setattr(writer, "_open", _open)
+    monkeypatch.setattr(writer, "_write_batch", _write_batch)
+    monkeypatch.setattr(get_redis_manager(_UNREACHABLE_URL), "report_error", report_error)
+
+    writer.put_nowait("key", {"idx": 10})
+    await writer.flush()
+
+    assert len(writes) == 1
+    assert len(errors) == 1
+    assert writer.stats["slow"] == 1
+    assert writer.stats["spool"]["replayed"] == 0
+    assert writer.stats["spool"]["spooled"] == 1
+
+    await writer.stop()
+    await close_redis_managers()
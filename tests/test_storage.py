@@ -0,0 +1,42 @@
+import time
+import uuid
+
+import pytest
+from wotemu.enums import StorageBackends
+from wotemu.storage.base import StreamStorage, get_storage, read_telemetry
+
+
+def _build_items(num=10):
+    now = time.time()
+    return [{"time": now, "value": idx} for idx in range(num)]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("backend", list(StorageBackends))
+async def test_storage_write_read(redis, backend):
+    storage = get_storage(redis, backend=backend)
+    key = uuid.uuid4().hex
+    items = _build_items()
+
+    await storage.write(key=key, items=items)
+    read_items = await read_telemetry(redis, key)
+
+    if backend == StorageBackends.STREAM:
+        assert read_items == items
+    else:
+        assert len(read_items) == len(items)
+
+
+@pytest.mark.asyncio
+async def test_stream_consume(redis):
+    storage = StreamStorage(redis, max_len=1000)
+    key = uuid.uuid4().hex
+    items = _build_items()
+
+    await storage.write(key=key, items=items[:5])
+    first, last_id = await storage.consume(key=key)
+    assert first == items[:5]
+
+    await storage.write(key=key, items=items[5:])
+    second, _ = await storage.consume(key=key, last_id=last_id)
+    assert second == items[5:]
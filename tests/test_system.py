@@ -0,0 +1,185 @@
+import asyncio
+import concurrent.futures
+import socket
+import uuid
+
+import pytest
+import wotemu.monitor.system
+from wotemu.enums import RedisPrefixes, SystemMetrics
+from wotemu.monitor.cgroup import CgroupReader
+from wotemu.monitor.system import (DEFAULT_METRICS, _get_cpu_model_cached,
+                                   _get_service_vips, monitor_system)
+from wotemu.topology.compose import ENV_KEY_SERVICE_NAME
+
+
+@pytest.mark.asyncio
+async def test_monitor_system_groups():
+    group_size = 3
+    groups = []
+
+    async def async_cb(items):
+        groups.append(items)
+
+    metrics = [SystemMetrics.LAG.value, SystemMetrics.NET.value]
+
+    task = asyncio.ensure_future(monitor_system(
+        async_cb,
+        sleep=0.05,
+        group_size=group_size,
+        metrics=metrics))
+
+    await asyncio.sleep(0.6)
+    task.cancel()
+    await task
+
+    assert len(groups) >= 2
+    assert all(len(items) == group_size for items in groups)
+    assert all("loop_lag" in item for items in groups for item in items)
+    assert all(item["loop_lag"] >= 0 for items in groups for item in items)
+    assert "cpu_percent" not in groups[0][0]
+
+
+@pytest.mark.asyncio
+async def test_node_info_cached_cpu_model(redis):
+    node_id = uuid.uuid4().hex
+    cpu_model = "Cached CPU {}".format(node_id)
+    key = "{}:{}:{}".format(
+        RedisPrefixes.NAMESPACE.value,
+        RedisPrefixes.NODE.value,
+        node_id)
+
+    await redis.hset(key, "cpu_model", cpu_model)
+
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        result = await _get_cpu_model_cached(
+            asyncio.get_running_loop(),
+            executor,
+            redis=redis,
+            node_id=node_id)
+
+    assert result == cpu_model
+
+
+@pytest.mark.asyncio
+async def test_service_vips_resolution(monkeypatch):
+    service_name = "stack_{}".format(uuid.uuid4().hex[:8])
+
+    records = {
+        "{}.net_one".format(service_name): "10.0.1.2",
+        "{}.net_two".format(service_name): "10.0.2.2"
+    }
+
+    resolved = []
+
+    async def getaddrinfo(host, port, **kwargs):
+        resolved.append(host)
+
+        if host not in records:
+            raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", (records[host], 0))]
+
+    loop = asyncio.get_running_loop()
+    monkeypatch.setattr(loop, "getaddrinfo", getaddrinfo)
+    monkeypatch.setenv(ENV_KEY_SERVICE_NAME, service_name)
+
+    networks_data = [{"Name": "net_one"}, {"Name": "net_two"}, {"Name": "invalid"}]
+    vips = await _get_service_vips(networks_data)
+
+    assert vips == {"net_one": "10.0.1.2", "net_two": "10.0.2.2"}
+    assert len(resolved) == 3
+
+    # Resolved VIPs are cached
+
+    assert (await _get_service_vips(networks_data)) == vips
+    assert len(resolved) == 4
+
+    # The VIP changes when the service is recreated
+
+    monkeypatch.setattr(wotemu.monitor.system, "_VIPS_CACHE_TTL", 0)
+    records["{}.net_one".format(service_name)] = "10.0.1.9"
+    del records["{}.net_two".format(service_name)]
+
+    vips = await _get_service_vips(networks_data)
+
+    assert vips == {"net_one": "10.0.1.9"}
+    assert "{}.net_two".format(service_name) not in wotemu.monitor.system._vips_cache
+
+
+def test_system_cgroup_metrics(monkeypatch, tmp_path):
+    root = str(tmp_path)
+
+    files = {
+        "cgroup.controllers": "cpu memory\n",
+        "cpu.stat": "usage_usec 100\nnr_periods 10\nnr_throttled 5\nthrottled_usec 20\n",
+        "memory.stat": "pgfault 300\npgmajfault 3\n",
+        "cpu.pressure": "some avg10=2.00 avg60=1.00 avg300=0.50 total=100\n",
+        "memory.pressure": (
+            "some avg10=0.50 avg60=0.00 avg300=0.00 total=10\n"
+            "full avg10=0.10 avg60=0.00 avg300=0.00 total=1\n")
+    }
+
+    for name, content in files.items():
+        (tmp_path / name).write_text(content)
+
+    monkeypatch.setitem(wotemu.monitor.system._state, "cgroup", CgroupReader(root=root))
+    monkeypatch.setattr(wotemu.monitor.system, "_counters", {})
+
+    assert wotemu.monitor.system._get_faults() == {"mem_pgfault": 300, "mem_pgmajfault": 3}
+
+    pressure = wotemu.monitor.system._get_pressure()
+
+    assert pressure["psi_cpu_some"] == pytest.approx(2.0)
+    assert pressure["psi_memory_full"] == pytest.approx(0.1)
+
+    throttling = wotemu.monitor.system._get_throttling()
+
+    assert throttling["cpu_throttled_nanos"] == 20000
+    assert "cpu_throttled_percent" not in throttling
+
+    (tmp_path / "cpu.stat").write_text(
+        "usage_usec 200\nnr_periods 20\nnr_throttled 7\nthrottled_usec 40\n")
+
+    assert wotemu.monitor.system._get_throttling()["cpu_throttled_percent"] == pytest.approx(20.0)
+
+
+def test_system_cpu_constraint_runtime(monkeypatch, tmp_path):
+    (tmp_path / "cgroup.controllers").write_text("cpu memory\n")
+    (tmp_path / "cpu.max").write_text("50000 100000\n")
+
+    cgroup = CgroupReader(root=str(tmp_path))
+    monkeypatch.setitem(wotemu.monitor.system._state, "cgroup", cgroup)
+
+    assert wotemu.monitor.system._get_cpu_constraint() == pytest.approx(0.5)
+
+    # Quota updated by the CPU speed controller
+
+    (tmp_path / "cpu.max").write_text("20000 100000\n")
+
+    assert wotemu.monitor.system._get_cpu_constraint() == pytest.approx(0.2)
+
+    (tmp_path / "cpu.max").write_text("max 100000\n")
+
+    assert wotemu.monitor.system._get_cpu_constraint() is None
+
+
+@pytest.mark.asyncio
+async def test_monitor_system_default_metrics():
+    groups = []
+
+    async def async_cb(items):
+        groups.append(items)
+
+    task = asyncio.ensure_future(monitor_system(async_cb, sleep=0.05, group_size=0))
+
+    await asyncio.sleep(0.3)
+    task.cancel()
+    await task
+
+    assert len(groups) >= 2
+    assert all(len(items) == 1 for items in groups)
+    assert set(DEFAULT_METRICS) == {SystemMetrics.CPU.value, SystemMetrics.MEMORY.value}
+
+    keys = set(key for items in groups for item in items for key in item)
+
+    assert not any(key.startswith(("net_", "psi_", "loop_")) for key in keys)
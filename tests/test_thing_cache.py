@@ -0,0 +1,128 @@
+import asyncio
+import json
+import socket
+
+import pytest
+import tornado.web
+from wotemu.utils import consume_from_catalogue, invalidate_consumed_thing
+
+from .conftest import TD_EXAMPLE
+
+_THING_ID = TD_EXAMPLE["id"]
+
+
+class _FakeWoT:
+    def __init__(self):
+        self.consumed = []
+
+    def consume(self, td_str):
+        td = json.loads(td_str)
+        self.consumed.append(td)
+        return td
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def catalogue():
+    hits = {"catalogue": 0, "td": 0}
+
+    class CatalogueHandler(tornado.web.RequestHandler):
+        def get(self):
+            hits["catalogue"] += 1
+            self.write({_THING_ID: "/thing"})
+
+    class TDHandler(tornado.web.RequestHandler):
+        def get(self):
+            hits["td"] += 1
+            self.write(TD_EXAMPLE)
+
+    port = _free_port()
+
+    app = tornado.web.Application([
+        (r"/", CatalogueHandler),
+        (r"/thing", TDHandler)
+    ])
+
+    server = app.listen(port, address="127.0.0.1")
+
+    yield port, hits
+
+    server.stop()
+    invalidate_consumed_thing("127.0.0.1", _THING_ID)
+
+
+@pytest.mark.asyncio
+async def test_consume_cache_ttl(catalogue):
+    port, hits = catalogue
+    wot = _FakeWoT()
+
+    for _ in range(5):
+        consumed = await consume_from_catalogue(
+            wot=wot,
+            port_catalogue=port,
+            servient_host="127.0.0.1",
+            thing_id=_THING_ID,
+            ttl=60)
+
+        assert consumed["id"] == _THING_ID
+
+    assert hits == {"catalogue": 1, "td": 1}
+    assert len(wot.consumed) == 1
+
+    invalidate_consumed_thing("127.0.0.1", _THING_ID)
+
+    await consume_from_catalogue(
+        wot=wot,
+        port_catalogue=port,
+        servient_host="127.0.0.1",
+        thing_id=_THING_ID,
+        ttl=60)
+
+    assert hits == {"catalogue": 2, "td": 2}
+
+
+@pytest.mark.asyncio
+async def test_consume_cache_etag(catalogue):
+    port, hits = catalogue
+    wot = _FakeWoT()
+
+    for _ in range(3):
+        await consume_from_catalogue(
+            wot=wot,
+            port_catalogue=port,
+            servient_host="127.0.0.1",
+            thing_id=_THING_ID,
+            ttl=0.001)
+
+        await asyncio.sleep(0.01)
+
+    # Expired entries are revalidated against the TD URL (304 Not Modified)
+
+    assert hits == {"catalogue": 1, "td": 3}
+    assert len(wot.consumed) == 1
+
+
+@pytest.mark.asyncio
+async def test_consume_cache_wot(catalogue):
+    port, hits = catalogue
+    wot_a = _FakeWoT()
+    wot_b = _FakeWoT()
+
+    for wot in [wot_a, wot_b, wot_a, wot_b]:
+        await consume_from_catalogue(
+            wot=wot,
+            port_catalogue=port,
+            servient_host="127.0.0.1",
+            thing_id=_THING_ID,
+            ttl=60)
+
+    # ConsumedThings are not shared between servients
+
+    assert len(wot_a.consumed) == 1
+    assert len(wot_b.consumed) == 1
+    assert hits == {"catalogue": 2, "td": 2}
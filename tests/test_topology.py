@@ -1,4 +1,5 @@
 import logging
+import json
 import os
 import random
 import tempfile
@@ -7,9 +8,14 @@ import uuid
 import pytest
 import sh
 from wotemu.config import ConfigVars
+from wotemu.enums import (Labels, RedisPrefixes, RedisShardStrategies,
+                          StorageBackends)
+from wotemu.topology.compose import (ENV_KEY_TASK_SLOT, TEMPLATE_TASK_SLOT,
+                                     VOL_CALIBRATION, VOL_CALIBRATION_NAME)
 from wotemu.topology.models import (Broker, Network, Node, NodeApp,
-                                    NodeResources, Topology, TopologyPorts,
-                                    TopologyRedis)
+                                    NodeGroup, NodeResources, Service,
+                                    Topology, TopologyDockerProxy,
+                                    TopologyPorts, TopologyRedis)
 
 _logger = logging.getLogger(__name__)
 
@@ -152,6 +158,166 @@ def test_topology_redis():
     assert node_env_disabled[ConfigVars.REDIS_URL.value] == redis_url
 
 
+def test_topology_redis_backend():
+    network = Network(name="my_net")
+    node_app = NodeApp(path="/root/app.py", http=True)
+    node = Node(name="node", app=node_app, networks=[network])
+
+    top_redis = TopologyRedis(
+        backend=StorageBackends.STREAM,
+        stream_maxlen=5000)
+
+    top = Topology(nodes=[node], redis=top_redis)
+    compose = top.to_compose_dict()
+    node_env = compose["services"][node.name]["environment"]
+
+    assert node_env[ConfigVars.REDIS_BACKEND.value] == StorageBackends.STREAM.value
+    assert node_env[ConfigVars.REDIS_STREAM_MAXLEN.value] == "5000"
+
+    with pytest.raises(ValueError):
+        TopologyRedis(backend="unknown")
+
+
+def test_topology_redis_retention():
+    network = Network(name="my_net")
+    node_app = NodeApp(path="/root/app.py", http=True)
+    node = Node(name="node", app=node_app, networks=[network])
+
+    retention = {
+        RedisPrefixes.PACKET.value: {"max_age": 600, "rollup": 10},
+        RedisPrefixes.SYSTEM.value: {"max_len": 1000}
+    }
+
+    top_redis = TopologyRedis(retention=retention, maxmemory="256mb")
+    top = Topology(nodes=[node], redis=top_redis)
+    services = top.to_compose_dict()["services"]
+    node_env = services[node.name]["environment"]
+    env_retention = json.loads(node_env[ConfigVars.REDIS_RETENTION.value])
+
+    assert env_retention[RedisPrefixes.PACKET.value]["rollup"] == 10
+    assert env_retention[RedisPrefixes.SYSTEM.value]["max_len"] == 1000
+    assert "256mb" in services[top_redis.host]["command"]
+
+    with pytest.raises(ValueError):
+        TopologyRedis(retention={"unknown": {"max_len": 10}})
+
+    with pytest.raises(ValueError):
+        TopologyRedis(retention={RedisPrefixes.PACKET.value: {}})
+
+
+def test_topology_redis_shards():
+    network_one = Network(name="net_one")
+    network_two = Network(name="net_two")
+    node_app = NodeApp(path="/root/app.py", http=True)
+
+    nodes = [
+        Node(name="node_{}".format(idx), app=node_app, networks=[net])
+        for idx, net in enumerate([network_one, network_two] * 10)
+    ]
+
+    top_redis = TopologyRedis(shards=3)
+    top = Topology(nodes=nodes, redis=top_redis)
+    services = top.to_compose_dict()["services"]
+
+    assert len(top_redis.shard_hosts) == 3
+    assert all(host in services for host in top_redis.shard_hosts)
+    assert services == top.to_compose_dict()["services"]
+
+    shard_urls = set()
+
+    for node in nodes:
+        node_env = services[node.name]["environment"]
+        shard = top_redis.get_shard(node.name)
+        telemetry_url = node_env[ConfigVars.REDIS_TELEMETRY_URL.value]
+
+        assert node_env[ConfigVars.REDIS_URL.value] == top_redis.internal_url
+        assert telemetry_url == top_redis.internal_urls[shard]
+        assert top_redis.shard_hosts[shard] in services[node.name]["depends_on"]
+        shard_urls.add(telemetry_url)
+
+    assert len(shard_urls) > 1
+
+    top_redis_net = TopologyRedis(shards=3, shard_by=RedisShardStrategies.NETWORK)
+    top_net = Topology(nodes=nodes, redis=top_redis_net)
+    services_net = top_net.to_compose_dict()["services"]
+
+    for node in nodes:
+        node_env = services_net[node.name]["environment"]
+        gw_env = services_net[node.networks[0].name_gateway]["environment"]
+
+        assert node_env[ConfigVars.REDIS_TELEMETRY_URL.value] == \
+            gw_env[ConfigVars.REDIS_TELEMETRY_URL.value]
+
+    redis_urls = ["redis://one", "redis://two"]
+
+    with pytest.warns(Warning):
+        top_redis_ext = TopologyRedis(enabled=False, redis_url=redis_urls)
+
+    assert top_redis_ext.shards == 2
+    assert top_redis_ext.internal_urls == redis_urls
+
+    with pytest.raises(ValueError):
+        TopologyRedis(shards=0)
+
+    with pytest.raises(ValueError):
+        TopologyRedis(enabled=False, redis_url="redis://one", shards=3)
+
+    with pytest.warns(Warning):
+        top_redis_single = TopologyRedis(enabled=False, redis_url=["redis://one"], shards=1)
+
+    assert top_redis_single.shards == 1
+
+
+def test_topology_calibration_volume():
+    network = Network(name="my_net")
+    node_app = NodeApp(path="/root/app.py", http=True)
+    node = Node(name="node", app=node_app, networks=[network])
+
+    node_speed = Node(
+        name="node_speed",
+        app=node_app,
+        networks=[network],
+        resources=NodeResources(target_cpu_speed=200))
+
+    compose = Topology(nodes=[node]).to_compose_dict()
+    assert "volumes" not in compose
+
+    compose_speed = Topology(nodes=[node, node_speed]).to_compose_dict()
+    volumes = compose_speed["services"][node_speed.name]["volumes"]
+
+    assert VOL_CALIBRATION in volumes
+    assert VOL_CALIBRATION not in compose_speed["services"][node.name]["volumes"]
+    assert VOL_CALIBRATION_NAME in compose_speed["volumes"]
+
+
+def test_topology_docker_watch():
+    network = Network(name="my_net")
+    node_app = NodeApp(path="/root/app.py", http=True)
+    node = Node(name="node", app=node_app, networks=[network])
+
+    top = Topology(nodes=[node])
+    services = top.to_compose_dict()["services"]
+    node_env = services[node.name]["environment"]
+
+    assert top.docker_proxy.watch_host not in services
+    assert not node_env.get(ConfigVars.DOCKER_WATCH.value)
+
+    network_other = Network(name="my_other_net")
+    node_other = Node(name="node_other", app=node_app, networks=[network_other])
+    docker_proxy = TopologyDockerProxy(watch=True)
+    top_watch = Topology(nodes=[node, node_other], docker_proxy=docker_proxy)
+    services_watch = top_watch.to_compose_dict()["services"]
+    node_env_watch = services_watch[node.name]["environment"]
+
+    assert docker_proxy.watch_host in services_watch
+    assert len(services_watch[docker_proxy.watch_host]["networks"]) == 1
+    assert len(services_watch[docker_proxy.host]["networks"]) == 2
+    assert node_env_watch[ConfigVars.DOCKER_WATCH.value] == "1"
+
+    with pytest.raises(ValueError):
+        TopologyDockerProxy(enabled=False, watch=True)
+
+
 def test_node_compose(topology):
     node = topology.nodes[0]
     assert node.to_compose_dict(topology)
@@ -170,3 +336,180 @@ def test_network_compose(topology):
 def test_network_gateway_compose(topology):
     network = topology.networks[0]
     assert network.to_gateway_compose_dict(topology)
+
+
+def test_topology_cpu_control():
+    network = Network(name="my_net")
+    node_app = NodeApp(path="/root/app.py", http=True)
+
+    node = Node(
+        name="node",
+        app=node_app,
+        networks=[network],
+        resources=NodeResources(target_cpu_speed=200, cpu_control=True))
+
+    services = Topology(nodes=[node]).to_compose_dict()["services"]
+
+    assert services[node.name]["environment"][ConfigVars.CPU_CONTROL.value] == "1"
+
+    with pytest.raises(ValueError):
+        NodeResources(cpu_control=True)
+
+
+def _build_large_topology(num_nodes, num_networks, num_services, num_brokers):
+    networks = [Network(name="net_{}".format(idx)) for idx in range(num_networks)]
+    services = [Service(name="srv_{}".format(idx), image="redis") for idx in range(num_services)]
+
+    brokers = [
+        Broker(name="broker_{}".format(idx), networks=[networks[idx]])
+        for idx in range(num_brokers)
+    ]
+
+    node_app = NodeApp(path="/root/app.py", http=True)
+
+    nodes = [
+        Node(
+            name="node_{}".format(idx),
+            app=node_app,
+            networks=[networks[idx % num_networks]],
+            services=[services[idx % num_services]])
+        for idx in range(num_nodes)
+    ]
+
+    return Topology(nodes=nodes, brokers=brokers)
+
+
+def test_topology_index():
+    top = _build_large_topology(
+        num_nodes=12,
+        num_networks=3,
+        num_services=4,
+        num_brokers=2)
+
+    index = top.build_index()
+
+    assert len(index.nodes) == 12
+    assert len(index.networks) == 3
+    assert len(index.services) == 4
+    assert len(index.brokers) == 2
+
+    # Repeated calls should not accumulate the node brokers
+
+    assert len(top.brokers) == 2
+    assert len(top.brokers) == 2
+
+    for srv in top.services:
+        assert len(top.get_service_nodes(srv)) == 3
+
+    net = index.networks[0]
+    srv = index.services[0]
+
+    assert len(index.get_network_nodes(net)) == 4
+    assert all(net in node.networks for node in index.get_network_nodes(net))
+    assert [brk.name for brk in index.get_network_brokers(net)] == ["broker_0"]
+    assert len(index.get_service_nodes(srv)) == 3
+    assert top.get_service_nodes(srv) == index.get_service_nodes(srv)
+    assert index.get_service_nodes(Service(name="other", image="redis")) == []
+
+
+def test_topology_mutation():
+    top = _build_large_topology(
+        num_nodes=12,
+        num_networks=3,
+        num_services=4,
+        num_brokers=2)
+
+    network = Network(name="net_extra")
+    service = Service(name="srv_extra", image="redis")
+    node_app = NodeApp(path="/root/app.py", http=True)
+    node = Node(name="node_extra", app=node_app, networks=[network])
+
+    top.nodes.append(node)
+    node.link_service(service)
+
+    assert network in top.networks
+    assert service in top.services
+    assert top.get_service_nodes(service) == [node]
+
+    # The derived collections are copies
+
+    top.networks.clear()
+    top.services.clear()
+
+    assert len(top.networks) == 4
+    assert len(top.services) == 5
+
+    services = top.to_compose_dict()["services"]
+
+    assert node.name in services
+    assert service.name in services
+
+
+def test_topology_compose_many_nodes():
+    num_nodes = 50
+    num_networks = 5
+    num_services = 10
+
+    top = _build_large_topology(
+        num_nodes=num_nodes,
+        num_networks=num_networks,
+        num_services=num_services,
+        num_brokers=2)
+
+    compose = top.to_compose_dict()
+
+    services = compose["services"]
+    srv_name = "srv_0"
+
+    assert len([key for key in services if key.startswith("node_")]) == num_nodes
+    assert len([key for key in services if key.startswith("srv_")]) == num_services
+    assert len(services[srv_name]["networks"]) == num_nodes // num_services
+
+
+def test_topology_node_group():
+    network = Network(name="my_net")
+
+    servers = [
+        Node(
+            name="server_{}".format(idx),
+            app=NodeApp(path="/root/server.py", http=True),
+            networks=[network])
+        for idx in range(1, 4)
+    ]
+
+    reader_app = NodeApp(
+        path="/root/reader.py",
+        params={
+            "servient_host": "server_{slot}.my_net",
+            "thing_id": "urn:thing:{index}",
+            "period": 5
+        })
+
+    group = NodeGroup(
+        name="readers",
+        app=reader_app,
+        networks=[network],
+        size=3)
+
+    top = Topology(nodes=[*servers, group])
+    services = top.to_compose_dict()["services"]
+    service = services[group.name]
+
+    assert group.size == 3
+    assert service["deploy"]["replicas"] == 3
+    assert service["environment"][ENV_KEY_TASK_SLOT] == TEMPLATE_TASK_SLOT
+    assert service["labels"][Labels.WOTEMU_NODE_GROUP.value] == "3"
+    assert "server_{slot}.my_net" in service["command"]
+    assert ENV_KEY_TASK_SLOT not in services[servers[0].name]["environment"]
+
+    assert group.get_params(2) == {
+        "servient_host": "server_2.my_net",
+        "thing_id": "urn:thing:1",
+        "period": 5
+    }
+
+    with pytest.raises(ValueError):
+        NodeGroup(name="empty", app=reader_app, networks=[network], size=0)
+
+    with pytest.raises(ValueError):
+        NodeGroup(name="scaled", app=reader_app, networks=[network], size=2, scale=2)
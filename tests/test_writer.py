@@ -0,0 +1,184 @@
+import asyncio
+import time
+import uuid
+
+import pytest
+from wotemu.enums import WriterPolicies
+from wotemu.storage.base import read_telemetry
+from wotemu.storage.manager import close_redis_managers
+from wotemu.storage.writer import TelemetryWriter
+from wotemu.wotpy.redis import get_writer_thing_callback
+
+_UNREACHABLE_URL = "redis://127.0.0.1:1"
+
+
+def _redis_url(redis):
+    return "redis://{}:{}".format(*redis.address)
+
+
+@pytest.mark.asyncio
+async def test_writer_batches(redis):
+    writer = TelemetryWriter(
+        redis_url=_redis_url(redis),
+        flush_size=20,
+        flush_interval=0.1)
+
+    keys = [uuid.uuid4().hex for _ in range(3)]
+    num_items = 50
+
+    for idx in range(num_items):
+        for key in keys:
+            assert writer.put_nowait(key, {"time": time.time(), "idx": idx})
+
+    await asyncio.sleep(0.5)
+    await writer.stop()
+    await close_redis_managers()
+
+    for key in keys:
+        items = await read_telemetry(redis, key)
+        assert len(items) == num_items
+
+    assert writer.stats["written"] == num_items * len(keys)
+    assert writer.stats["dropped"] == 0
+    assert writer.stats["buffered"] == 0
+    assert writer.stats["flushes"] < num_items * len(keys)
+
+
+@pytest.mark.asyncio
+async def test_writer_drop_policy():
+    buffer_size = 5
+
+    writer = TelemetryWriter(
+        redis_url=_UNREACHABLE_URL,
+        buffer_size=buffer_size,
+        flush_size=100,
+        flush_interval=60,
+        policy=WriterPolicies.DROP.value,
+        spool_max_bytes=0)
+
+    results = [
+        writer.put_nowait("key", {"time": time.time()})
+        for _ in range(buffer_size * 2)
+    ]
+
+    assert results.count(True) == buffer_size
+    assert writer.stats["dropped"] == buffer_size
+    assert writer.stats["buffered"] == buffer_size
+
+    await writer.stop()
+    await close_redis_managers()
+
+    assert writer.stats["failed"] == buffer_size
+    assert writer.stats["buffered"] == 0
+
+
+@pytest.mark.asyncio
+async def test_writer_block_policy_nowait():
+    buffer_size = 5
+
+    writer = TelemetryWriter(
+        redis_url=_UNREACHABLE_URL,
+        buffer_size=buffer_size,
+        flush_size=100,
+        flush_interval=60,
+        policy=WriterPolicies.BLOCK.value,
+        spool_max_bytes=0)
+
+    writer.put_nowait("key", {"time": time.time()})
+    num_tasks = len(asyncio.all_tasks())
+
+    results = [
+        writer.put_nowait("key", {"time": time.time()})
+        for _ in range(buffer_size * 2)
+    ]
+
+    assert results.count(True) == buffer_size - 1
+    assert writer.stats["dropped"] == buffer_size + 1
+    assert len(asyncio.all_tasks()) == num_tasks
+
+    await writer.stop()
+    await close_redis_managers()
+
+
+@pytest.mark.asyncio
+async def test_writer_stop_drains(monkeypatch):
+    writer = TelemetryWriter(
+        redis_url=_UNREACHABLE_URL,
+        flush_size=5,
+        flush_interval=0.01,
+        spool_max_bytes=0)
+
+    written = []
+
+    async def _open():
+        writer._redis = object()
+
+    async def _write_batch(batch):
+        await asyncio.sleep(0.1)
+        written.extend(batch)
+
+    async def _run_retention():
+        pass
+
+    monkeypatch.setattr(writer, "_open", _open)
+    monkeypatch.setattr(writer, "_write_batch", _write_batch)
+    monkeypatch.setattr(writer, "_run_retention", _run_retention)
+
+    num_items = 23
+
+    for idx in range(num_items):
+        writer.put_nowait("key", {"idx": idx})
+
+    # Stopped while the first batch is being written
+
+    await asyncio.sleep(0.05)
+    await writer.stop()
+
+    assert len(written) == num_items
+    assert writer.stats["written"] == num_items
+    assert writer.stats["failed"] == 0
+    assert writer.stats["buffered"] == 0
+
+
+@pytest.mark.asyncio
+async def test_writer_thing_callback_policy():
+    data = {"host": "host", "time": time.time()}
+
+    writer_drop = TelemetryWriter(
+        redis_url=_UNREACHABLE_URL,
+        buffer_size=1,
+        flush_interval=60,
+        policy=WriterPolicies.DROP.value,
+        spool_max_bytes=0)
+
+    callback_drop = get_writer_thing_callback(writer_drop)
+
+    assert callback_drop(data) is None
+    assert callback_drop(data) is None
+    assert writer_drop.stats["dropped"] == 1
+
+    writer_block = TelemetryWriter(
+        redis_url=_UNREACHABLE_URL,
+        buffer_size=1,
+        flush_interval=60,
+        policy=WriterPolicies.BLOCK.value,
+        spool_max_bytes=0)
+
+    callback_block = get_writer_thing_callback(writer_block)
+
+    await callback_block(data)
+    blocked = asyncio.ensure_future(callback_block(data))
+    await asyncio.sleep(0.1)
+
+    assert not blocked.done()
+    assert writer_block.stats["blocked"] == 1
+
+    await writer_block.flush()
+    await asyncio.wait_for(blocked, timeout=1.0)
+
+    assert writer_block.stats["dropped"] == 0
+    assert writer_block.stats["queued"] == 2
+
+    await writer_drop.stop()
+    await writer_block.stop()
+    await close_redis_managers()
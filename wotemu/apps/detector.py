@@ -15,7 +15,8 @@ import cv2
 import face_recognition
 import numpy as np
 from wotemu.monitor.utils import write_metric
-from wotemu.utils import consume_from_catalogue, wait_node
+from wotemu.utils import (consume_from_catalogue, invalidate_consumed_thing,
+                          wait_node)
 from wotpy.wot.td import ThingDescription
 
 _QUEUE_MAXSIZE = 50
@@ -83,6 +84,8 @@ def _detect(queue_item):
 
 
 async def _control_camera_ptz(wot, conf, camera_id, lock, **kwargs):
+    servient_host, thing_id = None, None
+
     try:
         await lock.acquire()
 
@@ -103,6 +106,9 @@ async def _control_camera_ptz(wot, conf, camera_id, lock, **kwargs):
         _logger.debug("Finished PTZ control invocation: %s", camera_id)
     except Exception as ex:
         _logger.warning("Failed updating PTZ controls: %s", repr(ex))
+
+        if thing_id:
+            invalidate_consumed_thing(servient_host, thing_id)
     finally:
         lock.release()
 
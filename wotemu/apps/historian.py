@@ -15,7 +15,7 @@ from datetime import datetime
 
 import motor.motor_asyncio
 import pymongo
-from wotemu.utils import consume_from_catalogue
+from wotemu.utils import consume_from_catalogue, invalidate_consumed_thing
 from wotpy.wot.td import ThingDescription
 
 _DEFAULT_FALLBACK_DB = "wotemu_mongo_historian"
@@ -454,6 +454,7 @@ async def _start_observe_historian_task(
                 await run_iter()
             except Exception as ex:
                 _logger.warning("Error in historian iteration: %s", repr(ex))
+                invalidate_consumed_thing(servient_host, thing_id)
 
         await asyncio.sleep(1)
 
@@ -465,6 +466,7 @@ async def _read_insert_property(consumed_thing, name, thing_id, servient_host, m
         _logger.debug("Read property (%s=%s)", name, val)
     except Exception as ex:
         _logger.warning("Error reading (%s): %s", name, repr(ex))
+        invalidate_consumed_thing(servient_host, thing_id)
         return
 
     params = {
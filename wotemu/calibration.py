@@ -0,0 +1,197 @@
+"""Persistent store of the CPU speed calibrations of the Swarm nodes.
+
+Calibrations are keyed by Docker node ID and CPU model. They are kept in
+a JSON file on each host (mounted in the node containers as a named
+volume, so it survives stack restarts) and mirrored on Redis so that all
+the containers scheduled on the same node share them. A calibration is
+stale when it is older than the max age or when it was measured on a
+different CPU model or core count.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import platform
+import time
+
+from wotemu.enums import RedisPrefixes
+from wotemu.topology.cpu import CpuSpeedModel
+
+_CPUINFO_PATH = "/proc/cpuinfo"
+_CPUINFO_MODEL = "model name"
+
+_logger = logging.getLogger(__name__)
+
+
+def get_cpu_model():
+    try:
+        with open(_CPUINFO_PATH, "r") as fh:
+            for line in fh:
+                if line.startswith(_CPUINFO_MODEL):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+
+    return platform.processor() or platform.machine()
+
+
+def get_calibration_key(node_id, cpu_model):
+    model_hash = hashlib.md5(cpu_model.encode()).hexdigest()[:8]
+
+    return "{}:{}:{}:{}".format(
+        RedisPrefixes.NAMESPACE.value,
+        RedisPrefixes.BENCHMARK.value,
+        node_id,
+        model_hash)
+
+
+class CpuCalibration:
+    def __init__(
+            self, node_id, model, cpu_model=None, cpu_count=None,
+            created_at=None, probe_rate=None):
+        self.node_id = node_id
+        model = CpuSpeedModel.from_dict(model) if isinstance(model, dict) else model
+        self.model = model.to_dict()
+        self.cpu_model = cpu_model if cpu_model else get_cpu_model()
+        self.cpu_count = cpu_count if cpu_count else os.cpu_count()
+        self.created_at = created_at if created_at else time.time()
+        self.probe_rate = probe_rate
+
+    @classmethod
+    def from_dict(cls, val):
+        return cls(**val)
+
+    def to_dict(self):
+        return {
+            "node_id": self.node_id,
+            "model": self.model,
+            "cpu_model": self.cpu_model,
+            "cpu_count": self.cpu_count,
+            "created_at": self.created_at,
+            "probe_rate": self.probe_rate
+        }
+
+    @property
+    def key(self):
+        return get_calibration_key(self.node_id, self.cpu_model)
+
+    @property
+    def speed_model(self):
+        return CpuSpeedModel.from_dict(self.model)
+
+    @property
+    def age(self):
+        return time.time() - self.created_at
+
+    def is_stale(self, max_age=None):
+        if max_age is not None and self.age > max_age:
+            return True
+
+        return self.cpu_model != get_cpu_model() \
+            or self.cpu_count != os.cpu_count()
+
+
+class CalibrationStore:
+    def __init__(self, path, max_age=None):
+        self.path = path
+        self.max_age = max_age
+
+    def _read_file(self):
+        try:
+            with open(self.path, "r") as fh:
+                return json.load(fh)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as ex:
+            _logger.warning("Error reading calibrations (%s): %s", self.path, repr(ex))
+            return {}
+
+    def _write_file(self, data):
+        dir_path = os.path.dirname(self.path)
+
+        if dir_path:
+            os.makedirs(dir_path, exist_ok=True)
+
+        tmp_path = "{}.{}.tmp".format(self.path, os.getpid())
+
+        with open(tmp_path, "w") as fh:
+            json.dump(data, fh, indent=2)
+
+        # Atomic so that concurrent containers never read a partial file
+        os.replace(tmp_path, self.path)
+
+    def _fresh(self, val):
+        if not val:
+            return None
+
+        try:
+            calibration = CpuCalibration.from_dict(val)
+        except (TypeError, ValueError) as ex:
+            _logger.warning("Invalid calibration: %s", repr(ex))
+            return None
+
+        if calibration.is_stale(max_age=self.max_age):
+            _logger.info(
+                "Stale calibration (node=%s age=%.0f s model=%s)",
+                calibration.node_id, calibration.age, calibration.cpu_model)
+
+            return None
+
+        return calibration
+
+    def get_local(self, node_id):
+        key = get_calibration_key(node_id, get_cpu_model())
+        return self._fresh(self._read_file().get(key, None))
+
+    def put_local(self, calibration):
+        data = self._read_file()
+        data[calibration.key] = calibration.to_dict()
+
+        try:
+            self._write_file(data)
+        except OSError as ex:
+            _logger.warning("Error writing calibrations (%s): %s", self.path, repr(ex))
+
+    async def get_redis(self, redis, node_id):
+        key = get_calibration_key(node_id, get_cpu_model())
+        val = await redis.get(key)
+
+        try:
+            return self._fresh(json.loads(val) if val else None)
+        except ValueError:
+            return None
+
+    async def put_redis(self, redis, calibration):
+        await redis.set(calibration.key, json.dumps(calibration.to_dict()))
+
+    async def get(self, node_id, redis=None):
+        """Returns the fresh calibration of the node if there is one,
+        looking first in the local file and then in the Redis mirror."""
+
+        calibration = self.get_local(node_id)
+
+        if calibration:
+            _logger.debug("Found local calibration: %s", calibration.key)
+
+            if redis:
+                await self.put_redis(redis, calibration)
+
+            return calibration
+
+        if not redis:
+            return None
+
+        calibration = await self.get_redis(redis, node_id)
+
+        if calibration:
+            _logger.debug("Found Redis calibration: %s", calibration.key)
+            self.put_local(calibration)
+
+        return calibration
+
+    async def put(self, calibration, redis=None):
+        self.put_local(calibration)
+
+        if redis:
+            await self.put_redis(redis, calibration)
@@ -10,17 +10,22 @@ import signal
 import sys
 import tempfile
 
-import aioredis
 import coloredlogs
 import tornado.httpclient
 import wotemu.config
 import wotemu.wotpy.redis
 import wotemu.wotpy.wot
+from wotemu.dockerapi import log_docker_api_stats
 from wotemu.enums import BUILTIN_APPS_MODULES, BuiltinApps
+from wotemu.httpclient import configure_http_client
+from wotemu.metadata import read_gateway_tasks
 from wotemu.monitor.base import NodeMonitor
-from wotemu.utils import (get_current_task, get_network_gateway_task,
-                          get_output_iface_for_task, get_task_networks,
-                          import_func)
+from wotemu.monitor.cpuspeed import build_cpu_speed_controller
+from wotemu.readiness import ReadinessNotifier
+from wotemu.storage.manager import close_redis_managers
+from wotemu.storage.writer import get_writer, stop_writers
+from wotemu.topology.compose import ENV_KEY_TASK_SLOT, render_slot_param
+from wotemu.utils import get_output_iface_for_task, import_func
 
 _TIMEOUT = 15
 _HTTP_REGEX = r"^https?:\/\/.*"
@@ -98,23 +103,17 @@ def _import_app_func(module_path, func_name):
         _remove_tempfile(module_path)
 
 
-def _build_thing_cb(redis_url, loop):
-    async def dummy_cb(*args, **kwargs):
+def _build_thing_cb(redis_url):
+    def dummy_cb(*args, **kwargs):
         pass
 
     if not redis_url:
-        return dummy_cb, None
+        return dummy_cb
 
-    _logger.debug("Creating Redis pool with URL: %s", redis_url)
+    _logger.debug("Creating telemetry writer with URL: %s", redis_url)
 
-    redis_pool = loop.run_until_complete(
-        aioredis.create_redis_pool(redis_url))
-
-    redis_cb = functools.partial(
-        wotemu.wotpy.redis.redis_thing_callback,
-        client=redis_pool)
-
-    return redis_cb, redis_pool
+    return wotemu.wotpy.redis.get_writer_thing_callback(
+        writer=get_writer(redis_url=redis_url))
 
 
 def _exception_handler(loop, context):
@@ -122,7 +121,7 @@ def _exception_handler(loop, context):
     _logger.log(level, "Exception in loop:\n%s", pprint.pformat(context))
 
 
-async def _start_servient(wot):
+async def _start_servient(wot, notifier=None):
     try:
         _logger.debug("Starting Servient: %s", wot.servient)
         await wot.servient.start()
@@ -130,6 +129,9 @@ async def _start_servient(wot):
         _logger.error("Error in Servient startup", exc_info=True)
         sys.exit(1)
 
+    if notifier:
+        await notifier.notify_servient()
+
 
 async def _stop_servient(wot):
     try:
@@ -139,19 +141,29 @@ async def _stop_servient(wot):
         _logger.warning("Error in Servient shutdown", exc_info=True)
 
 
-async def _stop_redis(redis_pool):
-    if not redis_pool:
-        return
+async def _stop_notifier(notifier):
+    try:
+        _logger.debug("Clearing readiness record")
+        await notifier.clear()
+    except Exception:
+        _logger.warning("Error stopping readiness notifier", exc_info=True)
+
+
+async def _stop_writers():
+    try:
+        _logger.debug("Flushing and stopping telemetry writers")
+        await stop_writers()
+    except Exception:
+        _logger.warning("Error stopping telemetry writers", exc_info=True)
 
     try:
-        _logger.debug("Closing Redis")
-        redis_pool.close()
-        await redis_pool.wait_closed()
+        _logger.debug("Closing Redis connection pools")
+        await close_redis_managers()
     except Exception:
-        _logger.warning("Error in Redis shutdown", exc_info=True)
+        _logger.warning("Error closing Redis connection pools", exc_info=True)
 
 
-async def _stop(loop, app_task, wot, redis_pool, monitor, lock):
+async def _stop(loop, app_task, wot, monitor, lock, notifier=None):
     if lock.locked():
         _logger.debug("Another stop task is already in progress")
         return
@@ -164,12 +176,16 @@ async def _stop(loop, app_task, wot, redis_pool, monitor, lock):
         except Exception:
             _logger.warning("Error during WoT app cancelation", exc_info=True)
 
+        if notifier:
+            await _stop_notifier(notifier)
+
         await _stop_servient(wot=wot)
 
         if monitor:
             await monitor.stop()
 
-        await _stop_redis(redis_pool=redis_pool)
+        await _stop_writers()
+        log_docker_api_stats()
 
         _logger.debug("Stopping loop")
         loop.stop()
@@ -185,29 +201,28 @@ def _app_done_cb(fut, stop, exit_status):
     asyncio.ensure_future(stop())
 
 
-def _get_monitor_ifaces(docker_url):
-    curr_task = get_current_task(docker_url=docker_url)
-
-    wotemu_network_ids = get_task_networks(
-        docker_url=docker_url,
-        task=curr_task)
-
-    gw_tasks = [
-        get_network_gateway_task(
-            docker_url=docker_url,
-            network_id=net_id)
-        for net_id in wotemu_network_ids
-    ]
+def _get_monitor_ifaces(conf, loop):
+    gw_tasks = loop.run_until_complete(read_gateway_tasks(conf))
 
     return [
         get_output_iface_for_task(gw_task)[0]
-        for gw_task in gw_tasks
+        for gw_task in gw_tasks.values()
     ]
 
 
+def _get_app_kwargs(func_param):
+    slot = os.getenv(ENV_KEY_TASK_SLOT, None)
+
+    if not slot:
+        return {key: val for key, val in func_param}
+
+    return {key: render_slot_param(val, slot) for key, val in func_param}
+
+
 def run_app(
         conf, path, func, func_param, hostname,
-        enable_http, enable_mqtt, enable_coap, enable_ws, disable_monitor):
+        enable_http, enable_mqtt, enable_coap, enable_ws, disable_monitor,
+        enable_loop_monitor=False):
     if not enable_http and not enable_mqtt and not enable_coap and not enable_ws:
         _logger.warning("No protocol bindings have been enabled")
 
@@ -224,14 +239,23 @@ def run_app(
     loop = asyncio.get_event_loop()
     loop.set_exception_handler(_exception_handler)
 
-    thing_cb, redis_pool = _build_thing_cb(
-        redis_url=conf.redis_url,
-        loop=loop)
+    # Shared by the catalogue helpers and the HTTP binding client of the servient
+    configure_http_client()
+
+    thing_cb = _build_thing_cb(redis_url=conf.redis_telemetry_url)
+    notifier = ReadinessNotifier(conf.redis_url) if conf.redis_url else None
+
+    # Records left by a previous run of this same container are removed
+    # before the app has the chance to expose any thing
+
+    if notifier:
+        loop.run_until_complete(notifier.clear())
 
     wot_kwargs = {
         "port_catalogue": conf.port_catalogue,
         "exposed_cb": thing_cb,
         "consumed_cb": thing_cb,
+        "expose_cb": notifier.expose_cb if notifier else None,
         "port_http": port_http,
         "port_ws": port_ws,
         "port_coap": port_coap,
@@ -242,10 +266,10 @@ def run_app(
     _logger.debug("Building WoT entrypoint with args: %s", wot_kwargs)
     wot = wotemu.wotpy.wot.wot_entrypoint(**wot_kwargs)
 
-    asyncio.ensure_future(_start_servient(wot))
+    asyncio.ensure_future(_start_servient(wot, notifier=notifier))
 
     app_args = (wot, conf, loop)
-    app_kwargs = {key: val for key, val in func_param}
+    app_kwargs = _get_app_kwargs(func_param)
 
     _logger.debug(
         "WoT app call signature (positional and keyword):\n%s\n%s",
@@ -259,8 +283,16 @@ def run_app(
 
     if not disable_monitor:
         _logger.info("Scheduling startup task for node monitor")
-        ifaces = _get_monitor_ifaces(docker_url=conf.docker_proxy_url)
-        monitor = NodeMonitor(redis_url=conf.redis_url, packet_ifaces=ifaces)
+        ifaces = _get_monitor_ifaces(conf=conf, loop=loop)
+
+        cpu_controller = build_cpu_speed_controller(conf) \
+            if conf.cpu_control else None
+
+        monitor = NodeMonitor(
+            redis_url=conf.redis_telemetry_url,
+            packet_ifaces=ifaces,
+            enable_loop=enable_loop_monitor,
+            cpu_controller=cpu_controller)
         asyncio.ensure_future(monitor.start())
 
     stop = functools.partial(
@@ -268,9 +300,9 @@ def run_app(
         loop=loop,
         app_task=app_task,
         wot=wot,
-        redis_pool=redis_pool,
         monitor=monitor,
-        lock=asyncio.Lock())
+        lock=asyncio.Lock(),
+        notifier=notifier)
 
     exit_status = {}
 
@@ -6,6 +6,8 @@ import signal
 
 import sh
 from wotemu.monitor.base import NodeMonitor
+from wotemu.storage.manager import close_redis_managers
+from wotemu.storage.writer import stop_writers
 from wotemu.utils import strip_ansi_codes
 
 _ERR_MOSQUITTO = "error"
@@ -77,6 +79,16 @@ async def _close_loop(loop, monitor):
         except:
             _logger.warning("Error stopping monitor", exc_info=True)
 
+    try:
+        await stop_writers()
+    except:
+        _logger.warning("Error stopping telemetry writers", exc_info=True)
+
+    try:
+        await close_redis_managers()
+    except:
+        _logger.warning("Error closing Redis connection pools", exc_info=True)
+
     _logger.debug("Stopping loop")
     loop.stop()
 
@@ -104,7 +116,7 @@ def run_mqtt_broker(conf, disable_monitor):
     loop.set_exception_handler(_loop_ex_handler)
 
     monitor = NodeMonitor(
-        redis_url=conf.redis_url) if not disable_monitor else None
+        redis_url=conf.redis_telemetry_url) if not disable_monitor else None
 
     close_loop = functools.partial(
         _close_loop,
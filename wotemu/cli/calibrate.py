@@ -0,0 +1,149 @@
+import logging
+import os
+import pprint
+import time
+import uuid
+
+import docker
+from wotemu.cli.limits import get_local_calibration
+from wotemu.config import DEFAULT_CALIBRATION_DIR, DEFAULT_DOCKER_SOCKET, ConfigVars
+from wotemu.topology.compose import (BASE_IMAGE, ENV_KEY_NODE_ID,
+                                     IMAGE_ENV_VAR, TEMPLATE_NODE_ID,
+                                     VOL_CALIBRATION_NAME)
+
+_SERVICE_PREFIX = "wotemu_calibrate"
+_TASK_DONE_STATES = {"complete", "failed", "rejected", "shutdown", "orphaned"}
+_NODE_READY = "ready"
+_NODE_ACTIVE = "active"
+
+_logger = logging.getLogger(__name__)
+
+
+def _get_node_id(docker_url):
+    node_id = os.environ.get(ENV_KEY_NODE_ID, None)
+
+    if node_id:
+        return node_id
+
+    client = docker.DockerClient(base_url=docker_url)
+    node_id = client.info().get("Swarm", {}).get("NodeID", None)
+
+    if not node_id:
+        raise RuntimeError("This Docker host is not part of a Swarm")
+
+    return node_id
+
+
+def calibrate_host(conf, docker_url, force):
+    node_id = _get_node_id(docker_url)
+    calibration = get_local_calibration(conf, node_id, force=force)
+
+    _logger.info(
+        "CPU speed calibration (%s):\n%s",
+        conf.calibration_path,
+        pprint.pformat(calibration.to_dict()))
+
+    return calibration
+
+
+def _count_schedulable_nodes(client):
+    return len([
+        node for node in client.nodes.list()
+        if node.attrs.get("Status", {}).get("State") == _NODE_READY
+        and node.attrs.get("Spec", {}).get("Availability") == _NODE_ACTIVE
+    ])
+
+
+def _wait_tasks(service, num_nodes, timeout, wait):
+    ini = time.time()
+
+    while True:
+        tasks = service.tasks()
+        states = [task.get("Status", {}).get("State") for task in tasks]
+        done = [state for state in states if state in _TASK_DONE_STATES]
+
+        _logger.debug("Calibration tasks: %s", states)
+
+        if len(tasks) >= num_nodes and len(done) == len(tasks):
+            return tasks
+
+        if timeout is not None and (time.time() - ini) >= timeout:
+            raise TimeoutError("Timeout waiting for the calibration tasks")
+
+        time.sleep(wait)
+
+
+def calibrate_swarm(conf, docker_url, force, timeout, wait):
+    """Runs a one-shot global service that calibrates every Swarm node
+    and stores the result in the calibration volume of each host."""
+
+    client = docker.DockerClient(base_url=docker_url)
+    num_nodes = _count_schedulable_nodes(client)
+    name = "{}_{}".format(_SERVICE_PREFIX, uuid.uuid4().hex[:8])
+    command = ["wotemu", "calibrate", "--local"]
+
+    if force:
+        command.append("--force")
+
+    env = {
+        ENV_KEY_NODE_ID: TEMPLATE_NODE_ID,
+        ConfigVars.CALIBRATION_PATH.value: conf.calibration_path,
+        ConfigVars.CALIBRATION_MAX_AGE.value: conf.calibration_max_age
+    }
+
+    mounts = [
+        docker.types.Mount(
+            target=DEFAULT_CALIBRATION_DIR,
+            source=VOL_CALIBRATION_NAME,
+            type="volume"),
+        docker.types.Mount(
+            target=DEFAULT_DOCKER_SOCKET,
+            source=DEFAULT_DOCKER_SOCKET,
+            type="bind")
+    ]
+
+    _logger.info("Creating calibration service on %s nodes: %s", num_nodes, name)
+
+    service = client.services.create(
+        image=os.getenv(IMAGE_ENV_VAR, BASE_IMAGE),
+        command=command,
+        name=name,
+        env=["{}={}".format(key, val) for key, val in env.items()],
+        mounts=mounts,
+        mode=docker.types.ServiceMode("global"),
+        restart_policy=docker.types.RestartPolicy(condition="none"))
+
+    try:
+        tasks = _wait_tasks(service, num_nodes, timeout, wait)
+    finally:
+        service.remove()
+
+    failed = [
+        task for task in tasks
+        if task.get("Status", {}).get("State") != "complete"
+    ]
+
+    for task in failed:
+        _logger.warning(
+            "Calibration failed on node %s: %s",
+            task.get("NodeID"),
+            task.get("Status", {}).get("Err"))
+
+    _logger.info(
+        "Calibrated %s of %s Swarm nodes",
+        len(tasks) - len(failed), len(tasks))
+
+    if failed:
+        raise RuntimeError("Calibration failed on {} nodes".format(len(failed)))
+
+
+def calibrate(conf, docker_url, local, force, timeout, wait):
+    if local:
+        calibrate_host(conf, docker_url=docker_url, force=force)
+    else:
+        calibrate_swarm(
+            conf,
+            docker_url=docker_url,
+            force=force,
+            timeout=timeout,
+            wait=wait)
@@ -1,11 +1,20 @@
+import asyncio
 import json
 import logging
+import os
 import shlex
 import signal
 import subprocess
 import time
 
 import netifaces
+from wotemu.enums import LOSS_GEMODEL, LOSS_RANDOM, RedisPrefixes
+from wotemu.storage.manager import close_redis_managers
+from wotemu.storage.writer import get_writer, stop_writers
+from wotemu.topology.analysis import parse_rate
+from wotemu.topology.compose import ENV_KEY_NETWORK_NAME
+from wotemu.topology.schedule import (KEY_PERIOD, KEY_SCHEDULE,
+                                      get_netem_shape, get_schedule_states)
 
 _IFACE_LO = "lo"
 
@@ -44,11 +53,6 @@ def _call(command):
     subprocess.call(shlex.split(command))
 
 
-def _check_call(command):
-    _logger.debug("check_call: %s", command)
-    subprocess.check_call(shlex.split(command))
-
-
 def _clean_netem(nic):
     _logger.info("Undoing netem configuration")
     _call(f"tc qdisc del dev {nic} root")
@@ -57,42 +61,238 @@ def _clean_netem(nic):
 _DEFAULT_DELAY_CORR = 0
 _DEFAULT_RATE_BURST = "100kbit"
 _DEFAULT_RATE_LATENCY = 20
+_UNLIMITED_RATE = "10gbit"
 _QDISC_PARENT = "root handle 1:"
 _QDISC_CHILD = "parent 1: handle 2:"
 
 
-def _set_delay(nic, latency, jitter, corr=None, root=True):
+def _pct(val):
+    return "{}%".format(val)
+
+
+def _loss_args(loss):
+    if not isinstance(loss, dict):
+        return ["loss", "random", _pct(loss)]
+
+    model = loss.get("model", LOSS_RANDOM)
+
+    if model == LOSS_RANDOM:
+        args = ["loss", "random", _pct(loss["percent"])]
+
+        if loss.get("correlation") is not None:
+            args.append(_pct(loss["correlation"]))
+
+        return args
+
+    if model == LOSS_GEMODEL:
+        # Positional: p, r, 1-h (loss in bad state) and 1-k (loss in good state)
+
+        args = ["loss", "gemodel", _pct(loss["p"])]
+
+        for key in ("r", "loss_bad", "loss_good"):
+            if loss.get(key) is None:
+                break
+
+            args.append(_pct(loss[key]))
+
+        return args
+
+    raise ValueError("Unknown loss model: {}".format(model))
+
+
+def _impairment_args(name, val):
+    if not isinstance(val, dict):
+        return [name, _pct(val)]
+
+    args = [name, _pct(val["percent"])]
+
+    if val.get("correlation") is not None:
+        args.append(_pct(val["correlation"]))
+
+    if name == "reorder" and val.get("gap") is not None:
+        args += ["gap", str(val["gap"])]
+
+    return args
+
+
+def _netem_cmd(
+        nic, latency, jitter=None, corr=None, loss=None, duplicate=None,
+        reorder=None, corrupt=None, root=True, action="add"):
     # See: https://man7.org/linux/man-pages/man8/tc-netem.8.html
     # See: https://www.excentis.com/blog/use-linux-traffic-control-impairment-node-test-environment-part-1
 
     corr = _DEFAULT_DELAY_CORR if corr is None else corr
     qdiscs = _QDISC_PARENT if root else _QDISC_CHILD
 
-    cmd = (
-        "tc qdisc add dev {} {} "
-        "netem delay {}ms {}ms {}% distribution normal"
-    ).format(nic, qdiscs, latency, jitter, corr)
+    args = ["qdisc", action, "dev", nic, *qdiscs.split(), "netem"]
+    args += ["delay", "{}ms".format(latency if latency else 0)]
+
+    # A distribution is only accepted by netem along with a jitter
+
+    if jitter:
+        args += ["{}ms".format(jitter), _pct(corr), "distribution", "normal"]
+
+    if loss:
+        args += _loss_args(loss)
 
-    _check_call(cmd)
+    for name, val in (("duplicate", duplicate), ("reorder", reorder), ("corrupt", corrupt)):
+        if val:
+            args += _impairment_args(name, val)
 
+    return " ".join(args)
 
-def _set_rate(nic, rate, burst=None, latency=None, root=False):
+
+def _rate_cmd(nic, rate, burst=None, latency=None, root=False, action="add"):
     # See: https://man7.org/linux/man-pages/man8/tc-tbf.8.html
 
     burst = _DEFAULT_RATE_BURST if burst is None else burst
     latency = _DEFAULT_RATE_LATENCY if latency is None else latency
     qdiscs = _QDISC_PARENT if root else _QDISC_CHILD
 
-    cmd = (
-        "tc qdisc add dev {} {} "
+    return (
+        "qdisc {} dev {} {} "
         "tbf rate {} burst {} latency {}ms"
-    ).format(nic, qdiscs, rate, burst, latency)
+    ).format(action, nic, qdiscs, rate, burst, latency)
+
+
+def build_netem_batch(nic, netem_args, action="add", shape=None):
+    """Builds the input of 'tc -batch' that imposes the netem constraints.
+    The shape (see get_netem_shape) fixes the qdiscs so that the settings
+    of a schedule can be applied later with the 'change' action."""
+
+    has_netem, has_rate = shape if shape else get_netem_shape([netem_args])
+
+    cmds = []
+
+    if has_netem:
+        cmds.append(_netem_cmd(
+            nic=nic,
+            latency=netem_args.get("latency"),
+            jitter=netem_args.get("jitter"),
+            corr=netem_args.get("correlation"),
+            loss=netem_args.get("loss"),
+            duplicate=netem_args.get("duplicate"),
+            reorder=netem_args.get("reorder"),
+            corrupt=netem_args.get("corrupt"),
+            root=True,
+            action=action))
+
+    if has_rate:
+        cmds.append(_rate_cmd(
+            nic=nic,
+            rate=netem_args.get("rate") or _UNLIMITED_RATE,
+            burst=netem_args.get("rate_burst"),
+            latency=netem_args.get("rate_latency"),
+            root=not has_netem,
+            action=action))
+
+    return cmds
+
+
+def _run_tc_batch(cmds):
+    if not cmds:
+        return
+
+    _logger.debug("tc -batch:\n%s", "\n".join(cmds))
 
-    _check_call(cmd)
+    subprocess.run(
+        ["tc", "-batch", "-"],
+        input="\n".join(cmds) + "\n",
+        check=True,
+        universal_newlines=True)
+
+
+def _build_record(state):
+    record = {"time": time.time(), **state}
+
+    if state.get("rate") is not None:
+        record["rate_kbit"] = parse_rate(state["rate"]) / 1e3
+
+    return record
+
+
+def _get_record_cb(conf):
+    network = os.getenv(ENV_KEY_NETWORK_NAME, None)
+
+    if not network or not conf.redis_telemetry_url:
+        _logger.warning("Undefined network or Redis: Netem settings will not be recorded")
+        return None
+
+    key = "{}:{}:{}".format(
+        RedisPrefixes.NAMESPACE.value,
+        RedisPrefixes.NETEM.value,
+        network)
+
+    writer = get_writer(redis_url=conf.redis_telemetry_url)
+
+    async def record_cb(state):
+        await writer.put(key, _build_record(state))
+
+    return record_cb
+
+
+async def _record(record_cb, state):
+    if not record_cb:
+        return
+
+    try:
+        await record_cb(state)
+    except Exception as ex:
+        _logger.warning("Error recording netem settings: %s", repr(ex))
+
+
+async def run_schedule(nic, states, shape, period=None, record_cb=None, apply_cb=None):
+    """Applies each state of the schedule at its time offset. The first
+    state is expected to be already in place. The schedule is repeated
+    every period seconds if defined, otherwise the last state is kept."""
+
+    apply_cb = apply_cb if apply_cb else _run_tc_batch
+    loop = asyncio.get_event_loop()
+    ini = loop.time()
+    steps = states[1:]
+
+    await _record(record_cb, states[0][1])
+
+    while True:
+        for offset, state in steps:
+            await asyncio.sleep(max(0, ini + offset - loop.time()))
+            cmds = build_netem_batch(nic, state, action="change", shape=shape)
+            await loop.run_in_executor(None, apply_cb, cmds)
+            _logger.debug("Applied netem settings (t=%s): %s", offset, state)
+            await _record(record_cb, state)
+
+        if not period:
+            break
+
+        ini += float(period)
+        steps = states
+
+    while True:
+        await asyncio.sleep(_ITER_SLEEP_SECS)
 
 
 _ITER_SLEEP_SECS = 1.0
 
+STATE_CLEARED = {"cleared": True}
+
+
+async def stop_chaos(nic, record_cb=None):
+    """Removes the netem configuration, records the transition
+    and flushes the pending records before exiting."""
+
+    _clean_netem(nic=nic)
+    await _record(record_cb, STATE_CLEARED)
+
+    try:
+        await stop_writers()
+    except Exception:
+        _logger.warning("Error stopping telemetry writers", exc_info=True)
+
+    try:
+        await close_redis_managers()
+    except Exception:
+        _logger.warning("Error closing Redis connection pools", exc_info=True)
+
 
 def create_chaos(conf, netem):
     nic = _find_chaos_interface()
@@ -102,38 +302,35 @@ def create_chaos(conf, netem):
     netem_args = json.loads(netem[0])
     _logger.info("Imposing netem constraints: %s", netem_args)
 
-    def exit_handler(*_):
-        _clean_netem(nic=nic)
-        exit(0)
+    states = get_schedule_states(netem_args, netem_args.get(KEY_SCHEDULE))
+    shape = get_netem_shape([state for _, state in states])
 
-    signal.signal(signal.SIGINT, exit_handler)
-    signal.signal(signal.SIGTERM, exit_handler)
+    if len(states) > 1:
+        _logger.info("Netem schedule with %s steps", len(states))
 
     _clean_netem(nic=nic)
+    _run_tc_batch(build_netem_batch(nic, states[0][1], shape=shape))
 
-    delay_defined = netem_args.get("latency") is not None \
-        and netem_args.get("jitter") is not None
+    loop = asyncio.get_event_loop()
+    record_cb = _get_record_cb(conf)
 
-    if delay_defined:
-        _set_delay(
-            nic=nic,
-            latency=netem_args["latency"],
-            jitter=netem_args["jitter"],
-            corr=netem_args.get("correlation"),
-            root=True)
+    schedule_task = asyncio.ensure_future(run_schedule(
+        nic=nic,
+        states=states,
+        shape=shape,
+        period=netem_args.get(KEY_PERIOD),
+        record_cb=record_cb))
 
-    if netem_args.get("rate") is not None:
-        _set_rate(
-            nic=nic,
-            rate=netem_args["rate"],
-            burst=netem_args.get("rate_burst"),
-            latency=netem_args.get("rate_latency"),
-            root=not delay_defined)
+    def exit_handler():
+        _logger.debug("Received stop signal")
+        schedule_task.cancel()
 
-    try:
-        _logger.info("Sleeping indefinitely")
+    for name in {"SIGINT", "SIGTERM"}:
+        loop.add_signal_handler(getattr(signal, name), exit_handler)
 
-        while True:
-            time.sleep(_ITER_SLEEP_SECS)
+    try:
+        loop.run_until_complete(schedule_task)
+    except asyncio.CancelledError:
+        _logger.debug("Cancelled netem schedule")
     finally:
-        _clean_netem(nic=nic)
+        loop.run_until_complete(stop_chaos(nic=nic, record_cb=record_cb))
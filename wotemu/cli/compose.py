@@ -19,7 +19,16 @@ def build_compose(conf, path, output, func):
     _logger.info("Imported topology function: %s", topology_func)
     output = output if output else _default_output_path(path)
     _logger.info("Writing Compose file to: %s", output)
-    compose_yaml = topology_func().to_compose_yaml()
+    topology = topology_func()
+
+    try:
+        topology.analyze().log()
+    except Exception:
+        _logger.warning("Error in the topology analysis", exc_info=True)
+
+    compose_yaml = topology.to_compose_yaml()
 
     with open(output, "w") as fh:
         fh.write(compose_yaml)
+
+    topology.write_schedule_files(os.path.dirname(os.path.abspath(output)))
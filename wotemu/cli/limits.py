@@ -1,114 +1,127 @@
 import asyncio
-import json
 import logging
 import os
+import socket
 import time
 
-import aioredis
 import docker
-import numpy
-from wotemu.enums import RedisPrefixes
-from wotemu.topology.compose import ENV_KEY_CPU_SPEED, ENV_KEY_NODE_ID
-from wotemu.topology.cpu import get_cpu_core_scale, get_cpu_core_speed_poly
+from wotemu.calibration import (CalibrationStore, CpuCalibration,
+                                get_calibration_key, get_cpu_model)
+from wotemu.monitor.cpuspeed import measure_probe_rate
+from wotemu.storage.manager import close_redis_managers, get_redis_manager
+from wotemu.topology.compose import ENV_KEY_NODE_ID
+from wotemu.topology.cpu import get_cpu_core_scale, get_cpu_core_speed_model
 from wotemu.utils import get_current_container_id, ping_docker
 
 _CPU_PERIOD = 100000
-_KEY_CPU_PREFIX = "cpu"
-_EXPIRE_SECS = 3600
+_LOCK_SECS = 600
 
 _logger = logging.getLogger(__name__)
 
 
-def _get_cpu_poly_key():
+def _get_node_id():
     node_id = os.environ.get(ENV_KEY_NODE_ID, None)
 
     if node_id is None:
         raise RuntimeError(f"Undefined ${ENV_KEY_NODE_ID}")
 
-    return "{}:{}:{}".format(
-        RedisPrefixes.NAMESPACE.value,
-        RedisPrefixes.BENCHMARK.value,
-        node_id)
+    return node_id
 
 
-def _local_cpu_poly():
-    return get_cpu_core_speed_poly(cache=True)
+def _build_calibration(node_id):
+    model = get_cpu_core_speed_model(cache=True)
 
+    # Reference for the CPU speed controller, measured on the idle host
 
-async def _get_redis_poly(redis, key):
-    _logger.debug("GET %s", key)
-    val = await redis.get(key)
+    return CpuCalibration(
+        node_id=node_id,
+        model=model,
+        probe_rate=measure_probe_rate())
 
-    if not val:
-        return None
 
-    coeffs = json.loads(val)
+def _get_store(conf):
+    return CalibrationStore(
+        path=conf.calibration_path,
+        max_age=conf.calibration_max_age)
 
-    return numpy.poly1d(coeffs) if coeffs else None
 
+def get_local_calibration(conf, node_id, force=False):
+    store = _get_store(conf)
+    calibration = store.get_local(node_id) if not force else None
 
-async def _set_redis_poly(redis, key, poly):
-    val = json.dumps(poly.coeffs.tolist())
-    _logger.debug("SET %s %s", key, val)
-    await redis.set(key, val, expire=_EXPIRE_SECS)
+    if calibration:
+        _logger.info("Using stored CPU speed calibration: %s", calibration.key)
+        return calibration
 
+    _logger.info("Building CPU speed calibration locally")
+    calibration = _build_calibration(node_id)
+    store.put_local(calibration)
 
-async def _should_build_poly(redis, key):
-    return not (await redis.get(key))
+    return calibration
 
 
-async def _lock_poly(redis, key):
-    val = json.dumps(None)
-    _logger.debug("SET %s %s", key, val)
-    await redis.set(key, val, expire=_EXPIRE_SECS, exist=redis.SET_IF_NOT_EXIST)
+async def _lock_calibration(redis, key):
+    lock_key = "{}:lock".format(key)
+    _logger.debug("SET NX %s", lock_key)
 
+    return await redis.set(
+        lock_key, socket.gethostname(),
+        expire=_LOCK_SECS, exist=redis.SET_IF_NOT_EXIST)
 
-async def _get_cpu_poly(redis_url, timeout=300, wait=2):
-    key = _get_cpu_poly_key()
 
-    if not key:
-        raise ValueError("Undefined CPU speed poly Redis key")
+async def get_calibration(conf, node_id, timeout=300, wait=2):
+    """Returns the CPU speed calibration of the node. Only one container
+    per Swarm node runs the benchmark: the others wait for it on Redis."""
 
-    _logger.debug("Connecting to Redis: %s", redis_url)
-    redis = await aioredis.create_redis_pool(redis_url)
+    store = _get_store(conf)
+    redis = await get_redis_manager(conf.redis_url).get()
+    calibration = await store.get(node_id, redis=redis)
 
-    if (await _should_build_poly(redis, key)):
-        _logger.info("Building CPU speed poly locally")
-        await _lock_poly(redis, key)
-        poly = _local_cpu_poly()
-        await _set_redis_poly(redis, key, poly)
-        return poly
+    if calibration:
+        _logger.info("Using stored CPU speed calibration: %s", calibration.key)
+        return calibration
 
-    _logger.info("Waiting for CPU speed poly on Redis")
+    key = get_calibration_key(node_id, get_cpu_model())
 
-    ini = time.time()
+    if (await _lock_calibration(redis, key)):
+        _logger.info("Building CPU speed calibration locally")
+        calibration = _build_calibration(node_id)
+        await store.put(calibration, redis=redis)
+        return calibration
 
-    def _raise_timeout():
-        if timeout is None:
-            return
+    _logger.info("Waiting for CPU speed calibration on Redis")
 
-        if (time.time() - ini) >= timeout:
-            raise Exception("Timeout waiting for Redis poly")
+    ini = time.time()
 
     while True:
-        poly = await _get_redis_poly(redis, key)
+        calibration = await store.get_redis(redis, node_id)
+
+        if calibration:
+            store.put_local(calibration)
+            return calibration
 
-        if poly:
-            return poly
-        else:
-            await asyncio.sleep(wait)
+        if timeout is not None and (time.time() - ini) >= timeout:
+            raise asyncio.TimeoutError("Timeout waiting for CPU speed calibration")
 
-        _raise_timeout()
+        await asyncio.sleep(wait)
+
+
+async def _get_calibration_close(*args, **kwargs):
+    try:
+        return await get_calibration(*args, **kwargs)
+    finally:
+        await close_redis_managers()
 
 
 def update_limits(conf, docker_url, speed, timeout, wait, local):
     ping_docker(docker_url=docker_url)
 
-    cpu_poly = None
+    node_id = _get_node_id()
+    calibration = None
 
     if not local:
         _logger.debug((
-            "Attempting to build the CPU speed poly "
+            "Attempting to get the CPU speed calibration "
             "in a distributed fashion using Redis as a "
             "central cache to avoid overloading the host "
             "with multiple parallel CPU speed benchmarks"
@@ -116,17 +129,18 @@ def update_limits(conf, docker_url, speed, timeout, wait, local):
 
         try:
             loop = asyncio.get_event_loop()
-            cpu_poly_fut = _get_cpu_poly(conf.redis_url, timeout, wait)
-            cpu_poly = loop.run_until_complete(cpu_poly_fut)
+            calibration_fut = _get_calibration_close(conf, node_id, timeout, wait)
+            calibration = loop.run_until_complete(calibration_fut)
         except Exception as ex:
-            _logger.warning("Error getting CPU poly from Redis: %s", repr(ex))
+            _logger.warning("Error getting CPU calibration from Redis: %s", repr(ex))
+
+    if not calibration:
+        calibration = get_local_calibration(conf, node_id)
 
-    if not cpu_poly:
-        _logger.info("Forced to build local CPU speed poly")
-        cpu_poly = _local_cpu_poly()
+    _logger.debug("CPU speed model: %s", calibration.model)
 
     _logger.debug("Calculating the CPU scale to match target speed: %s", speed)
-    speed_scale = get_cpu_core_scale(speed, core_poly=cpu_poly)
+    speed_scale = get_cpu_core_scale(speed, model=calibration.speed_model)
 
     _logger.debug("Getting current container to update CPU limits")
     cid = get_current_container_id()
@@ -7,6 +7,7 @@ import click
 import coloredlogs
 import wotemu.cli.app
 import wotemu.cli.broker
+import wotemu.cli.calibrate
 import wotemu.cli.chaos
 import wotemu.cli.compose
 import wotemu.cli.limits
@@ -14,6 +15,7 @@ import wotemu.cli.report
 import wotemu.cli.routes
 import wotemu.cli.stop
 import wotemu.cli.waiter
+import wotemu.cli.watch
 import wotemu.config
 
 _COMMAND_KWARGS = {
@@ -95,6 +97,7 @@ def chaos(conf, **kwargs):
 @click.option("--enable-mqtt", is_flag=True)
 @click.option("--enable-ws", is_flag=True)
 @click.option("--disable-monitor", is_flag=True)
+@click.option("--enable-loop-monitor", is_flag=True)
 @click.pass_obj
 @_catch
 def app(conf, **kwargs):
@@ -129,6 +132,22 @@ def limits(conf, **kwargs):
     wotemu.cli.limits.update_limits(conf, **kwargs)
 
 
+@cli.command(**_COMMAND_KWARGS)
+@click.option("--docker-url", default=_DEFAULT_DOCKER_SOCK)
+@click.option("--local", is_flag=True)
+@click.option("--force", is_flag=True)
+@click.option("--timeout", type=int, default=1800)
+@click.option("--wait", type=int, default=5)
+@click.pass_obj
+@_catch
+def calibrate(conf, **kwargs):
+    """Pre-warms the CPU speed calibrations of all the Swarm nodes
+    (or only the current host if --local is set). Must be executed
+    in a manager node."""
+
+    wotemu.cli.calibrate.calibrate(conf, **kwargs)
+
+
 @cli.command(**_COMMAND_KWARGS)
 @click.option("--sleep", type=float, default=1.0)
 @click.option("--timeout", type=float, default=60.0)
@@ -152,6 +171,21 @@ def broker(conf, **kwargs):
     wotemu.cli.broker.run_mqtt_broker(conf, **kwargs)
 
 
+@cli.command(**_COMMAND_KWARGS)
+@click.option("--debounce", type=float, default=1.0)
+@click.option("--interval", type=float, default=15.0)
+@click.option("--converge", type=float, default=30.0)
+@click.pass_obj
+@_catch
+def watch(conf, **kwargs):
+    """Subscribes to the Docker events stream and publishes the 
+    task, service and gateway mappings of the stack in Redis.
+    Mappings are refreshed more often for a while after
+    service or node events (tasks in other Swarm nodes)."""
+
+    wotemu.cli.watch.run_watch(conf, **kwargs)
+
+
 @cli.command(**_COMMAND_KWARGS)
 @click.option("--compose-file", required=True)
 @click.option("--stack", required=True)
@@ -170,7 +204,7 @@ def stop(conf, **kwargs):
 @cli.command(**_COMMAND_KWARGS)
 @click.option("--out", required=True)
 @click.option("--stack", default=None)
-@click.option("--redis-url", default=None)
+@click.option("--redis-url", multiple=True)
 @click.option("--json", is_flag=True)
 @click.pass_obj
 @_catch
@@ -3,15 +3,15 @@ import logging
 from datetime import datetime
 from pathlib import Path
 
-from wotemu.cli.utils import find_stack_redis_port
+from wotemu.cli.utils import find_stack_redis_ports
 from wotemu.report.builder import ReportBuilder
 from wotemu.report.reader import ReportDataRedisReader
 
 _logger = logging.getLogger(__name__)
 
 
-async def _connect_and_build(redis_url, base_path, as_json, file_name):
-    reader = ReportDataRedisReader(redis_url=redis_url)
+async def _connect_and_build(redis_urls, base_path, as_json, file_name):
+    reader = ReportDataRedisReader(redis_url=redis_urls)
 
     try:
         await reader.connect()
@@ -43,11 +43,15 @@ def build_report(conf, out, stack, redis_url, as_json):
             "to provide the name of the stack."
         ))
 
-    if not redis_url:
-        redis_port = find_stack_redis_port(stack=stack)
-        redis_url = f"redis://127.0.0.1:{redis_port}"
+    if isinstance(redis_url, str):
+        redis_url = [redis_url]
 
-    _logger.info("Using Redis URL: %s", redis_url)
+    redis_urls = list(redis_url) if redis_url else [
+        f"redis://127.0.0.1:{redis_port}"
+        for redis_port in find_stack_redis_ports(stack=stack)
+    ]
+
+    _logger.info("Using Redis URLs: %s", redis_urls)
 
     dtime = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
     file_name = f"wotemu_{dtime}"
@@ -56,7 +60,7 @@ def build_report(conf, out, stack, redis_url, as_json):
     loop = asyncio.get_event_loop()
 
     loop.run_until_complete(_connect_and_build(
-        redis_url=redis_url,
+        redis_urls=redis_urls,
         base_path=out,
         as_json=as_json,
         file_name=file_name))
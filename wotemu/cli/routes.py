@@ -1,103 +1,163 @@
+import asyncio
 import logging
 import pprint
 import subprocess
 
 import netaddr
-from wotemu.utils import (get_current_task, get_network_gateway_task,
-                          get_output_iface_for_task, get_task_networks,
-                          ping_docker)
+from wotemu.metadata import read_gateway_tasks
+from wotemu.utils import get_output_iface_for_task, ping_docker
 
 _PATH_IPROUTE2_RT_TABLES = "/etc/iproute2/rt_tables"
+_MULTIPORT_MAX = 15
+_IPTABLES_TABLE = "mangle"
 
 _logger = logging.getLogger(__name__)
 _rtindex = None
 
 
-def _next_rtable_index():
-    def exists_rtable(rtidx):
-        cmd = "grep -q '{}\\s.*' /etc/iproute2/rt_tables".format(rtidx)
-        return subprocess.run(cmd, shell=True).returncode == 0
+def _read_rtables():
+    try:
+        with open(_PATH_IPROUTE2_RT_TABLES, "r") as fh:
+            lines = [line.split("#", 1)[0].split() for line in fh]
+    except FileNotFoundError:
+        return {}
+
+    return {
+        int(parts[0]): parts[1]
+        for parts in lines
+        if len(parts) >= 2 and parts[0].isdigit()
+    }
 
+
+def _next_rtable_index():
     global _rtindex
 
     if _rtindex is None:
+        rtables = _read_rtables()
+
         _rtindex = next(
             idx for idx in reversed(range(10, 201))
-            if not exists_rtable(idx))
+            if idx not in rtables)
 
     return _rtindex
 
 
 def _rtable_exists(rtable_name):
     route_show_res = subprocess.run(
-        "ip route show table {}".format(rtable_name),
-        shell=True,
+        ["ip", "route", "show", "table", rtable_name],
         check=False,
         capture_output=True)
 
     return route_show_res.returncode == 0
 
 
-def _build_routing_commands(gw_task, ports_tcp, ports_udp, rtable_name, rtable_mark):
-    cmds = []
+def _register_rtable(rtindex, rtable_name):
+    if _read_rtables().get(rtindex) == rtable_name:
+        return
+
+    with open(_PATH_IPROUTE2_RT_TABLES, "a") as fh:
+        fh.write("{} {}\n".format(rtindex, rtable_name))
+
+
+def _rule_exists(rtindex, rtable_mark):
+    rule_res = subprocess.run(
+        ["ip", "rule", "show", "fwmark", hex(rtable_mark), "table", str(rtindex)],
+        check=False,
+        capture_output=True)
+
+    return rule_res.returncode == 0 and bool(rule_res.stdout.strip())
+
+
+def _jump_exists(chain):
+    check_res = subprocess.run(
+        ["iptables", "-t", _IPTABLES_TABLE, "-C", "OUTPUT", "-j", chain],
+        check=False,
+        capture_output=True)
+
+    return check_res.returncode == 0
+
+
+def _get_chain_name(rtable_name):
+    return "{}_OUTPUT".format(rtable_name.upper())[:28]
+
+
+def _unique_ports(ports):
+    return [str(port) for port in dict.fromkeys(ports) if port]
 
-    rtindex = _next_rtable_index()
 
-    cmds.append("grep -Fxq \"{idx} {name}\" {path} || echo \"{idx} {name}\" >> {path}".format(
-        idx=rtindex,
-        name=rtable_name,
-        path=_PATH_IPROUTE2_RT_TABLES))
+def _chunks(items, size):
+    return [items[idx:idx + size] for idx in range(0, len(items), size)]
 
+
+def get_gateway_route(gw_task):
     ifname, ifaddr = get_output_iface_for_task(gw_task)
 
     ifcidr = netaddr.IPNetwork("{}/{}".format(
         ifaddr["addr"], ifaddr["netmask"])).cidr
 
-    cmds.append("ip route add {} via {} onlink dev {} proto kernel src {} table {}".format(
-        ifcidr,
-        gw_task["EndpointIP"],
-        ifname,
-        ifaddr["addr"],
-        rtable_name))
-
-    cmds.append("ip rule add fwmark {} table {}".format(
-        hex(rtable_mark),
-        rtable_name))
-
-    def build_iptables_rules(proto, dport):
-        return [
-            "iptables -A OUTPUT -t mangle -o {} -p {} --dport {} -j MARK --set-mark {}".format(
-                ifname,
-                proto,
-                dport,
-                rtable_mark),
-            "iptables -A OUTPUT -t mangle -o {} -p {} --sport {} -j MARK --set-mark {}".format(
-                ifname,
-                proto,
-                dport,
-                rtable_mark)
-        ]
-
-    cmds += [
-        rule
-        for port in ports_tcp
-        for rule in build_iptables_rules("tcp", port)
-    ]
+    return {
+        "ifname": ifname,
+        "addr": ifaddr["addr"],
+        "cidr": str(ifcidr),
+        "gateway": gw_task["EndpointIP"]
+    }
 
-    cmds += [
-        rule
-        for port in ports_udp
-        for rule in build_iptables_rules("udp", port)
+
+def build_ip_batch(routes, rtindex, rtable_mark, add_rule=True):
+    """Builds the input of 'ip -batch' for the given gateway routes.
+    Routes are replaced so that the batch can be applied again."""
+
+    cmds = [
+        "route replace {} via {} onlink dev {} proto kernel src {} table {}".format(
+            route["cidr"],
+            route["gateway"],
+            route["ifname"],
+            route["addr"],
+            rtindex)
+        for route in routes
     ]
 
+    if add_rule:
+        cmds.append("rule add fwmark {} table {}".format(hex(rtable_mark), rtindex))
+
     return cmds
 
 
-def _run_commands(cmds):
-    for cmd in cmds:
-        _logger.info("# %s", cmd)
-        ret = subprocess.run(cmd, shell=True, check=True)
-        _logger.info("%s", ret)
+def build_iptables_ruleset(routes, ports_tcp, ports_udp, chain, rtable_mark, add_jump=True):
+    """Builds the input of 'iptables-restore --noflush'. The marking rules
+    live in a dedicated chain that is flushed and rebuilt on each restore,
+    and the multiport match keeps the ruleset size independent of the ports."""
+
+    lines = [
+        "*{}".format(_IPTABLES_TABLE),
+        ":{} - [0:0]".format(chain)
+    ]
+
+    if add_jump:
+        lines.append("-A OUTPUT -j {}".format(chain))
+
+    protos = [
+        ("tcp", _unique_ports(ports_tcp)),
+        ("udp", _unique_ports(ports_udp))
+    ]
+
+    for route in routes:
+        for proto, ports in protos:
+            for chunk in _chunks(ports, _MULTIPORT_MAX):
+                for match in ("--dports", "--sports"):
+                    lines.append((
+                        "-A {} -o {} -p {} -m multiport {} {} "
+                        "-j MARK --set-mark {}"
+                    ).format(chain, route["ifname"], proto, match, ",".join(chunk), rtable_mark))
+
+    lines.append("COMMIT")
+
+    return lines
+
+
+def _run_batch(args, lines):
+    _logger.info("# %s\n%s", " ".join(args), "\n".join(lines))
+    subprocess.run(args, input="\n".join(lines) + "\n", check=True, universal_newlines=True)
 
 
 def update_routing(conf, rtable_name, rtable_mark, apply):
@@ -126,48 +186,55 @@ def update_routing(conf, rtable_name, rtable_mark, apply):
         _logger.info("Table '%s' exists: Skip configuration", rtable_name)
         return
 
-    task = get_current_task(docker_url=docker_url)
-    network_ids = get_task_networks(docker_url=docker_url, task=task)
-
-    gw_tasks = {}
+    loop = asyncio.get_event_loop()
 
-    for net_id in network_ids:
-        try:
-            the_gw_task = get_network_gateway_task(
-                docker_url=docker_url,
-                network_id=net_id)
-        except:
-            _logger.error("Error finding gateway task", exc_info=True)
+    try:
+        gw_tasks = loop.run_until_complete(read_gateway_tasks(conf))
+        assert all(gw_tasks.values())
+    except:
+        _logger.error("Error finding gateway tasks", exc_info=True)
 
-            raise RuntimeError((
-                "Could not find gateway task for network {}. "
-                "This was probably due to the fact that "
-                "the task was not fully initialized yet."
-            ).format(net_id))
-
-        gw_tasks.update({net_id: the_gw_task})
+        raise RuntimeError((
+            "Could not find the gateway tasks. "
+            "This was probably due to the fact that "
+            "the tasks were not fully initialized yet."
+        ))
 
     _logger.debug(
         "Gateway tasks:\n%s",
         pprint.pformat(gw_tasks))
 
-    gw_commands = {
-        net_id: _build_routing_commands(
-            gw_task=task,
-            ports_tcp=ports_tcp,
-            ports_udp=ports_udp,
-            rtable_name=rtable_name,
-            rtable_mark=rtable_mark)
-        for net_id, task in gw_tasks.items()
-    }
+    routes = [get_gateway_route(task) for task in gw_tasks.values()]
+    rtindex = _next_rtable_index()
+    chain = _get_chain_name(rtable_name)
+
+    ip_batch = build_ip_batch(
+        routes=routes,
+        rtindex=rtindex,
+        rtable_mark=rtable_mark,
+        add_rule=not _rule_exists(rtindex, rtable_mark))
+
+    iptables_ruleset = build_iptables_ruleset(
+        routes=routes,
+        ports_tcp=ports_tcp,
+        ports_udp=ports_udp,
+        chain=chain,
+        rtable_mark=rtable_mark,
+        add_jump=not _jump_exists(chain))
 
     _logger.info(
-        "Routing commands:\n%s",
-        pprint.pformat(gw_commands))
+        "Routing configuration (table %s=%s):\n%s",
+        rtindex, rtable_name,
+        pprint.pformat({"ip": ip_batch, "iptables": iptables_ruleset}))
 
     if not apply:
         _logger.warning("Dry run: Skip configuration update")
         return
 
-    for cmds in gw_commands.values():
-        _run_commands(cmds)
+    _run_batch(["ip", "-batch", "-"], ip_batch)
+    _run_batch(["iptables-restore", "--noflush"], iptables_ruleset)
+
+    # The table name is registered last: its existence
+    # marks the configuration as completely applied
+
+    _register_rtable(rtindex, rtable_name)
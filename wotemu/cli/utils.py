@@ -19,23 +19,50 @@ def find_stack_services(stack, api_client=None):
     ]
 
 
-def find_stack_redis_port(stack, api_client=None):
-    _logger.info("Finding publicly exposed Redis port for stack: %s", stack)
+def _get_redis_shard(service):
+    labels = service.get("Spec", {}).\
+        get("TaskTemplate", {}).\
+        get("ContainerSpec", {}).\
+        get("Labels", {})
 
-    services = find_stack_services(stack=stack, api_client=api_client)
+    shard = labels.get(Labels.WOTEMU_REDIS.value, None)
 
-    redis_service = next(
-        item
-        for item in services
-        if item.get("Spec", {}).
-        get("TaskTemplate", {}).
-        get("ContainerSpec", {}).
-        get("Labels", {}).
-        get(Labels.WOTEMU_REDIS.value, None) is not None)
+    if shard is None:
+        return None
 
-    _logger.debug("Found Redis service:\n%s", pprint.pformat(redis_service))
+    try:
+        return int(shard)
+    except ValueError:
+        return 0
 
+
+def _get_published_redis_port(service):
     return next(
         item["PublishedPort"]
-        for item in redis_service["Endpoint"]["Ports"]
+        for item in service["Endpoint"]["Ports"]
         if item["TargetPort"] == _REDIS_PORT and item["Protocol"] == "tcp")
+
+
+def find_stack_redis_ports(stack, api_client=None):
+    """Returns the publicly exposed ports of all the Redis shards
+    of the stack. The port of the main instance comes first."""
+
+    _logger.info("Finding publicly exposed Redis ports for stack: %s", stack)
+
+    services = find_stack_services(stack=stack, api_client=api_client)
+
+    redis_services = sorted(
+        (item for item in services if _get_redis_shard(item) is not None),
+        key=_get_redis_shard)
+
+    if not redis_services:
+        raise ValueError("No Redis services found for stack: {}".format(stack))
+
+    for item in redis_services:
+        _logger.debug("Found Redis service:\n%s", pprint.pformat(item))
+
+    return [_get_published_redis_port(item) for item in redis_services]
+
+
+def find_stack_redis_port(stack, api_client=None):
+    return find_stack_redis_ports(stack=stack, api_client=api_client)[0]
@@ -36,17 +36,25 @@ def _ping_docker(docker_url):
         return False
 
 
-async def _wait_base(redis_url, docker_url, sleep):
+async def _wait_base(redis_url, docker_url, sleep, redis_telemetry_url=None):
     while not (await _ping_redis(redis_url)):
         await asyncio.sleep(sleep)
 
+    while redis_telemetry_url and redis_telemetry_url != redis_url \
+            and not (await _ping_redis(redis_telemetry_url)):
+        await asyncio.sleep(sleep)
+
     while not _ping_docker(docker_url):
         await asyncio.sleep(sleep)
 
 
-def _wait_base_timeout(redis_url, docker_url, sleep, timeout):
+def _wait_base_timeout(redis_url, docker_url, sleep, timeout, redis_telemetry_url=None):
     loop = asyncio.get_event_loop()
-    base_aw = _wait_base(redis_url, docker_url, sleep)
+
+    base_aw = _wait_base(
+        redis_url, docker_url, sleep,
+        redis_telemetry_url=redis_telemetry_url)
+
     loop.run_until_complete(asyncio.wait_for(base_aw, timeout=timeout))
 
 
@@ -86,6 +94,7 @@ def wait_services(conf, sleep, timeout, waiter_base, waiter_mqtt):
 
             _wait_base_timeout(
                 redis_url=conf.redis_url,
+                redis_telemetry_url=conf.redis_telemetry_url,
                 docker_url=conf.docker_proxy_url,
                 sleep=sleep,
                 timeout=timeout)
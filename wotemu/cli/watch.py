@@ -0,0 +1,126 @@
+import asyncio
+import logging
+import signal
+import threading
+
+import aioredis
+import docker
+from wotemu.metadata import build_metadata, publish_metadata
+
+_EVENT_TYPES = ["service", "node", "network", "container"]
+
+# Container events are only emitted by the local node, while service
+# and node events are emitted by the managers for the whole Swarm.
+# Tasks in other nodes converge some time after the latter, hence the
+# metadata is refreshed periodically during a window after them.
+
+_SWARM_EVENT_TYPES = {"service", "node"}
+_CONVERGE_STEP = 2.0
+
+_logger = logging.getLogger(__name__)
+
+
+def _consume_events(docker_url, loop, queue, stop_event):
+    """Blocking consumer of the Docker events stream (runs in a thread)."""
+
+    docker_api_client = docker.APIClient(base_url=docker_url)
+
+    while not stop_event.is_set():
+        try:
+            events = docker_api_client.events(
+                decode=True,
+                filters={"type": _EVENT_TYPES})
+
+            for event in events:
+                if stop_event.is_set():
+                    break
+
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+        except Exception as ex:
+            _logger.warning("Error in Docker events stream: %s", repr(ex))
+            stop_event.wait(1.0)
+
+
+async def _refresh(conf, redis):
+    loop = asyncio.get_event_loop()
+
+    metadata = await loop.run_in_executor(
+        None, build_metadata, conf.docker_proxy_url)
+
+    await publish_metadata(redis, metadata)
+
+    _logger.debug(
+        "Published metadata (%s)",
+        {key: len(val) for key, val in metadata.items()})
+
+
+async def _watch(conf, debounce, interval, converge):
+    loop = asyncio.get_event_loop()
+    queue = asyncio.Queue()
+    stop_event = threading.Event()
+
+    consumer = threading.Thread(
+        target=_consume_events,
+        args=(conf.docker_proxy_url, loop, queue, stop_event),
+        daemon=True)
+
+    consumer.start()
+
+    redis = await aioredis.create_redis_pool(conf.redis_url)
+
+    converge_until = 0
+
+    try:
+        while True:
+            try:
+                await _refresh(conf, redis)
+            except Exception as ex:
+                _logger.warning("Error refreshing metadata: %s", repr(ex))
+
+            timeout = interval
+
+            if loop.time() < converge_until:
+                timeout = min(interval, _CONVERGE_STEP)
+
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=timeout)
+                _logger.debug("Docker event: %s %s", event.get("Type"), event.get("Action"))
+            except asyncio.TimeoutError:
+                continue
+
+            # Events arrive in bursts (e.g. on scale-ups)
+
+            await asyncio.sleep(debounce)
+
+            events = [event]
+
+            while not queue.empty():
+                events.append(queue.get_nowait())
+
+            if any(item.get("Type") in _SWARM_EVENT_TYPES for item in events):
+                converge_until = loop.time() + converge
+    except asyncio.CancelledError:
+        _logger.debug("Cancelled watch task")
+    finally:
+        stop_event.set()
+        redis.close()
+        await redis.wait_closed()
+
+
+def run_watch(conf, debounce, interval, converge):
+    loop = asyncio.get_event_loop()
+
+    watch_task = asyncio.ensure_future(_watch(
+        conf, debounce=debounce, interval=interval, converge=converge))
+
+    def sig_handler():
+        _logger.debug("Received stop signal")
+        watch_task.cancel()
+
+    for name in {"SIGINT", "SIGTERM"}:
+        loop.add_signal_handler(getattr(signal, name), sig_handler)
+
+    try:
+        loop.run_until_complete(watch_task)
+    finally:
+        loop.close()
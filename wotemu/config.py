@@ -3,10 +3,13 @@ import enum
 import logging
 import os
 import pprint
+import tempfile
 
 DEFAULT_DOCKER_SOCKET = "/var/run/docker.sock"
 DEFAULT_HOST_REDIS = "redis"
 DEFAULT_HOST_DOCKER_PROXY = "docker_api_proxy"
+DEFAULT_HOST_DOCKER_WATCH = "docker_watch"
+DEFAULT_CALIBRATION_DIR = "/var/lib/wotemu/calibration"
 
 _DEFAULT_PORT_CATALOGUE = 9090
 _DEFAULT_PORT_HTTP = 80
@@ -15,6 +18,28 @@ _DEFAULT_PORT_COAP = 5683
 _DEFAULT_PORT_MQTT = 1883
 _DEFAULT_REDIS_URL = "redis://{}".format(DEFAULT_HOST_REDIS)
 _DEFAULT_DOCKER_PROXY_URL = "tcp://{}:2375/".format(DEFAULT_HOST_DOCKER_PROXY)
+_DEFAULT_REDIS_BACKEND = "zset"
+_DEFAULT_REDIS_STREAM_MAXLEN = 100000
+_DEFAULT_WRITER_BUFFER_SIZE = 10000
+_DEFAULT_WRITER_FLUSH_SIZE = 500
+_DEFAULT_WRITER_FLUSH_INTERVAL = 1.0
+_DEFAULT_WRITER_POLICY = "drop"
+_DEFAULT_WRITER_WRITE_TIMEOUT = 5.0
+_DEFAULT_WRITER_SPOOL_DIR = os.path.join(tempfile.gettempdir(), "wotemu-spool")
+_DEFAULT_WRITER_SPOOL_MAX_BYTES = 64 * 1024 * 1024
+_DEFAULT_SYSTEM_INTERVAL = 5.0
+_DEFAULT_SYSTEM_GROUP_SIZE = 2
+_DEFAULT_DOCKER_CACHE_TTL = 10.0
+_DEFAULT_THING_CACHE_TTL = 30.0
+_DEFAULT_HTTP_MAX_CLIENTS = 50
+_DEFAULT_HTTP_MAX_HOST_CONNECTIONS = 4
+_DEFAULT_REDIS_POOL_SIZE = 4
+_DEFAULT_REDIS_HEALTH_INTERVAL = 10.0
+_DEFAULT_REDIS_RETENTION_INTERVAL = 30.0
+_DEFAULT_CALIBRATION_PATH = os.path.join(DEFAULT_CALIBRATION_DIR, "calibrations.json")
+_DEFAULT_CALIBRATION_MAX_AGE = 30 * 24 * 3600.0
+_DEFAULT_CPU_CONTROL_INTERVAL = 30.0
+_DEFAULT_CPU_CONTROL_PROBE = 0.5
 
 _logger = logging.getLogger(__name__)
 
@@ -30,7 +55,35 @@ EnvConfig = collections.namedtuple(
         "mqtt_broker_host",
         "mqtt_url",
         "redis_url",
+        "redis_telemetry_url",
+        "redis_backend",
+        "redis_stream_maxlen",
+        "writer_buffer_size",
+        "writer_flush_size",
+        "writer_flush_interval",
+        "writer_policy",
+        "writer_write_timeout",
+        "writer_spool_dir",
+        "writer_spool_max_bytes",
+        "system_interval",
+        "system_group_size",
+        "system_metrics",
         "docker_proxy_url",
+        "docker_cache_ttl",
+        "docker_watch",
+        "thing_cache_ttl",
+        "http_max_clients",
+        "http_max_host_connections",
+        "http_keep_alive",
+        "redis_pool_size",
+        "redis_health_interval",
+        "redis_retention",
+        "redis_retention_interval",
+        "calibration_path",
+        "calibration_max_age",
+        "cpu_control",
+        "cpu_control_interval",
+        "cpu_control_probe",
         "other_ports_tcp",
         "other_ports_udp"
     ])
@@ -44,7 +97,35 @@ class ConfigVars(enum.Enum):
     PORT_MQTT = "PORT_MQTT"
     MQTT_BROKER_HOST = "MQTT_BROKER_HOST"
     REDIS_URL = "REDIS_URL"
+    REDIS_TELEMETRY_URL = "REDIS_TELEMETRY_URL"
+    REDIS_BACKEND = "REDIS_BACKEND"
+    REDIS_STREAM_MAXLEN = "REDIS_STREAM_MAXLEN"
+    WRITER_BUFFER_SIZE = "WRITER_BUFFER_SIZE"
+    WRITER_FLUSH_SIZE = "WRITER_FLUSH_SIZE"
+    WRITER_FLUSH_INTERVAL = "WRITER_FLUSH_INTERVAL"
+    WRITER_POLICY = "WRITER_POLICY"
+    WRITER_WRITE_TIMEOUT = "WRITER_WRITE_TIMEOUT"
+    WRITER_SPOOL_DIR = "WRITER_SPOOL_DIR"
+    WRITER_SPOOL_MAX_BYTES = "WRITER_SPOOL_MAX_BYTES"
+    SYSTEM_INTERVAL = "SYSTEM_INTERVAL"
+    SYSTEM_GROUP_SIZE = "SYSTEM_GROUP_SIZE"
+    SYSTEM_METRICS = "SYSTEM_METRICS"
     DOCKER_PROXY_URL = "DOCKER_PROXY_URL"
+    DOCKER_CACHE_TTL = "DOCKER_CACHE_TTL"
+    DOCKER_WATCH = "DOCKER_WATCH"
+    THING_CACHE_TTL = "THING_CACHE_TTL"
+    HTTP_MAX_CLIENTS = "HTTP_MAX_CLIENTS"
+    HTTP_MAX_HOST_CONNECTIONS = "HTTP_MAX_HOST_CONNECTIONS"
+    HTTP_KEEP_ALIVE = "HTTP_KEEP_ALIVE"
+    REDIS_POOL_SIZE = "REDIS_POOL_SIZE"
+    REDIS_HEALTH_INTERVAL = "REDIS_HEALTH_INTERVAL"
+    REDIS_RETENTION = "REDIS_RETENTION"
+    REDIS_RETENTION_INTERVAL = "REDIS_RETENTION_INTERVAL"
+    CALIBRATION_PATH = "CALIBRATION_PATH"
+    CALIBRATION_MAX_AGE = "CALIBRATION_MAX_AGE"
+    CPU_CONTROL = "CPU_CONTROL"
+    CPU_CONTROL_INTERVAL = "CPU_CONTROL_INTERVAL"
+    CPU_CONTROL_PROBE = "CPU_CONTROL_PROBE"
     OTHER_PORTS_TCP = "OTHER_PORTS_TCP"
     OTHER_PORTS_UDP = "OTHER_PORTS_UDP"
 
@@ -57,7 +138,35 @@ DEFAULT_CONFIG_VARS = {
     ConfigVars.PORT_MQTT: _DEFAULT_PORT_MQTT,
     ConfigVars.MQTT_BROKER_HOST: None,
     ConfigVars.REDIS_URL: _DEFAULT_REDIS_URL,
+    ConfigVars.REDIS_TELEMETRY_URL: None,
+    ConfigVars.REDIS_BACKEND: _DEFAULT_REDIS_BACKEND,
+    ConfigVars.REDIS_STREAM_MAXLEN: _DEFAULT_REDIS_STREAM_MAXLEN,
+    ConfigVars.WRITER_BUFFER_SIZE: _DEFAULT_WRITER_BUFFER_SIZE,
+    ConfigVars.WRITER_FLUSH_SIZE: _DEFAULT_WRITER_FLUSH_SIZE,
+    ConfigVars.WRITER_FLUSH_INTERVAL: _DEFAULT_WRITER_FLUSH_INTERVAL,
+    ConfigVars.WRITER_POLICY: _DEFAULT_WRITER_POLICY,
+    ConfigVars.WRITER_WRITE_TIMEOUT: _DEFAULT_WRITER_WRITE_TIMEOUT,
+    ConfigVars.WRITER_SPOOL_DIR: _DEFAULT_WRITER_SPOOL_DIR,
+    ConfigVars.WRITER_SPOOL_MAX_BYTES: _DEFAULT_WRITER_SPOOL_MAX_BYTES,
+    ConfigVars.SYSTEM_INTERVAL: _DEFAULT_SYSTEM_INTERVAL,
+    ConfigVars.SYSTEM_GROUP_SIZE: _DEFAULT_SYSTEM_GROUP_SIZE,
+    ConfigVars.SYSTEM_METRICS: None,
     ConfigVars.DOCKER_PROXY_URL: _DEFAULT_DOCKER_PROXY_URL,
+    ConfigVars.DOCKER_CACHE_TTL: _DEFAULT_DOCKER_CACHE_TTL,
+    ConfigVars.DOCKER_WATCH: 0,
+    ConfigVars.THING_CACHE_TTL: _DEFAULT_THING_CACHE_TTL,
+    ConfigVars.HTTP_MAX_CLIENTS: _DEFAULT_HTTP_MAX_CLIENTS,
+    ConfigVars.HTTP_MAX_HOST_CONNECTIONS: _DEFAULT_HTTP_MAX_HOST_CONNECTIONS,
+    ConfigVars.HTTP_KEEP_ALIVE: 1,
+    ConfigVars.REDIS_POOL_SIZE: _DEFAULT_REDIS_POOL_SIZE,
+    ConfigVars.REDIS_HEALTH_INTERVAL: _DEFAULT_REDIS_HEALTH_INTERVAL,
+    ConfigVars.REDIS_RETENTION: None,
+    ConfigVars.REDIS_RETENTION_INTERVAL: _DEFAULT_REDIS_RETENTION_INTERVAL,
+    ConfigVars.CALIBRATION_PATH: _DEFAULT_CALIBRATION_PATH,
+    ConfigVars.CALIBRATION_MAX_AGE: _DEFAULT_CALIBRATION_MAX_AGE,
+    ConfigVars.CPU_CONTROL: 0,
+    ConfigVars.CPU_CONTROL_INTERVAL: _DEFAULT_CPU_CONTROL_INTERVAL,
+    ConfigVars.CPU_CONTROL_PROBE: _DEFAULT_CPU_CONTROL_PROBE,
     ConfigVars.OTHER_PORTS_TCP: None,
     ConfigVars.OTHER_PORTS_UDP: None
 }
@@ -74,6 +183,21 @@ def _getenv_int(name, default):
         return default
 
 
+def _getenv_float(name, default):
+    try:
+        return float(os.getenv(name, default))
+    except:
+        _logger.warning(
+            "Unexpected float value (%s) in variable %s: Using default (%s)",
+            os.getenv(name), name, default)
+
+        return default
+
+
+def _parse_list(val):
+    return [item.strip() for item in val.split(",") if item.strip()]
+
+
 def _parse_ports(val):
     try:
         return [int(item) for item in val.split(",")]
@@ -111,10 +235,126 @@ def get_env_config():
         ConfigVars.REDIS_URL.value,
         DEFAULT_CONFIG_VARS.get(ConfigVars.REDIS_URL))
 
+    # Telemetry may be written to a Redis shard other than the main instance
+
+    redis_telemetry_url = os.getenv(
+        ConfigVars.REDIS_TELEMETRY_URL.value,
+        DEFAULT_CONFIG_VARS.get(ConfigVars.REDIS_TELEMETRY_URL)) or redis_url
+
+    redis_backend = os.getenv(
+        ConfigVars.REDIS_BACKEND.value,
+        DEFAULT_CONFIG_VARS.get(ConfigVars.REDIS_BACKEND))
+
+    redis_stream_maxlen = _getenv_int(
+        ConfigVars.REDIS_STREAM_MAXLEN.value,
+        DEFAULT_CONFIG_VARS.get(ConfigVars.REDIS_STREAM_MAXLEN))
+
+    writer_buffer_size = _getenv_int(
+        ConfigVars.WRITER_BUFFER_SIZE.value,
+        DEFAULT_CONFIG_VARS.get(ConfigVars.WRITER_BUFFER_SIZE))
+
+    writer_flush_size = _getenv_int(
+        ConfigVars.WRITER_FLUSH_SIZE.value,
+        DEFAULT_CONFIG_VARS.get(ConfigVars.WRITER_FLUSH_SIZE))
+
+    writer_flush_interval = _getenv_float(
+        ConfigVars.WRITER_FLUSH_INTERVAL.value,
+        DEFAULT_CONFIG_VARS.get(ConfigVars.WRITER_FLUSH_INTERVAL))
+
+    writer_policy = os.getenv(
+        ConfigVars.WRITER_POLICY.value,
+        DEFAULT_CONFIG_VARS.get(ConfigVars.WRITER_POLICY))
+
+    writer_write_timeout = _getenv_float(
+        ConfigVars.WRITER_WRITE_TIMEOUT.value,
+        DEFAULT_CONFIG_VARS.get(ConfigVars.WRITER_WRITE_TIMEOUT))
+
+    writer_spool_dir = os.getenv(
+        ConfigVars.WRITER_SPOOL_DIR.value,
+        DEFAULT_CONFIG_VARS.get(ConfigVars.WRITER_SPOOL_DIR))
+
+    writer_spool_max_bytes = _getenv_int(
+        ConfigVars.WRITER_SPOOL_MAX_BYTES.value,
+        DEFAULT_CONFIG_VARS.get(ConfigVars.WRITER_SPOOL_MAX_BYTES))
+
+    system_interval = _getenv_float(
+        ConfigVars.SYSTEM_INTERVAL.value,
+        DEFAULT_CONFIG_VARS.get(ConfigVars.SYSTEM_INTERVAL))
+
+    system_group_size = _getenv_int(
+        ConfigVars.SYSTEM_GROUP_SIZE.value,
+        DEFAULT_CONFIG_VARS.get(ConfigVars.SYSTEM_GROUP_SIZE))
+
+    system_metrics = os.getenv(
+        ConfigVars.SYSTEM_METRICS.value,
+        DEFAULT_CONFIG_VARS.get(ConfigVars.SYSTEM_METRICS))
+
+    system_metrics = system_metrics and _parse_list(system_metrics)
+
     docker_proxy_url = os.getenv(
         ConfigVars.DOCKER_PROXY_URL.value,
         DEFAULT_CONFIG_VARS.get(ConfigVars.DOCKER_PROXY_URL))
 
+    docker_cache_ttl = _getenv_float(
+        ConfigVars.DOCKER_CACHE_TTL.value,
+        DEFAULT_CONFIG_VARS.get(ConfigVars.DOCKER_CACHE_TTL))
+
+    thing_cache_ttl = _getenv_float(
+        ConfigVars.THING_CACHE_TTL.value,
+        DEFAULT_CONFIG_VARS.get(ConfigVars.THING_CACHE_TTL))
+
+    http_max_clients = _getenv_int(
+        ConfigVars.HTTP_MAX_CLIENTS.value,
+        DEFAULT_CONFIG_VARS.get(ConfigVars.HTTP_MAX_CLIENTS))
+
+    http_max_host_connections = _getenv_int(
+        ConfigVars.HTTP_MAX_HOST_CONNECTIONS.value,
+        DEFAULT_CONFIG_VARS.get(ConfigVars.HTTP_MAX_HOST_CONNECTIONS))
+
+    http_keep_alive = bool(_getenv_int(
+        ConfigVars.HTTP_KEEP_ALIVE.value,
+        DEFAULT_CONFIG_VARS.get(ConfigVars.HTTP_KEEP_ALIVE)))
+
+    redis_pool_size = _getenv_int(
+        ConfigVars.REDIS_POOL_SIZE.value,
+        DEFAULT_CONFIG_VARS.get(ConfigVars.REDIS_POOL_SIZE))
+
+    redis_health_interval = _getenv_float(
+        ConfigVars.REDIS_HEALTH_INTERVAL.value,
+        DEFAULT_CONFIG_VARS.get(ConfigVars.REDIS_HEALTH_INTERVAL))
+
+    redis_retention = os.getenv(
+        ConfigVars.REDIS_RETENTION.value,
+        DEFAULT_CONFIG_VARS.get(ConfigVars.REDIS_RETENTION))
+
+    redis_retention_interval = _getenv_float(
+        ConfigVars.REDIS_RETENTION_INTERVAL.value,
+        DEFAULT_CONFIG_VARS.get(ConfigVars.REDIS_RETENTION_INTERVAL))
+
+    calibration_path = os.getenv(
+        ConfigVars.CALIBRATION_PATH.value,
+        DEFAULT_CONFIG_VARS.get(ConfigVars.CALIBRATION_PATH))
+
+    calibration_max_age = _getenv_float(
+        ConfigVars.CALIBRATION_MAX_AGE.value,
+        DEFAULT_CONFIG_VARS.get(ConfigVars.CALIBRATION_MAX_AGE))
+
+    cpu_control = bool(_getenv_int(
+        ConfigVars.CPU_CONTROL.value,
+        DEFAULT_CONFIG_VARS.get(ConfigVars.CPU_CONTROL)))
+
+    cpu_control_interval = _getenv_float(
+        ConfigVars.CPU_CONTROL_INTERVAL.value,
+        DEFAULT_CONFIG_VARS.get(ConfigVars.CPU_CONTROL_INTERVAL))
+
+    cpu_control_probe = _getenv_float(
+        ConfigVars.CPU_CONTROL_PROBE.value,
+        DEFAULT_CONFIG_VARS.get(ConfigVars.CPU_CONTROL_PROBE))
+
+    docker_watch = bool(_getenv_int(
+        ConfigVars.DOCKER_WATCH.value,
+        DEFAULT_CONFIG_VARS.get(ConfigVars.DOCKER_WATCH)))
+
     other_ports_tcp = os.getenv(
         ConfigVars.OTHER_PORTS_TCP.value,
         DEFAULT_CONFIG_VARS.get(ConfigVars.OTHER_PORTS_TCP))
@@ -140,7 +380,35 @@ def get_env_config():
         mqtt_broker_host=mqtt_broker_host,
         mqtt_url=mqtt_url,
         redis_url=redis_url,
+        redis_telemetry_url=redis_telemetry_url,
+        redis_backend=redis_backend,
+        redis_stream_maxlen=redis_stream_maxlen,
+        writer_buffer_size=writer_buffer_size,
+        writer_flush_size=writer_flush_size,
+        writer_flush_interval=writer_flush_interval,
+        writer_policy=writer_policy,
+        writer_write_timeout=writer_write_timeout,
+        writer_spool_dir=writer_spool_dir,
+        writer_spool_max_bytes=writer_spool_max_bytes,
+        system_interval=system_interval,
+        system_group_size=system_group_size,
+        system_metrics=system_metrics,
         docker_proxy_url=docker_proxy_url,
+        docker_cache_ttl=docker_cache_ttl,
+        docker_watch=docker_watch,
+        thing_cache_ttl=thing_cache_ttl,
+        http_max_clients=http_max_clients,
+        http_max_host_connections=http_max_host_connections,
+        http_keep_alive=http_keep_alive,
+        redis_pool_size=redis_pool_size,
+        redis_health_interval=redis_health_interval,
+        redis_retention=redis_retention,
+        redis_retention_interval=redis_retention_interval,
+        calibration_path=calibration_path,
+        calibration_max_age=calibration_max_age,
+        cpu_control=cpu_control,
+        cpu_control_interval=cpu_control_interval,
+        cpu_control_probe=cpu_control_probe,
         other_ports_tcp=other_ports_tcp,
         other_ports_udp=other_ports_udp)
 
@@ -0,0 +1,159 @@
+"""Pooled Docker API client with a TTL cache for the lookups
+(tasks, services and networks) that are repeated on node startup.
+
+Task queries are resolved with a single bulk ``tasks()`` call that
+is filtered client-side instead of one filtered request per lookup.
+Discovery lookups that cannot tolerate stale data (e.g. the gateways
+and replicas that are being started) pass ``fresh=True`` to bypass
+the cache, which is then refreshed with the result.
+"""
+
+import copy
+import logging
+import threading
+import time
+
+import docker
+import wotemu.config
+
+_logger = logging.getLogger(__name__)
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+class CachedDockerAPI:
+    def __init__(self, docker_url, ttl=None):
+        conf = wotemu.config.get_env_config()
+        self.docker_url = docker_url
+        self.ttl = ttl if ttl is not None else conf.docker_cache_ttl
+        self._client = None
+        self._cache = {}
+        self._lock = threading.Lock()
+
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "errors": 0
+        }
+
+    @property
+    def client(self):
+        """The underlying APIClient, which keeps a pool of
+        connections that is reused across all the lookups."""
+
+        if self._client is None:
+            self._client = docker.APIClient(base_url=self.docker_url)
+
+        return self._client
+
+    @property
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "size": len(self._cache)}
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._cache = {}
+            else:
+                self._cache.pop(key, None)
+
+    def _cache_get(self, key):
+        with self._lock:
+            item = self._cache.get(key, None)
+
+            if item is None or (time.time() - item[0]) > self.ttl:
+                self._stats["misses"] += 1
+                return None
+
+            self._stats["hits"] += 1
+
+            return item[1]
+
+    def _cache_set(self, key, val):
+        with self._lock:
+            self._cache[key] = (time.time(), val)
+
+    def _cached(self, key, fetch, fresh=False):
+        val = self._cache_get(key) if not fresh else None
+
+        if val is not None:
+            return copy.deepcopy(val)
+
+        try:
+            val = fetch()
+        except Exception:
+            with self._lock:
+                self._stats["errors"] += 1
+
+            raise
+
+        self._cache_set(key, val)
+
+        return copy.deepcopy(val)
+
+    def tasks(self, fresh=False):
+        return self._cached(("tasks",), self.client.tasks, fresh=fresh)
+
+    def services(self):
+        return self._cached(("services",), self.client.services)
+
+    def inspect_network(self, net_id, verbose=False, fresh=False):
+        return self._cached(
+            ("network", net_id, verbose),
+            lambda: self.client.inspect_network(net_id, verbose=verbose),
+            fresh=fresh)
+
+    def inspect_task(self, task_id):
+        """Accepts task IDs or names (<service>.<slot>.<task_id>)."""
+
+        task = next((
+            item for item in self.tasks()
+            if item["ID"] == task_id or task_id.endswith(".{}".format(item["ID"]))), None)
+
+        if task:
+            return task
+
+        return self._cached(
+            ("task", task_id),
+            lambda: self.client.inspect_task(task_id))
+
+    def find_service_ids(self, name):
+        return [
+            item["ID"] for item in self.services()
+            if item["ID"] == name or item.get("Spec", {}).get("Name") == name
+        ]
+
+    def find_tasks(self, service=None, desired_state=None, fresh=False):
+        """Client-side equivalent of the ``service`` and
+        ``desired-state`` filters of the tasks endpoint."""
+
+        tasks = self.tasks(fresh=fresh)
+
+        if service is not None:
+            service_ids = self.find_service_ids(service)
+            tasks = [item for item in tasks if item.get("ServiceID") in service_ids]
+
+        if desired_state is not None:
+            tasks = [item for item in tasks if item.get("DesiredState") == desired_state]
+
+        return tasks
+
+
+def get_docker_api(docker_url, ttl=None):
+    """Returns the cached Docker API shared by the current process."""
+
+    with _clients_lock:
+        if docker_url not in _clients:
+            _clients[docker_url] = CachedDockerAPI(docker_url, ttl=ttl)
+
+        return _clients[docker_url]
+
+
+def log_docker_api_stats():
+    with _clients_lock:
+        stats = {url: item.stats for url, item in _clients.items()}
+
+    _logger.debug("Docker API cache stats: %s", stats)
+
+    return stats
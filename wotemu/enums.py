@@ -6,6 +6,7 @@ class Labels(enum.Enum):
     WOTEMU_NETWORK = "org.fundacionctic.wotemu.net"
     WOTEMU_GATEWAY = "org.fundacionctic.wotemu.gw"
     WOTEMU_NODE = "org.fundacionctic.wotemu.node"
+    WOTEMU_NODE_GROUP = "org.fundacionctic.wotemu.nodegroup"
     WOTEMU_BROKER = "org.fundacionctic.wotemu.broker"
     WOTEMU_REDIS = "org.fundacionctic.wotemu.redis"
     WOTEMU_SERVICE = "org.fundacionctic.wotemu.service"
@@ -17,13 +18,46 @@ class RedisPrefixes(enum.Enum):
     PACKET = "packet"
     THING = "thing"
     SYSTEM = "system"
+    LOOP = "loop"
     INFO = "info"
+    NODE = "node"
+    META = "meta"
+    READY = "ready"
+    ROLLUP = "rollup"
+    MEMORY = "memory"
     BENCHMARK = "benchmark"
+    CPU = "cpu"
+    NETEM = "netem"
     SNAPSHOT = "snapshot"
     COMPOSE = "compose"
     APP = "app"
 
 
+class StorageBackends(enum.Enum):
+    ZSET = "zset"
+    STREAM = "stream"
+
+
+class RedisShardStrategies(enum.Enum):
+    SERVICE = "service"
+    NETWORK = "network"
+
+
+class WriterPolicies(enum.Enum):
+    DROP = "drop"
+    BLOCK = "block"
+
+
+class SystemMetrics(enum.Enum):
+    CPU = "cpu"
+    MEMORY = "memory"
+    THROTTLING = "throttling"
+    PRESSURE = "pressure"
+    FAULTS = "faults"
+    NET = "net"
+    LAG = "lag"
+
+
 class NetworkConditions(enum.Enum):
     GPRS = "GPRS"
     EDGE = "EDGE"
@@ -32,6 +66,13 @@ class NetworkConditions(enum.Enum):
     LTE = "LTE"
     WIFI = "WIFI"
     CABLE = "CABLE"
+    GPRS_LOSSY = "GPRS_LOSSY"
+    EDGE_LOSSY = "EDGE_LOSSY"
+    REGULAR_3G_LOSSY = "REGULAR_3G_LOSSY"
+    FAST_3G_LOSSY = "FAST_3G_LOSSY"
+    LTE_LOSSY = "LTE_LOSSY"
+    WIFI_LOSSY = "WIFI_LOSSY"
+    CABLE_LOSSY = "CABLE_LOSSY"
 
 
 class NodePlatforms(enum.Enum):
@@ -41,12 +82,45 @@ class NodePlatforms(enum.Enum):
     UNCONSTRAINED = "UNCONSTRAINED"
 
 
-def _netem(latency=None, jitter=None, rate=None):
-    return json.dumps({
+LOSS_RANDOM = "random"
+LOSS_GEMODEL = "gemodel"
+
+
+def _loss_gemodel(p, r, loss_bad=None, loss_good=None):
+    """Gilbert-Elliott loss: p and r are the probabilities (%) of moving
+    to the bad and back to the good state, loss_bad and loss_good the
+    loss (%) in each state (1-h and 1-k in tc, default to 100% and 0%)."""
+
+    loss = {"model": LOSS_GEMODEL, "p": p, "r": r}
+
+    if loss_bad is not None:
+        loss.update({"loss_bad": loss_bad})
+
+    if loss_good is not None:
+        loss.update({"loss_good": loss_good})
+
+    return loss
+
+
+def _netem(
+        latency=None, jitter=None, rate=None, loss=None,
+        duplicate=None, reorder=None, corrupt=None):
+    netem = {
         "latency": latency,
         "jitter": jitter,
         "rate": rate
-    })
+    }
+
+    impairments = {
+        "loss": loss,
+        "duplicate": duplicate,
+        "reorder": reorder,
+        "corrupt": corrupt
+    }
+
+    netem.update({key: val for key, val in impairments.items() if val is not None})
+
+    return json.dumps(netem)
 
 
 NETEM_CONDITIONS = {
@@ -70,6 +144,40 @@ NETEM_CONDITIONS = {
     ],
     NetworkConditions.CABLE: [
         _netem(latency=5, jitter=5, rate="100mbit")
+    ],
+    # The *_LOSSY profiles add packet impairments to the profiles above.
+    # Bursty losses in cellular links are modelled with Gilbert-Elliott,
+    # and residual losses in the other links are random and independent
+    NetworkConditions.GPRS_LOSSY: [
+        _netem(
+            latency=700, jitter=100, rate="50kbit",
+            loss=_loss_gemodel(p=2, r=20), corrupt=0.1)
+    ],
+    NetworkConditions.EDGE_LOSSY: [
+        _netem(
+            latency=700, jitter=100, rate="100kbit",
+            loss=_loss_gemodel(p=1, r=25), corrupt=0.05)
+    ],
+    NetworkConditions.REGULAR_3G_LOSSY: [
+        _netem(
+            latency=300, jitter=150, rate="1500kbit",
+            loss=_loss_gemodel(p=0.5, r=30), duplicate=0.1)
+    ],
+    NetworkConditions.FAST_3G_LOSSY: [
+        _netem(
+            latency=150, jitter=50, rate="4000kbit",
+            loss=0.5, duplicate=0.1)
+    ],
+    NetworkConditions.LTE_LOSSY: [
+        _netem(latency=40, jitter=10, rate="15mbit", loss=0.1)
+    ],
+    NetworkConditions.WIFI_LOSSY: [
+        _netem(
+            latency=25, jitter=5, rate="50mbit",
+            loss=0.5, duplicate=0.1, reorder=0.5)
+    ],
+    NetworkConditions.CABLE_LOSSY: [
+        _netem(latency=5, jitter=5, rate="100mbit", loss=0.01)
     ]
 }
 
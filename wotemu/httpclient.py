@@ -0,0 +1,83 @@
+"""Process-wide configuration of the Tornado HTTP client.
+
+Both the catalogue helpers and the HTTP binding client of WoTPy use
+the AsyncHTTPClient singleton of the event loop. The libcurl-based
+implementation is selected when pycurl is available given that the
+default implementation opens a new connection for each request.
+"""
+
+import logging
+
+import tornado.httpclient
+import wotemu.config
+
+try:
+    import pycurl
+    import tornado.curl_httpclient
+except ImportError:
+    pycurl = None
+
+_logger = logging.getLogger(__name__)
+_state = {"configured": False}
+
+
+if pycurl is not None:
+    class PooledCurlAsyncHTTPClient(tornado.curl_httpclient.CurlAsyncHTTPClient):
+        """Curl client that limits the number of
+        connections to each host of the pool."""
+
+        def initialize(self, max_clients=10, defaults=None, max_host_connections=None):
+            super().initialize(max_clients=max_clients, defaults=defaults)
+
+            if max_host_connections:
+                self._multi.setopt(
+                    pycurl.M_MAX_HOST_CONNECTIONS,
+                    max_host_connections)
+
+
+def is_keep_alive_supported():
+    return pycurl is not None
+
+
+def configure_http_client(max_clients=None, max_host_connections=None, keep_alive=None):
+    """Configures the AsyncHTTPClient implementation. This should be called
+    before the first client is instantiated in the current event loop."""
+
+    conf = wotemu.config.get_env_config()
+    max_clients = max_clients if max_clients else conf.http_max_clients
+    keep_alive = keep_alive if keep_alive is not None else conf.http_keep_alive
+
+    max_host_connections = max_host_connections \
+        if max_host_connections is not None else conf.http_max_host_connections
+
+    if keep_alive and not is_keep_alive_supported():
+        _logger.warning((
+            "HTTP keep-alive requires pycurl (pip install wotemu[http]): "
+            "Using a new connection for each request"))
+
+    if keep_alive and is_keep_alive_supported():
+        tornado.httpclient.AsyncHTTPClient.configure(
+            PooledCurlAsyncHTTPClient,
+            max_clients=max_clients,
+            max_host_connections=max_host_connections)
+    else:
+        tornado.httpclient.AsyncHTTPClient.configure(
+            None,
+            max_clients=max_clients)
+
+    _state["configured"] = True
+
+    _logger.debug(
+        "Configured HTTP client: %s (max_clients=%s) (max_host_connections=%s)",
+        tornado.httpclient.AsyncHTTPClient.configured_class().__name__,
+        max_clients, max_host_connections)
+
+
+def get_http_client():
+    """Returns the AsyncHTTPClient shared by the current event loop.
+    Unlike instances created with force_instance this must not be closed."""
+
+    if not _state["configured"]:
+        configure_http_client()
+
+    return tornado.httpclient.AsyncHTTPClient()
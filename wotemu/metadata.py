@@ -0,0 +1,258 @@
+"""Swarm metadata published in Redis by the ``watch`` service.
+
+The watch service builds the mappings that nodes would otherwise
+obtain by querying the Docker API independently:
+
+* Tasks: container hostname (short container ID) to task details.
+* Services: service name to the hostnames of its running replicas.
+* Gateways: WoTemu network ID to the gateway task in that network.
+
+Readers fall back to the Docker API when the metadata is unavailable.
+"""
+
+import asyncio
+import json
+import logging
+import time
+
+import docker
+from wotemu.dockerapi import get_docker_api
+from wotemu.enums import Labels, RedisPrefixes
+from wotemu.storage.manager import get_redis_manager
+from wotemu.utils import (get_current_container_hostname, get_current_task,
+                          get_network_gateway_task,
+                          get_service_container_hostnames,
+                          get_task_container_id, get_task_networks)
+
+_CID_HOST_LEN = 12
+_STATE_RUNNING = "running"
+_STACK_NAMESPACE = "com.docker.stack.namespace"
+_HASH_TASKS = "tasks"
+_HASH_SERVICES = "services"
+_HASH_GATEWAYS = "gateways"
+_KEY_UPDATED = "updated"
+
+_logger = logging.getLogger(__name__)
+
+
+def _meta_key(name):
+    return "{}:{}:{}".format(
+        RedisPrefixes.NAMESPACE.value,
+        RedisPrefixes.META.value,
+        name)
+
+
+def _is_wotemu_network(net_info):
+    labels = net_info.get("Labels", {}) or {}
+    return labels.get(Labels.WOTEMU_NETWORK.value, None) is not None
+
+
+def _task_labels(task):
+    return task.get("Spec", {}).get("ContainerSpec", {}).get("Labels", {}) or {}
+
+
+def _task_addresses(task):
+    ret = {}
+
+    for attachment in task.get("NetworksAttachments", []):
+        addrs = attachment.get("Addresses", [])
+
+        if len(addrs):
+            ret[attachment["Network"]["ID"]] = addrs[0].split("/")[0]
+
+    return ret
+
+
+def build_metadata(docker_url):
+    """Builds the metadata mappings with one bulk query for tasks and
+    services and one verbose inspection per WoTemu network."""
+
+    docker_api = get_docker_api(docker_url)
+    docker_api.invalidate()
+
+    services = {item["ID"]: item for item in docker_api.services()}
+
+    tasks = [
+        task for task in docker_api.tasks()
+        if task.get("DesiredState") == _STATE_RUNNING
+    ]
+
+    net_ids = set(
+        att["Network"]["ID"]
+        for task in tasks
+        for att in task.get("NetworksAttachments", []))
+
+    networks = {}
+
+    for net_id in net_ids:
+        try:
+            networks[net_id] = docker_api.inspect_network(net_id)
+        except docker.errors.NotFound:
+            _logger.debug("Network not found: %s", net_id)
+
+    wotemu_net_ids = [
+        net_id for net_id, net_info in networks.items()
+        if _is_wotemu_network(net_info)
+    ]
+
+    meta_tasks = {}
+    meta_services = {}
+
+    for task in tasks:
+        cid = get_task_container_id(task)
+
+        if not cid:
+            continue
+
+        host = cid[:_CID_HOST_LEN]
+        service = services.get(task.get("ServiceID"), {})
+        service_name = service.get("Spec", {}).get("Name")
+        namespace = _task_labels(task).get(_STACK_NAMESPACE, None)
+        addrs = _task_addresses(task)
+
+        meta_tasks[host] = {
+            "task": task,
+            "service_name": service_name,
+            "networks": [nid for nid in addrs if nid in wotemu_net_ids],
+            "addresses": addrs
+        }
+
+        names = [service_name]
+
+        if namespace and service_name and service_name.startswith(f"{namespace}_"):
+            names.append(service_name[len(namespace) + 1:])
+
+        for name in names:
+            if name:
+                meta_services.setdefault(name, []).append(host)
+
+    meta_gateways = {}
+
+    for net_id in wotemu_net_ids:
+        try:
+            meta_gateways[net_id] = get_network_gateway_task(
+                docker_url=docker_url,
+                network_id=net_id)
+        except Exception as ex:
+            _logger.debug("Gateway not found (%s): %s", net_id, repr(ex))
+
+    return {
+        _HASH_TASKS: meta_tasks,
+        _HASH_SERVICES: meta_services,
+        _HASH_GATEWAYS: meta_gateways
+    }
+
+
+async def publish_metadata(redis, metadata):
+    tr = redis.multi_exec()
+
+    for name, mapping in metadata.items():
+        key = _meta_key(name)
+        tr.delete(key)
+
+        if len(mapping):
+            fields = {
+                field: json.dumps(val)
+                for field, val in mapping.items()
+            }
+
+            tr.hmset_dict(key, fields)
+
+    tr.set(_meta_key(_KEY_UPDATED), time.time())
+
+    await tr.execute()
+
+
+async def _read_field(redis_url, name, field):
+    redis = await get_redis_manager(redis_url).get()
+
+    if not (await redis.exists(_meta_key(_KEY_UPDATED))):
+        return None
+
+    val = await redis.hget(_meta_key(name), field)
+
+    return json.loads(val) if val else None
+
+
+async def _read_or_fallback(conf, name, field, fallback):
+    if conf.docker_watch and conf.redis_url:
+        try:
+            val = await _read_field(conf.redis_url, name, field)
+
+            if val is not None:
+                return val
+
+            _logger.debug("Metadata not found (%s): %s", name, field)
+        except Exception as ex:
+            _logger.warning("Error reading metadata (%s): %s", name, repr(ex))
+
+    loop = asyncio.get_event_loop()
+
+    return await loop.run_in_executor(None, fallback)
+
+
+async def read_current_task(conf):
+    def fallback():
+        task = get_current_task(docker_url=conf.docker_proxy_url)
+
+        return {
+            "task": task,
+            "networks": get_task_networks(
+                docker_url=conf.docker_proxy_url,
+                task=task)
+        }
+
+    host = get_current_container_hostname()
+
+    return await _read_or_fallback(conf, _HASH_TASKS, host, fallback)
+
+
+async def read_network_gateway(conf, network_id):
+    def fallback():
+        return get_network_gateway_task(
+            docker_url=conf.docker_proxy_url,
+            network_id=network_id)
+
+    return await _read_or_fallback(conf, _HASH_GATEWAYS, network_id, fallback)
+
+
+async def read_service_hostnames(conf, name):
+    def fallback():
+        return get_service_container_hostnames(
+            docker_url=conf.docker_proxy_url,
+            name=name)
+
+    candidates = [name]
+
+    if "." in name:
+        candidates.append(name.rsplit(".", 1)[0])
+
+    for candidate in candidates[:-1]:
+        if not conf.docker_watch:
+            break
+
+        try:
+            val = await _read_field(conf.redis_url, _HASH_SERVICES, candidate)
+
+            if val:
+                return val
+        except Exception as ex:
+            _logger.warning("Error reading metadata: %s", repr(ex))
+            break
+
+    return await _read_or_fallback(conf, _HASH_SERVICES, candidates[-1], fallback)
+
+
+async def read_gateway_tasks(conf):
+    """Returns the gateway tasks of the WoTemu networks
+    of the current task indexed by network ID."""
+
+    current = await read_current_task(conf)
+    net_ids = current["networks"]
+
+    gw_tasks = await asyncio.gather(*[
+        read_network_gateway(conf, net_id)
+        for net_id in net_ids
+    ])
+
+    return dict(zip(net_ids, gw_tasks))
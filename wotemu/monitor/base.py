@@ -6,11 +6,13 @@ import pprint
 import socket
 import time
 
-import aioredis
 import wotemu.config
 from wotemu.enums import RedisPrefixes
+from wotemu.monitor.loop import monitor_loop
 from wotemu.monitor.packet import monitor_packets
 from wotemu.monitor.system import get_node_info, monitor_system
+from wotemu.storage.manager import get_redis_manager
+from wotemu.storage.writer import get_writer
 
 _logger = logging.getLogger(__name__)
 
@@ -18,52 +20,53 @@ _logger = logging.getLogger(__name__)
 class NodeMonitor:
     def __init__(
             self, key=None, redis_url=None, packet_ifaces=None,
-            packet_kwargs=None, system_kwargs=None):
+            packet_kwargs=None, system_kwargs=None, backend=None,
+            enable_loop=False, loop_kwargs=None, cpu_controller=None,
+            cpu_control_interval=None):
         conf = wotemu.config.get_env_config()
         self._conf = conf
         self._key = key if key else socket.getfqdn()
-        self._redis_url = redis_url if redis_url else conf.redis_url
+        self._redis_url = redis_url if redis_url else conf.redis_telemetry_url
         self._redis = None
+        self._backend = backend
+        self._writer = None
         self._packet_ifaces = packet_ifaces
         self._packet_kwargs = packet_kwargs if packet_kwargs else {}
         self._system_kwargs = system_kwargs if system_kwargs else {}
+        self._enable_loop = enable_loop
+        self._loop_kwargs = loop_kwargs if loop_kwargs else {}
         self._task_system = None
         self._tasks_packet = None
+        self._task_loop = None
+        self._task_cpu = None
+        self._cpu_controller = cpu_controller
+
+        self._cpu_control_interval = cpu_control_interval \
+            if cpu_control_interval else conf.cpu_control_interval
 
     @property
     def is_running(self):
-        return self._task_system or self._tasks_packet
+        return self._task_system or self._tasks_packet \
+            or self._task_loop or self._task_cpu
 
     async def _redis_open(self):
         if self._redis:
             return
 
-        self._redis = await aioredis.create_redis_pool(self._redis_url)
-        _logger.debug("Opened Redis connection to: %s", self._redis_url)
+        self._redis = await get_redis_manager(self._redis_url).get()
 
-    async def _redis_close(self):
-        if not self._redis:
-            return
+        self._writer = get_writer(
+            redis_url=self._redis_url,
+            backend=self._backend)
 
-        self._redis.close()
-        await self._redis.wait_closed()
+        _logger.debug("Using Redis connection to: %s", self._redis_url)
+
+    async def _redis_close(self):
+        # The pool is shared by the process and closed on shutdown
         self._redis = None
-        _logger.debug("Closed Redis connection")
 
     async def _redis_callback(self, items, key):
-        _logger.debug("ZADD (%s items): %s", len(items), key)
-
-        tr = self._redis.multi_exec()
-
-        for item in items:
-            score = item.get("time", time.time())
-            member = json.dumps(item)
-            tr.zadd(key=key, score=score, member=member)
-
-        exec_res = await tr.execute()
-
-        if not all(exec_res):
-            _logger.warning("Error in Redis MULTI ZADD: %s", exec_res)
+        await self._writer.put_many(key, items)
 
     async def _create_system_task(self):
         assert not self._task_system
@@ -81,6 +84,42 @@ class NodeMonitor:
 
         self._task_system = asyncio.ensure_future(system_awaitable)
 
+    async def _create_loop_task(self):
+        assert not self._task_loop
+
+        if not self._enable_loop:
+            return
+
+        key = "{}:{}:{}".format(
+            RedisPrefixes.NAMESPACE.value,
+            RedisPrefixes.LOOP.value,
+            self._key)
+
+        async_cb = functools.partial(self._redis_callback, key=key)
+
+        loop_awaitable = monitor_loop(
+            async_cb=async_cb,
+            **self._loop_kwargs)
+
+        self._task_loop = asyncio.ensure_future(loop_awaitable)
+
+    async def _create_cpu_task(self):
+        assert not self._task_cpu
+
+        if not self._cpu_controller:
+            return
+
+        key = "{}:{}:{}".format(
+            RedisPrefixes.NAMESPACE.value,
+            RedisPrefixes.CPU.value,
+            self._key)
+
+        async_cb = functools.partial(self._redis_callback, key=key)
+
+        self._task_cpu = asyncio.ensure_future(self._cpu_controller.run(
+            async_cb=async_cb,
+            interval=self._cpu_control_interval))
+
     async def _create_packet_tasks(self):
         assert not self._tasks_packet
 
@@ -117,6 +156,22 @@ class NodeMonitor:
         await self._task_system
         self._task_system = None
 
+    async def _stop_loop_task(self):
+        if not self._task_loop:
+            return
+
+        self._task_loop.cancel()
+        await self._task_loop
+        self._task_loop = None
+
+    async def _stop_cpu_task(self):
+        if not self._task_cpu:
+            return
+
+        self._task_cpu.cancel()
+        await self._task_cpu
+        self._task_cpu = None
+
     async def _stop_packet_tasks(self):
         if not self._tasks_packet:
             return
@@ -128,7 +183,7 @@ class NodeMonitor:
     async def _write_node_info(self):
         assert self._redis
 
-        node_info = get_node_info()
+        node_info = await get_node_info(redis=self._redis)
         tstamp = time.time()
         node_info.update({"time": tstamp})
         member = json.dumps(node_info)
@@ -153,14 +208,23 @@ class NodeMonitor:
         await self._redis_open()
         await self._write_node_info()
         await self._create_system_task()
+        await self._create_loop_task()
+        await self._create_cpu_task()
         await self._create_packet_tasks()
 
     async def stop(self):
         _logger.debug("Stopping node monitor")
 
         await self._stop_system_task()
+        await self._stop_loop_task()
+        await self._stop_cpu_task()
         await self._stop_packet_tasks()
+
+        if self._writer:
+            await self._writer.flush()
+
         await self._redis_close()
 
         self._task_system = None
         self._tasks_packet = None
+        self._task_loop = None
@@ -0,0 +1,251 @@
+"""Reader for the cgroup (v1 and v2) interface files of the current container.
+
+Files are opened once and then read with ``os.pread``, so that
+sampling does not spawn any processes nor reopen any files.
+"""
+
+import logging
+import os
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+CGROUP_V1 = 1
+CGROUP_V2 = 2
+
+_V2_MARKER = "cgroup.controllers"
+_READ_SIZE = 8192
+_MAX = "max"
+_PROC_PRESSURE = "/proc/pressure"
+
+_V1_DIRS = {
+    "cpu": ["cpu", "cpu,cpuacct", "cpuacct,cpu"],
+    "cpuacct": ["cpuacct", "cpu,cpuacct", "cpuacct,cpu"],
+    "memory": ["memory"]
+}
+
+_logger = logging.getLogger(__name__)
+
+
+class CgroupReadError(RuntimeError):
+    def __init__(self, name, version=None):
+        msg = "Could not read cgroup parameter '{}' (version: {})".format(
+            name, version)
+
+        super().__init__(msg)
+
+
+class PseudoFile:
+    """File that is opened once and re-read from the start on each call."""
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = os.open(path, os.O_RDONLY)
+
+    def read(self):
+        chunks = []
+        offset = 0
+
+        while True:
+            chunk = os.pread(self._fd, _READ_SIZE, offset)
+            chunks.append(chunk)
+            offset += len(chunk)
+
+            if len(chunk) < _READ_SIZE:
+                break
+
+        return b"".join(chunks).decode("utf8").strip()
+
+    def close(self):
+        os.close(self._fd)
+
+
+def parse_pressure(text):
+    """Parses PSI files (e.g. "some avg10=0.00 avg60=0.00 avg300=0.00 total=0")."""
+
+    ret = {}
+
+    for line in text.splitlines():
+        parts = line.split()
+
+        if not len(parts):
+            continue
+
+        ret[parts[0]] = {
+            key: float(val)
+            for key, val in (item.split("=") for item in parts[1:])
+        }
+
+    return ret
+
+
+def detect_cgroup_version(root=CGROUP_ROOT):
+    is_v2 = os.path.exists(os.path.join(root, _V2_MARKER))
+    return CGROUP_V2 if is_v2 else CGROUP_V1
+
+
+class CgroupReader:
+    def __init__(self, root=CGROUP_ROOT, version=None):
+        self._root = root
+        self._version = version if version else detect_cgroup_version(root)
+        self._files = {}
+
+        _logger.debug(
+            "Reading cgroup files from %s (version: %s)",
+            self._root, self._version)
+
+    @property
+    def version(self):
+        return self._version
+
+    def _candidates(self, name):
+        if self._version == CGROUP_V2:
+            return [os.path.join(self._root, name)]
+
+        controller = name.split(".")[0]
+
+        return [
+            os.path.join(self._root, item, name)
+            for item in _V1_DIRS.get(controller, [controller])
+        ] + [os.path.join(self._root, name)]
+
+    def _get_file(self, name, candidates=None):
+        if name in self._files:
+            return self._files[name]
+
+        candidates = candidates if candidates else self._candidates(name)
+
+        for path in candidates:
+            try:
+                self._files[name] = PseudoFile(path)
+                _logger.debug("Opened cgroup file: %s", path)
+                return self._files[name]
+            except OSError:
+                continue
+
+        raise CgroupReadError(name, self._version)
+
+    def read(self, name, candidates=None):
+        pseudo_file = self._get_file(name, candidates=candidates)
+
+        try:
+            return pseudo_file.read()
+        except OSError as ex:
+            raise CgroupReadError(name, self._version) from ex
+
+    def read_int(self, name):
+        """Returns None for unlimited values (``max`` in cgroup v2)."""
+
+        val = self.read(name)
+
+        if val == _MAX:
+            return None
+
+        try:
+            return int(val)
+        except ValueError as ex:
+            raise CgroupReadError(name, self._version) from ex
+
+    def read_keyed(self, name):
+        """Parses flat keyed files (e.g. cpu.stat or memory.stat)."""
+
+        ret = {}
+
+        for line in self.read(name).splitlines():
+            parts = line.split()
+
+            if len(parts) != 2:
+                continue
+
+            try:
+                ret[parts[0]] = int(parts[1])
+            except ValueError:
+                pass
+
+        return ret
+
+    def cpu_usage_nanos(self):
+        if self._version == CGROUP_V2:
+            usage_usec = self.read_keyed("cpu.stat").get("usage_usec")
+
+            if usage_usec is None:
+                raise CgroupReadError("cpu.stat", self._version)
+
+            return usage_usec * 1000
+
+        return self.read_int("cpuacct.usage")
+
+    def memory_usage_bytes(self):
+        name = "memory.current" \
+            if self._version == CGROUP_V2 \
+            else "memory.usage_in_bytes"
+
+        return self.read_int(name)
+
+    def memory_limit_bytes(self):
+        name = "memory.max" \
+            if self._version == CGROUP_V2 \
+            else "memory.limit_in_bytes"
+
+        return self.read_int(name)
+
+    def cpu_quota_period(self):
+        """Returns the CPU quota and period in microseconds.
+        The quota is -1 when the CPU usage is not limited."""
+
+        if self._version == CGROUP_V1:
+            return (
+                self.read_int("cpu.cfs_quota_us"),
+                self.read_int("cpu.cfs_period_us")
+            )
+
+        parts = self.read("cpu.max").split()
+
+        if len(parts) != 2:
+            raise CgroupReadError("cpu.max", self._version)
+
+        quota = -1 if parts[0] == _MAX else int(parts[0])
+
+        return quota, int(parts[1])
+
+    def cpu_throttling(self):
+        """Returns the number of enforcement periods, the number of
+        throttled periods and the total throttled time (nanoseconds)."""
+
+        stat = self.read_keyed("cpu.stat")
+
+        if self._version == CGROUP_V2:
+            throttled_nanos = stat.get("throttled_usec", 0) * 1000
+        else:
+            throttled_nanos = stat.get("throttled_time", 0)
+
+        return {
+            "nr_periods": stat.get("nr_periods", 0),
+            "nr_throttled": stat.get("nr_throttled", 0),
+            "throttled_nanos": throttled_nanos
+        }
+
+    def memory_stat(self):
+        return self.read_keyed("memory.stat")
+
+    def pressure(self, resource):
+        """Reads the PSI metrics of the cgroup (v2) or the
+        system-wide metrics when the former are not available."""
+
+        name = "{}.pressure".format(resource)
+
+        candidates = [
+            os.path.join(self._root, name),
+            os.path.join(_PROC_PRESSURE, resource)
+        ] if self._version == CGROUP_V2 else [
+            os.path.join(_PROC_PRESSURE, resource)
+        ]
+
+        return parse_pressure(self.read(name, candidates=candidates))
+
+    def close(self):
+        for pseudo_file in self._files.values():
+            try:
+                pseudo_file.close()
+            except OSError:
+                _logger.warning("Error closing: %s", pseudo_file.path)
+
+        self._files = {}
@@ -0,0 +1,263 @@
+"""Closed-loop enforcement of the target CPU speed of a node.
+
+The CPU quota that is set on startup (see ``wotemu limits``) assumes an
+idle host: the speed achieved by the container drifts when neighbouring
+containers compete for the same cores. The controller periodically runs
+a short busy-loop probe to measure the speed that the container is
+effectively achieving. The fraction of a core that the container obtains
+is read from the cgroup usage, and the per-core efficiency comes from
+the probe rate relative to the rate measured on the idle host during the
+calibration. The CPU quota is then corrected through the Docker API to
+keep the node close to its target speed.
+"""
+
+import asyncio
+import logging
+import os
+import time
+
+import docker
+from wotemu.calibration import CalibrationStore
+from wotemu.config import DEFAULT_DOCKER_SOCKET
+from wotemu.monitor.cgroup import CgroupReader
+from wotemu.topology.compose import ENV_KEY_CPU_SPEED, ENV_KEY_NODE_ID
+from wotemu.utils import get_current_container_id
+
+_CPU_PERIOD = 100000
+_PROBE_CHUNK = 2000
+_MIN_FRACTION = 1e-2
+
+_logger = logging.getLogger(__name__)
+
+
+def _run_probe(duration):
+    """Busy loop for the given wall time. Returns the number
+    of operations and the CPU time consumed by the thread."""
+
+    ops = 0
+    acc = 0
+    ini_wall = time.perf_counter()
+    ini_cpu = time.thread_time()
+
+    while (time.perf_counter() - ini_wall) < duration:
+        for idx in range(_PROBE_CHUNK):
+            acc = (acc + idx * idx) % 1000003
+
+        ops += _PROBE_CHUNK
+
+    return ops, time.thread_time() - ini_cpu
+
+
+def measure_probe_rate(duration=1.0):
+    """Probe operations per CPU second."""
+
+    ops, cpu_time = _run_probe(duration)
+    return ops / cpu_time if cpu_time > 0 else None
+
+
+class CpuSpeedController:
+    def __init__(
+            self, target_speed, model, cgroup, container_id,
+            docker_url=None, probe=0.5, tolerance=0.05, gain=0.5,
+            max_fraction=None, baseline=None):
+        self.target_speed = target_speed
+        self.model = model
+        self.probe = probe
+        self.tolerance = tolerance
+        self.gain = gain
+        self.max_fraction = max_fraction
+        self._cgroup = cgroup
+        self._container_id = container_id
+        self._docker_url = docker_url
+        self._baseline = baseline
+        self._throttling = None
+        self._docker_client = None
+
+        self._counters = {
+            "probes": 0,
+            "corrections": 0,
+            "errors": 0
+        }
+
+    @property
+    def stats(self):
+        return dict(self._counters)
+
+    @property
+    def target_fraction(self):
+        return self.model.solve(self.target_speed)
+
+    def _get_quota_fraction(self):
+        quota, period = self._cgroup.cpu_quota_period()
+        return float(quota) / float(period) if quota > 0 else None
+
+    def _get_throttled_ratio(self):
+        throttling = self._cgroup.cpu_throttling()
+        prev, self._throttling = self._throttling, throttling
+
+        if prev is None:
+            return None
+
+        delta_periods = throttling["nr_periods"] - prev["nr_periods"]
+        delta_throttled = throttling["nr_throttled"] - prev["nr_throttled"]
+
+        return float(delta_throttled) / delta_periods if delta_periods > 0 else None
+
+    def calibrate_baseline(self):
+        """Measures the reference probe rate. Only used when the calibration
+        does not include it: should be called before the app starts."""
+
+        self._baseline = measure_probe_rate(self.probe)
+        _logger.debug("CPU speed controller baseline: %s", self._baseline)
+
+    def _measure(self):
+        usage_ini = self._cgroup.cpu_usage_nanos()
+        wall_ini = time.perf_counter()
+        ops, cpu_time = _run_probe(self.probe)
+        wall = time.perf_counter() - wall_ini
+        usage = (self._cgroup.cpu_usage_nanos() - usage_ini) * 1e-9
+
+        # Fraction of a core obtained by the container while it had
+        # at least one busy thread, and probe operations per CPU second
+
+        fraction = usage / wall
+        rate = ops / cpu_time if cpu_time > 0 else 0.0
+
+        if self._baseline is None:
+            self._baseline = rate
+
+        efficiency = rate / self._baseline if self._baseline else 1.0
+        speed = float(self.model(min(fraction, 1.0))) * efficiency
+
+        return {
+            "fraction": round(fraction, 4),
+            "efficiency": round(efficiency, 4),
+            "speed": round(speed, 2)
+        }
+
+    def _next_fraction(self, quota_fraction, speed):
+        if speed <= 0:
+            return quota_fraction
+
+        error = self.target_speed / speed
+
+        if abs(error - 1.0) <= self.tolerance:
+            return quota_fraction
+
+        desired = quota_fraction * error
+        fraction = quota_fraction + self.gain * (desired - quota_fraction)
+        fraction = max(fraction, _MIN_FRACTION)
+
+        if self.max_fraction:
+            fraction = min(fraction, self.max_fraction)
+
+        return fraction
+
+    def _get_docker_client(self):
+        if not self._docker_client:
+            self._docker_client = docker.DockerClient(base_url=self._docker_url) \
+                if self._docker_url else docker.from_env()
+
+        return self._docker_client
+
+    def close(self):
+        if not self._docker_client:
+            return
+
+        self._docker_client.close()
+        self._docker_client = None
+
+    def _update_quota(self, fraction):
+        client = self._get_docker_client()
+        container = client.containers.get(self._container_id)
+
+        return container.update(
+            cpu_period=_CPU_PERIOD,
+            cpu_quota=int(_CPU_PERIOD * fraction))
+
+    async def step(self):
+        """Runs one probe and corrects the quota if necessary.
+        Returns the record that describes the step."""
+
+        loop = asyncio.get_event_loop()
+        quota_fraction = self._get_quota_fraction()
+        throttled = self._get_throttled_ratio()
+        measure = await loop.run_in_executor(None, self._measure)
+        self._counters["probes"] += 1
+
+        if quota_fraction is None:
+            quota_fraction = self.target_fraction
+
+        fraction = self._next_fraction(quota_fraction, measure["speed"])
+        corrected = abs(fraction - quota_fraction) > 1e-6
+
+        if corrected:
+            _logger.info(
+                "Correcting CPU quota (speed=%s target=%s): %.4f -> %.4f",
+                measure["speed"], self.target_speed, quota_fraction, fraction)
+
+            await loop.run_in_executor(None, self._update_quota, fraction)
+            self._counters["corrections"] += 1
+
+        return {
+            "time": time.time(),
+            "target_speed": self.target_speed,
+            "quota_before": round(quota_fraction, 4),
+            "quota_after": round(fraction, 4),
+            "throttled_ratio": throttled,
+            "corrected": corrected,
+            **measure
+        }
+
+    async def run(self, async_cb, interval):
+        try:
+            while True:
+                await asyncio.sleep(interval)
+
+                try:
+                    record = await self.step()
+                    await async_cb([record])
+                except asyncio.CancelledError:
+                    raise
+                except Exception as ex:
+                    self._counters["errors"] += 1
+                    _logger.warning("Error in CPU speed controller: %s", repr(ex))
+        except asyncio.CancelledError:
+            _logger.debug("Cancelled CPU speed controller: %s", self.stats)
+        finally:
+            self.close()
+
+
+def build_cpu_speed_controller(conf, cgroup=None):
+    """Builds the controller from the environment of the node container.
+    Returns None if the node has no target speed or calibration."""
+
+    target_speed = os.getenv(ENV_KEY_CPU_SPEED, None)
+    node_id = os.getenv(ENV_KEY_NODE_ID, None)
+
+    if not target_speed or not node_id:
+        _logger.warning("Undefined target CPU speed: Disabled CPU speed controller")
+        return None
+
+    store = CalibrationStore(path=conf.calibration_path)
+    calibration = store.get_local(node_id)
+
+    if not calibration:
+        _logger.warning("CPU calibration not found: Disabled CPU speed controller")
+        return None
+
+    controller = CpuSpeedController(
+        target_speed=float(target_speed),
+        model=calibration.speed_model,
+        cgroup=cgroup if cgroup else CgroupReader(),
+        container_id=get_current_container_id(),
+        docker_url="unix://{}".format(DEFAULT_DOCKER_SOCKET),
+        probe=conf.cpu_control_probe,
+        max_fraction=os.cpu_count(),
+        baseline=calibration.probe_rate)
+
+    if not calibration.probe_rate:
+        _logger.warning("Probe rate not found in calibration: Measuring baseline")
+        controller.calibrate_baseline()
+
+    return controller
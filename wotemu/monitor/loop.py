@@ -0,0 +1,93 @@
+import asyncio
+import logging
+import time
+
+_SLOW_LOGGER = "asyncio"
+_SLOW_PREFIX = "Executing "
+_MAX_HANDLE_LEN = 256
+
+_logger = logging.getLogger(__name__)
+
+
+class SlowCallbackHandler(logging.Handler):
+    """Captures the slow callback warnings that the asyncio
+    logger emits when the loop runs in debug mode."""
+
+    def __init__(self):
+        super().__init__(level=logging.WARNING)
+        self._items = []
+
+    def emit(self, record):
+        try:
+            if not str(record.msg).startswith(_SLOW_PREFIX):
+                return
+
+            handle, duration = record.args[0], record.args[1]
+            self._items.append((str(handle)[:_MAX_HANDLE_LEN], duration))
+        except Exception:
+            pass
+
+    def drain(self):
+        items = self._items
+        self._items = []
+        return items
+
+
+def _loop_datum(loop, lag, slow_items):
+    datum = {
+        "time": time.time(),
+        "loop_lag": round(lag, 6),
+        "tasks": len(asyncio.all_tasks(loop)),
+        "slow_callbacks": len(slow_items)
+    }
+
+    if len(slow_items):
+        slowest, slowest_duration = max(slow_items, key=lambda item: item[1])
+
+        datum.update({
+            "slow_max": round(slowest_duration, 6),
+            "slow_total": round(sum(item[1] for item in slow_items), 6),
+            "slow_callback": slowest
+        })
+
+    return datum
+
+
+async def monitor_loop(async_cb, sleep=1.0, group_size=10, slow_callback_duration=0.1):
+    """Measures the scheduling lag and the number of pending tasks of the
+    current loop. When ``slow_callback_duration`` is defined the loop is
+    switched to debug mode to record the callbacks that take longer."""
+
+    loop = asyncio.get_running_loop()
+    handler = None
+    slow_logger = logging.getLogger(_SLOW_LOGGER)
+    prev_debug = loop.get_debug()
+    data = []
+
+    if slow_callback_duration:
+        loop.slow_callback_duration = slow_callback_duration
+        loop.set_debug(True)
+        handler = SlowCallbackHandler()
+        slow_logger.addHandler(handler)
+
+    _logger.debug(
+        "Monitoring loop every %s s (slow callback threshold: %s)",
+        sleep, slow_callback_duration)
+
+    try:
+        while True:
+            ini = time.monotonic()
+            await asyncio.sleep(sleep)
+            lag = max(time.monotonic() - ini - sleep, 0.0)
+            slow_items = handler.drain() if handler else []
+            data.append(_loop_datum(loop, lag, slow_items))
+
+            if len(data) >= group_size:
+                await async_cb(data)
+                data = []
+    except asyncio.CancelledError:
+        _logger.debug("Cancelled loop monitor task")
+    finally:
+        if handler:
+            slow_logger.removeHandler(handler)
+            loop.set_debug(prev_debug)
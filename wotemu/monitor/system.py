@@ -1,30 +1,40 @@
 import asyncio
-import functools
+import concurrent.futures
 import json
 import logging
 import os
 import platform
-import pprint
 import re
 import socket
 import time
 
-import docker
 import psutil
 import sh
 import wotemu.config
+from wotemu.dockerapi import get_docker_api
+from wotemu.enums import RedisPrefixes, SystemMetrics
+from wotemu.monitor.cgroup import CgroupReader, CgroupReadError, PseudoFile
 from wotemu.topology.compose import ENV_KEY_SERVICE_NAME
-from wotemu.utils import (cgget, get_current_container_id, get_current_task,
+from wotemu.utils import (get_current_container_id, get_current_task,
                           get_task_networks)
 
-_CPU_USAGE = "cpuacct.usage"
-_CPU_PERIOD = "cpu.cfs_period_us"
-_CPU_QUOTA = "cpu.cfs_quota_us"
-_MEM_LIMIT = "memory.limit_in_bytes"
-_MEM_USAGE = "memory.usage_in_bytes"
-_NSLOOKUP_REGEX = r"Name:\s.+\..+\nAddress:\s(.+)"
+_MEM_LIMIT = "mem_limit"
 _LSCPU_REGEX = r"Model\sname:[\s\t]*(.+)"
 _UNKNOWN_CPU = "Unknown CPU"
+_NODE_CPU_MODEL = "cpu_model"
+_INFO_WORKERS = 8
+_PSI_RESOURCES = ["cpu", "memory", "io"]
+_PSI_AVG = "avg10"
+_MEM_FAULTS = ["pgfault", "pgmajfault"]
+_PROC_NET_DEV = "/proc/net/dev"
+_NET_IGNORE = {"lo"}
+_NET_COUNTERS = {"rx_bytes": 0, "rx_packets": 1, "tx_bytes": 8, "tx_packets": 9}
+_VIPS_CACHE_TTL = 60
+
+# The other metrics are opt-in (see SYSTEM_METRICS): they add
+# columns (e.g. one set per interface) to every system record
+
+DEFAULT_METRICS = [SystemMetrics.CPU.value, SystemMetrics.MEMORY.value]
 
 _logger = logging.getLogger(__name__)
 
@@ -34,17 +44,16 @@ _times = {
 }
 
 _cache = {}
+_vips_cache = {}
+_counters = {}
+_state = {"cgroup": None, "net_dev": None}
 
 
-class CggetError(RuntimeError):
-    def __init__(self, key):
-        msg = (
-            "Could not read cgroup parameter '{}'"
-            "using the cgget command. Please make "
-            "sure that cgget is installed on your system."
-        ).format(key)
+def _get_cgroup():
+    if not _state["cgroup"]:
+        _state["cgroup"] = CgroupReader()
 
-        super().__init__(msg)
+    return _state["cgroup"]
 
 
 def _get_cpu_nanos_system():
@@ -53,12 +62,7 @@ def _get_cpu_nanos_system():
 
 
 def _get_cpu_nanos():
-    usage = cgget(_CPU_USAGE)
-
-    if usage is None:
-        raise CggetError(_CPU_USAGE)
-
-    return usage
+    return _get_cgroup().cpu_usage_nanos()
 
 
 def _is_times_state_empty():
@@ -94,37 +98,9 @@ def _get_cpu_percent():
         return 0.0
 
 
-def _cgget_cpu_period(use_cache=True):
-    if use_cache and _cache.get(_CPU_PERIOD, None) is not None:
-        return _cache[_CPU_PERIOD]
-
-    period = cgget(_CPU_PERIOD)
-
-    if period is None:
-        raise CggetError(_CPU_PERIOD)
-
-    _cache[_CPU_PERIOD] = period
-
-    return period
-
-
-def _cgget_cpu_quota(use_cache=True):
-    if use_cache and _cache.get(_CPU_QUOTA, None) is not None:
-        return _cache[_CPU_QUOTA]
-
-    quota = cgget(_CPU_QUOTA)
-
-    if quota is None:
-        raise CggetError(_CPU_QUOTA)
-
-    _cache[_CPU_QUOTA] = quota
-
-    return quota
-
-
 def _get_cpu_constraint():
-    period = _cgget_cpu_period(use_cache=True)
-    quota = _cgget_cpu_quota(use_cache=True)
+    # Not cached: the quota may be updated at runtime (see cpuspeed)
+    quota, period = _get_cgroup().cpu_quota_period()
     return (float(quota) / float(period)) if quota > 0 else None
 
 
@@ -146,18 +122,18 @@ def _get_cpu():
     return ret
 
 
-def _cgget_mem_limit(use_cache=True):
-    if use_cache and _cache.get(_MEM_LIMIT, None) is not None:
+def _read_mem_limit(use_cache=True):
+    if use_cache and _MEM_LIMIT in _cache:
         return _cache[_MEM_LIMIT]
 
-    limit_bytes = cgget(_MEM_LIMIT)
+    limit_bytes = _get_cgroup().memory_limit_bytes()
     _cache[_MEM_LIMIT] = limit_bytes
 
     return limit_bytes
 
 
 def _get_memory_limit():
-    limit_bytes = _cgget_mem_limit(use_cache=True)
+    limit_bytes = _read_mem_limit(use_cache=True)
     total_bytes_system = psutil.virtual_memory().total
 
     if limit_bytes and limit_bytes < total_bytes_system:
@@ -167,11 +143,7 @@ def _get_memory_limit():
 
 
 def _get_memory():
-    mem_usage = cgget(_MEM_USAGE)
-
-    if mem_usage is None:
-        raise CggetError(_MEM_USAGE)
-
+    mem_usage = _get_cgroup().memory_usage_bytes()
     mem_limit = _get_memory_limit()
     mem_usage_mb = mem_usage / (1024.0 ** 2)
     mem_limit_mb = mem_limit / (1024.0 ** 2)
@@ -183,73 +155,179 @@ def _get_memory():
     }
 
 
-def _read_system(data, read_funcs):
+def _get_throttling():
+    throttling = _get_cgroup().cpu_throttling()
+    prev = _counters.get(SystemMetrics.THROTTLING)
+    _counters[SystemMetrics.THROTTLING] = throttling
+
+    ret = {
+        "cpu_nr_periods": throttling["nr_periods"],
+        "cpu_nr_throttled": throttling["nr_throttled"],
+        "cpu_throttled_nanos": throttling["throttled_nanos"]
+    }
+
+    if prev is None:
+        return ret
+
+    delta_periods = throttling["nr_periods"] - prev["nr_periods"]
+    delta_throttled = throttling["nr_throttled"] - prev["nr_throttled"]
+
+    if delta_periods > 0:
+        throttled_ratio = float(delta_throttled) / delta_periods
+        ret.update({"cpu_throttled_percent": round(throttled_ratio * 1e2, 1)})
+
+    return ret
+
+
+def _get_pressure():
+    ret = {}
+
+    for resource in _PSI_RESOURCES:
+        try:
+            psi = _get_cgroup().pressure(resource)
+        except CgroupReadError:
+            continue
+
+        ret.update({
+            "psi_{}_{}".format(resource, kind): vals[_PSI_AVG]
+            for kind, vals in psi.items() if _PSI_AVG in vals
+        })
+
+    return ret
+
+
+def _get_faults():
+    mem_stat = _get_cgroup().memory_stat()
+
+    return {
+        "mem_{}".format(key): mem_stat[key]
+        for key in _MEM_FAULTS if key in mem_stat
+    }
+
+
+def _get_net():
+    if not _state["net_dev"]:
+        _state["net_dev"] = PseudoFile(_PROC_NET_DEV)
+
+    ret = {}
+
+    for line in _state["net_dev"].read().splitlines()[2:]:
+        iface, _, counters = line.partition(":")
+        iface = iface.strip()
+        counters = counters.split()
+
+        if iface in _NET_IGNORE or len(counters) < 10:
+            continue
+
+        ret.update({
+            "net_{}_{}".format(iface, name): int(counters[idx])
+            for name, idx in _NET_COUNTERS.items()
+        })
+
+    return ret
+
+
+_READ_FUNCS = {
+    SystemMetrics.CPU: _get_cpu,
+    SystemMetrics.MEMORY: _get_memory,
+    SystemMetrics.THROTTLING: _get_throttling,
+    SystemMetrics.PRESSURE: _get_pressure,
+    SystemMetrics.FAULTS: _get_faults,
+    SystemMetrics.NET: _get_net
+}
+
+
+class _SampleBuffer:
+    """Fixed-size buffer of samples whose slots are allocated once."""
+
+    def __init__(self, size):
+        self._items = [None] * max(size, 1)
+        self._len = 0
+
+    @property
+    def is_full(self):
+        return self._len >= len(self._items)
+
+    def append(self, item):
+        self._items[self._len] = item
+        self._len += 1
+
+    def drain(self):
+        items = self._items[:self._len]
+
+        for idx in range(self._len):
+            self._items[idx] = None
+
+        self._len = 0
+
+        return items
+
+
+def _read_system(read_funcs, lag=None):
     datum = {"time": time.time()}
 
-    read_results = []
+    if lag is not None:
+        datum.update({"loop_lag": round(lag, 6)})
 
     for func in read_funcs:
         try:
-            read_results.append(func())
+            result = func()
         except Exception as ex:
             _logger.warning("System monitor error: %s", repr(ex))
+            continue
 
-    [
-        datum.update(item)
-        for item in read_results if item
-    ]
+        if result:
+            datum.update(result)
 
-    data.append(datum)
+    return datum
 
 
-async def _invoke_callback(data, group_size, async_cb):
-    if not group_size or len(data) >= group_size:
-        await async_cb(data)
-        data.clear()
+def _get_read_funcs(metrics):
+    metrics = [SystemMetrics(item) for item in metrics]
+    return [_READ_FUNCS[item] for item in metrics if item in _READ_FUNCS]
 
 
-async def monitor_system(async_cb, sleep=5.0, group_size=2):
-    data = []
+async def monitor_system(async_cb, sleep=None, group_size=None, metrics=None):
+    """Samples the resource usage of the current container every ``sleep``
+    seconds (sub-second values are supported) and passes the samples to
+    ``async_cb`` in groups of ``group_size`` (each sample on its own when
+    zero). The event loop lag is measured as the overshoot of the sleep
+    between samples."""
 
-    read_system = functools.partial(
-        _read_system,
-        data=data,
-        read_funcs=(_get_cpu, _get_memory))
+    conf = wotemu.config.get_env_config()
+    sleep = sleep if sleep else conf.system_interval
+    group_size = group_size if group_size is not None else conf.system_group_size
+    metrics = metrics if metrics else conf.system_metrics
+    metrics = metrics if metrics else DEFAULT_METRICS
 
-    invoke_callback = functools.partial(
-        _invoke_callback,
-        data=data,
-        group_size=group_size,
-        async_cb=async_cb)
+    read_funcs = _get_read_funcs(metrics)
+    with_lag = SystemMetrics.LAG in [SystemMetrics(item) for item in metrics]
+    buffer = _SampleBuffer(group_size)
+
+    _logger.debug(
+        "Monitoring system every %s s (group size: %s): %s",
+        sleep, group_size, metrics)
 
     try:
-        _get_cpu()
+        _read_system(read_funcs)
+        next_time = time.monotonic() + sleep
         await asyncio.sleep(sleep)
 
         while True:
-            read_system()
-            await invoke_callback()
-            await asyncio.sleep(sleep)
-    except asyncio.CancelledError:
-        _logger.debug("Cancelled system usage task")
+            lag = max(time.monotonic() - next_time, 0.0)
+            buffer.append(_read_system(read_funcs, lag=lag if with_lag else None))
 
+            if buffer.is_full:
+                await async_cb(buffer.drain())
 
-def _inspect_current_networks():
-    conf = wotemu.config.get_env_config()
-    docker_url = conf.docker_proxy_url
-    curr_task = get_current_task(docker_url=docker_url)
-    net_ids = get_task_networks(docker_url=docker_url, task=curr_task)
-    docker_api_client = docker.APIClient(base_url=docker_url)
-
-    return [
-        docker_api_client.inspect_network(nid)
-        for nid in net_ids
-    ]
-
+            now = time.monotonic()
+            next_time = max(next_time + sleep, now)
+            await asyncio.sleep(next_time - now)
+    except asyncio.CancelledError:
+        _logger.debug("Cancelled system usage task")
 
-def _get_subnets_cidr():
-    networks_data = _inspect_current_networks()
 
+def _get_subnets_cidr(networks_data):
     return {
         net["Name"]: [
             item["Subnet"]
@@ -259,54 +337,65 @@ def _get_subnets_cidr():
     }
 
 
-def _get_service_vips():
-    assert ENV_KEY_SERVICE_NAME in os.environ
-    service_name = os.environ[ENV_KEY_SERVICE_NAME]
+async def _resolve_vip(hostname):
+    # Cached for a limited time: the VIP changes if the service is recreated
 
-    networks_data = _inspect_current_networks()
+    cached = _vips_cache.get(hostname, None)
 
-    net_names = [
-        net["Name"]
-        for net in networks_data
-    ]
+    if cached and (time.monotonic() - cached[1]) <= _VIPS_CACHE_TTL:
+        return cached[0]
 
-    nslookup = sh.Command("nslookup")
+    _vips_cache.pop(hostname, None)
+    loop = asyncio.get_running_loop()
 
-    nslookup_results = {
-        net_name: nslookup(f"{service_name}.{net_name}")
-        for net_name in net_names
-    }
+    addr_info = await loop.getaddrinfo(
+        hostname, None,
+        family=socket.AF_INET,
+        type=socket.SOCK_STREAM)
 
-    _logger.debug(
-        "VIP nslookup results for service '%s':\n%s",
-        service_name,
-        pprint.pformat(nslookup_results))
+    if not len(addr_info):
+        return None
 
-    re_results = {
-        net_name: re.search(_NSLOOKUP_REGEX, str(res))
-        for net_name, res in nslookup_results.items()
-    }
+    vip = addr_info[0][4][0]
+    _vips_cache[hostname] = (vip, time.monotonic())
 
-    assert all(re_results.values())
-    assert all(len(res.groups()) == 1 for res in re_results.values())
+    return vip
 
-    vips = {
-        net_name: res.groups()[0]
-        for net_name, res in re_results.items()
-    }
 
-    _logger.debug(
-        "Service '%s' VIPs obtained from nslookup: %s",
-        service_name, vips)
+async def _get_service_vips(networks_data):
+    """Resolves the VIP of the current service in each network
+    through the Docker embedded DNS server. All the networks are
+    resolved concurrently and the results are cached for a while."""
 
-    return vips
+    service_name = os.getenv(ENV_KEY_SERVICE_NAME, None)
 
+    if not service_name:
+        _logger.warning("Undefined service name ($%s)", ENV_KEY_SERVICE_NAME)
+        return None
 
-def _get_task_id():
-    conf = wotemu.config.get_env_config()
-    docker_url = conf.docker_proxy_url
-    curr_task = get_current_task(docker_url=docker_url)
-    return curr_task["ID"]
+    net_names = [net["Name"] for net in networks_data]
+
+    hostnames = [
+        "{}.{}".format(service_name, net_name)
+        for net_name in net_names
+    ]
+
+    results = await asyncio.gather(
+        *[_resolve_vip(item) for item in hostnames],
+        return_exceptions=True)
+
+    vips = {}
+
+    for net_name, hostname, result in zip(net_names, hostnames, results):
+        if isinstance(result, Exception) or not result:
+            _logger.warning("Could not resolve VIP (%s): %s", hostname, repr(result))
+            continue
+
+        vips[net_name] = result
+
+    _logger.debug("Service '%s' VIPs: %s", service_name, vips)
+
+    return vips
 
 
 def _get_cpu_model_lscpu():
@@ -353,20 +442,135 @@ def _get_constraints():
     return ret
 
 
-def get_node_info():
-    net_addrs = {
+def _get_net_addrs():
+    return {
         key: [item._asdict() for item in val]
         for key, val in psutil.net_if_addrs().items()
     }
 
-    procs = {
+
+def _get_procs():
+    return {
         proc.pid: proc.info
         for proc in psutil.process_iter(["name", "username"])
     }
 
+
+def _node_key(node_id):
+    return "{}:{}:{}".format(
+        RedisPrefixes.NAMESPACE.value,
+        RedisPrefixes.NODE.value,
+        node_id)
+
+
+async def _get_cpu_model_cached(loop, executor, redis=None, node_id=None):
+    """The CPU model is the same for all the replicas that run in
+    the same Docker node, so it is shared through Redis."""
+
+    key = _node_key(node_id) if redis and node_id else None
+
+    if key:
+        try:
+            cached = await redis.hget(key, _NODE_CPU_MODEL)
+
+            if cached:
+                return cached.decode()
+        except Exception as ex:
+            _logger.warning("Error reading cached CPU model: %s", repr(ex))
+
+    cpu_model = await loop.run_in_executor(executor, _get_cpu_model)
+
+    if key and cpu_model != _UNKNOWN_CPU:
+        try:
+            await redis.hset(key, _NODE_CPU_MODEL, cpu_model)
+        except Exception as ex:
+            _logger.warning("Error caching CPU model: %s", repr(ex))
+
+    return cpu_model
+
+
+async def _run_safe(msg, awaitable):
+    try:
+        return await awaitable
+    except:
+        _logger.warning(msg, exc_info=True)
+        return None
+
+
+async def _inspect_networks(run, docker_url, task):
+    net_ids = await run(get_task_networks, docker_url, task)
+    docker_api = get_docker_api(docker_url)
+
+    return await asyncio.gather(*[
+        run(docker_api.inspect_network, nid)
+        for nid in net_ids
+    ])
+
+
+async def _get_network_info(run, docker_url, task):
+    """Service VIPs and subnetworks share the same network inspections."""
+
+    if not task:
+        return None, None
+
+    networks_data = await _run_safe(
+        "Error inspecting networks",
+        _inspect_networks(run, docker_url, task))
+
+    if networks_data is None:
+        return None, None
+
+    vips = await _run_safe(
+        "Error reading service VIPs",
+        _get_service_vips(networks_data))
+
+    return vips, _get_subnets_cidr(networks_data)
+
+
+async def get_node_info(redis=None, max_workers=_INFO_WORKERS):
+    """Collects the node details concurrently in a thread pool.
+    The current task and the network inspections are fetched
+    from the Docker API only once."""
+
+    loop = asyncio.get_running_loop()
+    conf = wotemu.config.get_env_config()
+    docker_url = conf.docker_proxy_url
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        def run(func, *args):
+            return loop.run_in_executor(executor, func, *args)
+
+        fut_procs = run(_get_procs)
+        fut_net_addrs = run(_get_net_addrs)
+
+        fut_container_id = asyncio.ensure_future(_run_safe(
+            "Error reading container ID",
+            run(get_current_container_id)))
+
+        fut_constraints = asyncio.ensure_future(_run_safe(
+            "Error reading constraints",
+            run(_get_constraints)))
+
+        task = await _run_safe(
+            "Error reading current task",
+            run(get_current_task, docker_url))
+
+        node_id = task.get("NodeID") if task else None
+
+        results = await asyncio.gather(
+            fut_procs,
+            fut_net_addrs,
+            _get_cpu_model_cached(loop, executor, redis=redis, node_id=node_id),
+            fut_container_id,
+            fut_constraints,
+            _get_network_info(run, docker_url, task))
+
+    procs, net_addrs, cpu_model, container_id, constraints, net_info = results
+    vips, networks_cidr = net_info
+
     info = {
         "cpu_count": psutil.cpu_count(),
-        "cpu_model": _get_cpu_model(),
+        "cpu_model": cpu_model,
         "mem_total": psutil.virtual_memory().total,
         "net": net_addrs,
         "python_version": platform.python_version(),
@@ -377,29 +581,15 @@ def get_node_info():
         "hostname": socket.gethostname()
     }
 
-    try:
-        info.update({"service_vips": _get_service_vips()})
-    except:
-        _logger.warning("Error reading service VIPs", exc_info=True)
-
-    try:
-        info.update({"networks_cidr": _get_subnets_cidr()})
-    except:
-        _logger.warning("Error reading subnetworks CIDR", exc_info=True)
-
-    try:
-        info.update({"container_id": get_current_container_id()})
-    except:
-        _logger.warning("Error reading container ID", exc_info=True)
-
-    try:
-        info.update({"task_id": _get_task_id()})
-    except:
-        _logger.warning("Error reading task ID", exc_info=True)
+    optional = {
+        "service_vips": vips,
+        "networks_cidr": networks_cidr,
+        "container_id": container_id,
+        "task_id": task["ID"] if task else None,
+        "node_id": node_id,
+        "constraints": constraints
+    }
 
-    try:
-        info.update({"constraints": _get_constraints()})
-    except:
-        _logger.warning("Error reading constraints", exc_info=True)
+    info.update({key: val for key, val in optional.items() if val is not None})
 
     return json.loads(json.dumps(info))
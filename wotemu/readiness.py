@@ -0,0 +1,147 @@
+"""Readiness records published in Redis by the WoT servients.
+
+Each servient writes a record when it has started and adds the ID
+of each thing to it when the thing is exposed. A notification is
+published on every update so that waiters can block on the channel
+instead of polling the catalogue of every replica over HTTP.
+
+Records do not expire: each app clears its own record on startup (a
+restarted container does not look ready from a previous run) and on stop.
+"""
+
+import asyncio
+import json
+import logging
+import time
+
+import aioredis
+from wotemu.enums import RedisPrefixes
+from wotemu.storage.manager import get_redis_manager
+from wotemu.utils import get_current_container_hostname
+
+_logger = logging.getLogger(__name__)
+
+
+def _ready_key(host):
+    return "{}:{}:{}".format(
+        RedisPrefixes.NAMESPACE.value,
+        RedisPrefixes.READY.value,
+        host)
+
+
+def _things_key(host):
+    return "{}:things".format(_ready_key(host))
+
+
+def _ready_channel():
+    return "{}:{}".format(
+        RedisPrefixes.NAMESPACE.value,
+        RedisPrefixes.READY.value)
+
+
+async def is_ready(redis, host, thing_ids=None):
+    tr = redis.multi_exec()
+    fut_exists = tr.exists(_ready_key(host))
+    fut_things = tr.smembers(_things_key(host), encoding="utf-8")
+    await tr.execute()
+
+    exists = await fut_exists
+    things = set(await fut_things)
+
+    return bool(exists) and all(tid in things for tid in (thing_ids or []))
+
+
+async def wait_ready(redis_url, hosts, thing_ids=None, timeout=None):
+    """Waits until all the given hosts have started their servient
+    and exposed the given things. Raises asyncio.TimeoutError."""
+
+    # Subscriptions take over the connection: a dedicated one is used
+
+    sub = await aioredis.create_redis(redis_url)
+    redis = await get_redis_manager(redis_url).get()
+    pending = set(hosts)
+
+    async def wait_all():
+        # Subscribe before checking the records to avoid missing updates
+
+        channel, = await sub.subscribe(_ready_channel())
+
+        for host in list(pending):
+            if await is_ready(redis, host, thing_ids=thing_ids):
+                pending.discard(host)
+
+        while pending:
+            msg = await channel.get_json()
+
+            if msg is None:
+                raise ConnectionError("Readiness channel closed")
+
+            host = msg.get("host")
+
+            if host in pending and await is_ready(redis, host, thing_ids=thing_ids):
+                _logger.debug("Node ready: %s", host)
+                pending.discard(host)
+
+    try:
+        await asyncio.wait_for(wait_all(), timeout)
+    finally:
+        sub.close()
+        await sub.wait_closed()
+
+
+class ReadinessNotifier:
+    def __init__(self, redis_url, host=None):
+        self.redis_url = redis_url
+        self._host = host
+
+    @property
+    def host(self):
+        if self._host is None:
+            self._host = get_current_container_hostname()
+
+        return self._host
+
+    async def _get_redis(self):
+        return await get_redis_manager(self.redis_url).get()
+
+    async def _publish(self, thing_id=None):
+        redis = await self._get_redis()
+        tr = redis.multi_exec()
+
+        # Things may be exposed before the servient has started
+
+        if thing_id is None:
+            tr.set(_ready_key(self.host), time.time())
+        else:
+            tr.sadd(_things_key(self.host), thing_id)
+
+        tr.publish(_ready_channel(), json.dumps({
+            "host": self.host,
+            "thing": thing_id
+        }))
+
+        await tr.execute()
+
+    async def notify_servient(self):
+        try:
+            await self._publish()
+            _logger.debug("Published servient readiness: %s", self.host)
+        except Exception as ex:
+            _logger.warning("Error publishing servient readiness: %s", repr(ex))
+
+    async def notify_thing(self, thing_id):
+        try:
+            await self._publish(thing_id=thing_id)
+            _logger.debug("Published thing readiness: %s", thing_id)
+        except Exception as ex:
+            _logger.warning("Error publishing thing readiness: %s", repr(ex))
+
+    def expose_cb(self, exposed_thing):
+        return self.notify_thing(exposed_thing.id)
+
+    async def clear(self):
+        try:
+            redis = await self._get_redis()
+            await redis.delete(_ready_key(self.host), _things_key(self.host))
+        except Exception as ex:
+            _logger.warning("Error clearing readiness: %s", repr(ex))
@@ -78,11 +78,21 @@ class ReportBuilder:
             self._reader.get_system_df,
             *args, **kwargs)
 
+    async def _get_loop_df(self, *args, **kwargs):
+        return await self._reader_exec(
+            self._reader.get_loop_df,
+            *args, **kwargs)
+
     async def _get_packet_df(self, *args, **kwargs):
         return await self._reader_exec(
             self._reader.get_packet_df,
             *args, **kwargs)
 
+    async def _get_cpu_control_df(self, *args, **kwargs):
+        return await self._reader_exec(
+            self._reader.get_cpu_control_df,
+            *args, **kwargs)
+
     async def _get_service_traffic_df(self, *args, **kwargs):
         return await self._reader_exec(
             self._reader.get_service_traffic_df,
@@ -113,6 +123,21 @@ class ReportBuilder:
             self._reader.get_snapshot_df,
             *args, **kwargs)
 
+    async def _get_redis_memory_df(self, *args, **kwargs):
+        return await self._reader_exec(
+            self._reader.get_redis_memory_df,
+            *args, **kwargs)
+
+    async def _get_netem_networks(self, *args, **kwargs):
+        return await self._reader_exec(
+            self._reader.get_netem_networks,
+            *args, **kwargs)
+
+    async def _get_netem_df(self, *args, **kwargs):
+        return await self._reader_exec(
+            self._reader.get_netem_df,
+            *args, **kwargs)
+
     def reset_cache(self):
         self._cache = {}
 
@@ -190,6 +215,101 @@ class ReportBuilder:
 
         return fig
 
+    async def build_task_cpu_control_figure(self, task):
+        df_cpu = await self._get_cpu_control_df(task=task)
+
+        if df_cpu is None or df_cpu.empty:
+            return None
+
+        df_cpu = df_cpu.reset_index()
+
+        fig = make_subplots(specs=[[{"secondary_y": True}]])
+
+        trace_speed = go.Scatter(
+            x=df_cpu["date"],
+            y=df_cpu["speed"],
+            name="Measured speed")
+
+        fig.add_trace(trace_speed, secondary_y=False)
+
+        trace_target = go.Scatter(
+            x=df_cpu["date"],
+            y=df_cpu["target_speed"],
+            name="Target speed",
+            line=dict(dash="dash"))
+
+        fig.add_trace(trace_target, secondary_y=False)
+
+        trace_quota = go.Scatter(
+            x=df_cpu["date"],
+            y=df_cpu["quota_after"],
+            name="CPU quota (cores)",
+            line=dict(dash="dot", shape="hv"))
+
+        fig.add_trace(trace_quota, secondary_y=True)
+
+        df_corr = df_cpu[df_cpu["corrected"] == True]
+
+        if not df_corr.empty:
+            trace_corr = go.Scatter(
+                x=df_corr["date"],
+                y=df_corr["quota_after"],
+                name="Quota corrections",
+                mode="markers")
+
+            fig.add_trace(trace_corr, secondary_y=True)
+
+        fig.update_layout(title_text="CPU speed control")
+        fig.update_xaxes(title_text="Date (UTC)")
+        fig.update_yaxes(title_text="Speed", secondary_y=False)
+        fig.update_yaxes(title_text="Cores", secondary_y=True)
+
+        return fig
+
+    async def build_task_loop_figure(self, task):
+        df_loop = await self._get_loop_df(task=task)
+
+        if df_loop.empty:
+            return None
+
+        df_loop = df_loop.reset_index()
+
+        fig = make_subplots(specs=[[{"secondary_y": True}]])
+
+        trace_lag = go.Scatter(
+            x=df_loop["date"],
+            y=df_loop["loop_lag"] * 1e3,
+            name="Loop lag (ms)")
+
+        fig.add_trace(trace_lag, secondary_y=False)
+
+        trace_tasks = go.Scatter(
+            x=df_loop["date"],
+            y=df_loop["tasks"],
+            name="Pending tasks",
+            line=dict(dash="dot"))
+
+        fig.add_trace(trace_tasks, secondary_y=True)
+
+        if "slow_max" in df_loop and df_loop["slow_max"].notna().any():
+            df_slow = df_loop[df_loop["slow_max"].notna()]
+
+            trace_slow = go.Scatter(
+                x=df_slow["date"],
+                y=df_slow["slow_max"] * 1e3,
+                name="Slowest callback (ms)",
+                mode="markers",
+                text=df_slow["slow_callback"])
+
+            fig.add_trace(trace_slow, secondary_y=False)
+
+        fig.update_layout(title_text="Event loop")
+        fig.update_xaxes(title_text="Date (UTC)")
+        fig.update_yaxes(title_text="ms", secondary_y=False)
+        fig.update_yaxes(title_text="Tasks", secondary_y=True)
+
+        return fig
+
     async def _build_task_packet_figure(self, task, freq, col):
         df = await self._get_packet_df(task=task, extended=True)
 
@@ -344,8 +464,48 @@ class ReportBuilder:
             showlegend=True,
             title_text="Data transfer by network ({} windows)".format(freq))
 
+        await self._add_netem_traces(fig, networks=df["network"].unique())
+
         return fig
 
+    async def _add_netem_traces(self, fig, networks):
+        """Overlays the network conditions applied by the
+        gateways (latency and rate) on a secondary axis."""
+
+        netem_networks = set(await self._get_netem_networks())
+        has_traces = False
+
+        for network in networks:
+            if network not in netem_networks:
+                continue
+
+            df_netem = await self._get_netem_df(network=network)
+
+            if df_netem is None or df_netem.empty:
+                continue
+
+            for col, label in (("latency", "latency (ms)"), ("rate_kbit", "rate (kbit/s)")):
+                if col not in df_netem:
+                    continue
+
+                has_traces = True
+
+                fig.add_trace(go.Scatter(
+                    x=df_netem.index,
+                    y=df_netem[col],
+                    name="{} {}".format(network, label),
+                    line_shape="hv",
+                    line_dash="dot",
+                    yaxis="y2"))
+
+        if has_traces:
+            fig.update_layout(yaxis2={
+                "title": "Netem",
+                "overlaying": "y",
+                "side": "right",
+                "showgrid": False
+            })
+
     async def build_thing_counts_figure(self, task, facet_col_wrap=2):
         df = await self._get_thing_df(task=task)
 
@@ -636,6 +796,46 @@ class ReportBuilder:
 
         return fig
 
+    async def build_redis_memory_figure(self, height=_MIN_HEIGHT):
+        df = await self._get_redis_memory_df()
+
+        if df is None or df.empty:
+            return None
+
+        df.reset_index(inplace=True)
+
+        cols = [
+            col for col in ["used_memory", "used_memory_rss", "used_memory_peak"]
+            if col in df
+        ]
+
+        if "maxmemory" in df and (df["maxmemory"] > 0).any():
+            cols.append("maxmemory")
+
+        is_sharded = "shard" in df and df["shard"].nunique() > 1
+        id_vars = ["date", "shard"] if is_sharded else ["date"]
+
+        df_mb = df[[*id_vars, *cols]].melt(
+            id_vars=id_vars,
+            var_name="metric",
+            value_name="value")
+
+        df_mb["mem_mb"] = df_mb["value"] / (1024.0 ** 2)
+
+        fig = px.line(
+            df_mb,
+            x="date",
+            y="mem_mb",
+            color="metric",
+            line_dash="shard" if is_sharded else None,
+            height=height)
+
+        fig.update_xaxes(title_text="Date (UTC)")
+        fig.update_yaxes(title_text="Memory (MB)")
+        fig.update_layout(title_text="Redis memory usage")
+
+        return fig
+
     async def build_task_timeline_figure(self, height_task=45):
         df_snap = await self._get_snapshot_df()
 
@@ -668,6 +868,8 @@ class ReportBuilder:
     async def _get_task_section_component(self, task):
         fig_mem = await self.build_task_mem_figure(task=task)
         fig_cpu = await self.build_task_cpu_figure(task=task)
+        fig_loop = await self.build_task_loop_figure(task=task)
+        fig_cpu_control = await self.build_task_cpu_control_figure(task=task)
         fig_packet_iface = await self.build_task_packet_iface_figure(task=task)
         fig_packet_proto = await self.build_task_packet_protocol_figure(task=task)
         fig_thing_counts = await self.build_thing_counts_figure(task=task)
@@ -700,6 +902,8 @@ class ReportBuilder:
             fig_exps_events=fig_exps_events,
             snapshot=snapshot,
             info=info,
+            fig_loop=fig_loop,
+            fig_cpu_control=fig_cpu_control,
             title=task)
 
     async def _get_service_traffic_component(self):
@@ -742,6 +946,12 @@ class ReportBuilder:
 
         return ContainerComponent(elements=elements)
 
+    async def _get_redis_memory_component(self):
+        fig = await self.build_redis_memory_figure()
+        title = "Redis memory usage"
+        elements = [FigureBlockComponent(fig, title=title)] if fig else []
+        return ContainerComponent(elements=elements)
+
     async def _get_header_component(self):
         title = lxml.etree.Element("h1", attrib={"class": "display-4"})
         title.text = "WoTemu report"
@@ -798,6 +1008,7 @@ class ReportBuilder:
         service_traffic = await self._get_service_traffic_component()
         network_traffic = await self._get_network_traffic_component()
         system_ranking = await self._get_system_ranking_component()
+        redis_memory = await self._get_redis_memory_component()
         header = await self._get_header_component()
         timeline = await self._get_timeline_component()
         compose_comp = await self._get_compose_component()
@@ -821,6 +1032,7 @@ class ReportBuilder:
             service_traffic,
             network_traffic,
             system_ranking,
+            redis_memory,
             timeline,
             task_list
         ])
@@ -864,12 +1076,16 @@ class ReportBuilder:
 
         for task_id in task_ids:
             df_system = await self._get_system_df(task=task_id)
+            df_loop = await self._get_loop_df(task=task_id)
+            df_cpu_control = await self._get_cpu_control_df(task=task_id)
             df_packet = await self._get_packet_df(task=task_id, extended=True)
             df_interactions = await self._get_thing_df(task=task_id)
             info = await self._get_info(task_id, latest=True)
 
             tasks_data[task_id] = {
                 "system": json_df(df_system),
+                "loop": json_df(df_loop),
+                "cpu_control": json_df(df_cpu_control),
                 "packet": json_df(df_packet),
                 "interaction": json_df(df_interactions),
                 "info": info
@@ -878,6 +1094,12 @@ class ReportBuilder:
         df_inb = await self._get_service_traffic_df(inbound=True)
         df_out = await self._get_service_traffic_df(inbound=False)
         df_snap = await self._get_snapshot_df()
+        df_redis_memory = await self._get_redis_memory_df()
+
+        netem = {
+            network: json_df(await self._get_netem_df(network=network))
+            for network in await self._get_netem_networks()
+        }
 
         app_metrics = await self._reader.get_app_metrics()
 
@@ -888,6 +1110,8 @@ class ReportBuilder:
             },
             "tasks": tasks_data,
             "snapshot": json_df(df_snap),
+            "redis_memory": json_df(df_redis_memory),
+            "netem": netem,
             "app_metrics": app_metrics
         }
 
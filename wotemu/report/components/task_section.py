@@ -27,9 +27,11 @@ class TaskSectionComponent(BaseComponent):
     def __init__(
             self, fig_mem, fig_cpu, fig_packet_iface, fig_packet_proto, fig_thing_counts,
             fig_cons_req_lat, fig_exps_req_lat, fig_cons_events, fig_exps_events, snapshot, info,
-            title=None, height=450):
+            fig_loop=None, fig_cpu_control=None, title=None, height=450):
         self.fig_mem = fig_mem
         self.fig_cpu = fig_cpu
+        self.fig_loop = fig_loop
+        self.fig_cpu_control = fig_cpu_control
         self.fig_packet_iface = fig_packet_iface
         self.fig_packet_proto = fig_packet_proto
         self.fig_thing_counts = fig_thing_counts
@@ -184,6 +186,8 @@ class TaskSectionComponent(BaseComponent):
         figs = [
             self.fig_mem,
             self.fig_cpu,
+            self.fig_loop,
+            self.fig_cpu_control,
             self.fig_packet_iface,
             self.fig_packet_proto
         ]
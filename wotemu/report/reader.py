@@ -1,3 +1,4 @@
+import asyncio
 import functools
 import json
 import logging
@@ -10,6 +11,7 @@ import netaddr
 import numpy as np
 import pandas as pd
 from wotemu.enums import RedisPrefixes
+from wotemu.storage.base import StreamStorage, read_telemetry
 from wotemu.topology.compose import ENV_KEY_SERVICE_NAME
 
 _IFACE_LO = "lo"
@@ -80,48 +82,88 @@ def explode_dict_column(df, col):
         df[f"{col}_{key}"] = df[col].apply(mapper)
 
 
+def _build_telemetry_df(rows):
+    for row in rows:
+        row_date = datetime.fromtimestamp(row["time"], timezone.utc)
+        row.update({"date": row_date})
+
+    df = pd.DataFrame(rows)
+
+    if "date" in df:
+        df.set_index("date", inplace=True)
+
+    return df
+
+
 class ReportDataRedisReader:
+    """Reads the emulation data from one or more Redis shards.
+    Reads are fanned out to all shards in parallel and merged.
+    The first shard holds the keys written by the CLI (e.g. snapshots)."""
+
     def __init__(self, redis_url):
-        self._redis_url = redis_url
-        self._client = None
+        self._redis_urls = [redis_url] \
+            if isinstance(redis_url, str) else list(redis_url)
+
+        self._clients = []
+
+    @property
+    def _client(self):
+        return self._clients[0] if len(self._clients) else None
 
     async def connect(self):
         await self.close()
-        self._client = await aioredis.create_redis_pool(self._redis_url)
+
+        self._clients = list(await asyncio.gather(*[
+            aioredis.create_redis_pool(redis_url)
+            for redis_url in self._redis_urls
+        ]))
 
     async def close(self):
-        if self._client is None:
-            return
+        clients, self._clients = self._clients, []
+
+        for client in clients:
+            try:
+                client.close()
+                await client.wait_closed()
+            except Exception as ex:
+                _logger.warning("Error closing connection: %s", ex)
+
+    async def _gather(self, func):
+        return await asyncio.gather(*[
+            func(client) for client in self._clients
+        ])
 
-        try:
-            self._client.close()
-            await self._client.wait_closed()
-        except Exception as ex:
-            _logger.warning("Error closing connection: %s", ex)
-        finally:
-            self._client = None
+    async def _keys(self, pattern):
+        results = await self._gather(lambda client: client.keys(pattern=pattern))
+        return sorted({key for keys in results for key in keys})
 
-    async def _get_zrange_df(self, key):
-        members = await self._client.zrange(key=key)
-        rows = [json.loads(item) for item in members]
+    async def _read_telemetry(self, key):
+        results = await self._gather(lambda client: read_telemetry(client, key))
+        rows = [row for shard_rows in results for row in shard_rows]
 
-        for row in rows:
-            row_date = datetime.fromtimestamp(row["time"], timezone.utc)
-            row.update({"date": row_date})
+        if len(results) > 1:
+            rows.sort(key=lambda row: row.get("time", 0))
 
-        df = pd.DataFrame(rows)
+        return rows
 
-        if "date" in df:
-            df.set_index("date", inplace=True)
+    async def _find_client(self, key):
+        exists = await self._gather(lambda client: client.exists(key))
 
-        return df
+        return next((
+            client for client, is_found in zip(self._clients, exists)
+            if is_found
+        ), self._client)
+
+    async def _get_telemetry_df(self, key):
+        rows = await self._read_telemetry(key)
+        return _build_telemetry_df(rows)
 
     async def get_tasks(self):
         pattern = "{}:{}:*".format(
             RedisPrefixes.NAMESPACE.value,
             RedisPrefixes.INFO.value)
 
-        keys = await self._client.keys(pattern=pattern)
+        keys = await self._keys(pattern=pattern)
 
         return {key.decode().split(":")[-1] for key in keys}
 
@@ -131,8 +173,8 @@ class ReportDataRedisReader:
             RedisPrefixes.INFO.value,
             task)
 
-        members = await self._client.zrange(key=key)
-        rows = [json.loads(item) for item in members]
+        results = await self._gather(lambda client: client.zrange(key=key))
+        rows = [json.loads(item) for members in results for item in members]
         rows.sort(key=lambda row: row["time"])
 
         if latest:
@@ -168,7 +210,55 @@ class ReportDataRedisReader:
             RedisPrefixes.SYSTEM.value,
             task)
 
-        return await self._get_zrange_df(key=key)
+        return await self._get_telemetry_df(key=key)
+
+    async def get_loop_df(self, task):
+        key = "{}:{}:{}".format(
+            RedisPrefixes.NAMESPACE.value,
+            RedisPrefixes.LOOP.value,
+            task)
+
+        return await self._get_telemetry_df(key=key)
+
+    async def get_netem_networks(self):
+        pattern = "{}:{}:*".format(
+            RedisPrefixes.NAMESPACE.value,
+            RedisPrefixes.NETEM.value)
+
+        keys = await self._keys(pattern=pattern)
+
+        return sorted(set(key.decode().split(":", 2)[2] for key in keys))
+
+    async def get_netem_df(self, network):
+        key = "{}:{}:{}".format(
+            RedisPrefixes.NAMESPACE.value,
+            RedisPrefixes.NETEM.value,
+            network)
+
+        return await self._get_telemetry_df(key=key)
+
+    async def get_cpu_control_df(self, task):
+        key = "{}:{}:{}".format(
+            RedisPrefixes.NAMESPACE.value,
+            RedisPrefixes.CPU.value,
+            task)
+
+        return await self._get_telemetry_df(key=key)
+
+    async def get_redis_memory_df(self):
+        key = "{}:{}".format(
+            RedisPrefixes.NAMESPACE.value,
+            RedisPrefixes.MEMORY.value)
+
+        results = await self._gather(lambda client: read_telemetry(client, key))
+
+        rows = [
+            {**row, "shard": shard}
+            for shard, shard_rows in enumerate(results)
+            for row in shard_rows
+        ]
+
+        return _build_telemetry_df(rows)
 
     async def get_packet_df(self, task, extended=False):
         pattern = "{}:{}:*:{}".format(
@@ -176,7 +266,7 @@ class ReportDataRedisReader:
             RedisPrefixes.PACKET.value,
             task)
 
-        packet_keys = await self._client.keys(pattern=pattern)
+        packet_keys = await self._keys(pattern=pattern)
 
         if len(packet_keys) == 0:
             _logger.debug(
@@ -188,7 +278,7 @@ class ReportDataRedisReader:
 
         for key in packet_keys:
             iface = key.decode().split(":")[2]
-            df_iface = await self._get_zrange_df(key=key)
+            df_iface = await self._get_telemetry_df(key=key)
             df_iface["iface"] = iface
             df_iface.set_index(["iface"], append=True, inplace=True)
             dfs.append(df_iface)
@@ -283,7 +373,7 @@ class ReportDataRedisReader:
             RedisPrefixes.THING.value,
             task)
 
-        df = await self._get_zrange_df(key=key)
+        df = await self._get_telemetry_df(key=key)
 
         for col in ["thing", "name", "verb"]:
             if col in df:
@@ -439,19 +529,31 @@ class ReportDataRedisReader:
             RedisPrefixes.NAMESPACE.value,
             RedisPrefixes.APP.value)
 
-        keys = await self._client.keys(pattern=pattern)
+        keys = await self._keys(pattern=pattern)
         keys = [item.decode() for item in keys]
 
         metrics = []
 
         for key in keys:
-            members = await self._client.zrange(key=key, start=0, stop=-1)
             splitted = key.split(":")
 
             metrics.append({
                 "key": splitted[-1],
                 "task": splitted[-2],
-                "data": [json.loads(item) for item in members]
+                "data": await self._read_telemetry(key)
             })
 
         return metrics
+
+    async def consume_telemetry(self, key, last_id=None, count=None, timeout=None):
+        """Incrementally reads the records of a key written with the 
+        stream storage backend. Returns the new records and the 
+        stream ID that should be used in the next call."""
+
+        storage = StreamStorage(await self._find_client(key))
+
+        return await storage.consume(
+            key=key,
+            last_id=last_id,
+            count=count,
+            timeout=timeout)
@@ -0,0 +1,147 @@
+"""Storage backends for the telemetry records written to Redis.
+
+Records are JSON-serializable dicts that contain a ``time`` key.
+Sorted sets (the default backend) use that timestamp as the score, 
+while streams keep the records in insertion order and are trimmed 
+with an approximate MAXLEN to bound the memory footprint.
+"""
+
+import json
+import logging
+import time
+
+import wotemu.config
+from wotemu.enums import StorageBackends
+
+_STREAM_FIELD = b"data"
+_TYPE_STREAM = b"stream"
+
+_logger = logging.getLogger(__name__)
+
+
+class BaseStorage:
+    backend = None
+
+    def __init__(self, redis):
+        self._redis = redis
+
+    @property
+    def redis(self):
+        return self._redis
+
+    def add_to(self, tr, key, items):
+        raise NotImplementedError
+
+    async def read(self, key):
+        raise NotImplementedError
+
+    async def write(self, key, items):
+        if not items:
+            return
+
+        tr = self._redis.multi_exec()
+        self.add_to(tr, key, items)
+        exec_res = await tr.execute()
+        self._check_result(key, exec_res)
+
+        return exec_res
+
+    def _check_result(self, key, exec_res):
+        pass
+
+
+class ZSetStorage(BaseStorage):
+    backend = StorageBackends.ZSET
+
+    def add_to(self, tr, key, items):
+        _logger.debug("ZADD (%s items): %s", len(items), key)
+
+        for item in items:
+            score = item.get("time", item.get("created_at", time.time()))
+            member = json.dumps(item)
+            tr.zadd(key=key, score=score, member=member)
+
+    def _check_result(self, key, exec_res):
+        if not all(exec_res):
+            _logger.warning("Error in Redis MULTI ZADD (%s): %s", key, exec_res)
+
+    async def read(self, key):
+        members = await self._redis.zrange(key=key)
+        return [json.loads(item) for item in members]
+
+
+class StreamStorage(BaseStorage):
+    backend = StorageBackends.STREAM
+
+    def __init__(self, redis, max_len=None):
+        super().__init__(redis)
+        self.max_len = max_len
+
+    def add_to(self, tr, key, items):
+        _logger.debug("XADD (%s items): %s", len(items), key)
+
+        for item in items:
+            tr.xadd(
+                key,
+                {_STREAM_FIELD: json.dumps(item)},
+                max_len=self.max_len,
+                exact_len=False)
+
+    @classmethod
+    def _parse_fields(cls, fields):
+        return json.loads(fields[_STREAM_FIELD])
+
+    async def read(self, key):
+        messages = await self._redis.xrange(key)
+
+        return [
+            self._parse_fields(fields)
+            for _msg_id, fields in messages
+        ]
+
+    async def consume(self, key, last_id=None, count=None, timeout=None):
+        """Reads the records appended to the stream after ``last_id``.
+        Returns the records and the ID that should be passed 
+        to the next call to continue reading incrementally."""
+
+        last_id = last_id if last_id else b"0-0"
+
+        messages = await self._redis.xread(
+            [key],
+            timeout=timeout,
+            count=count,
+            latest_ids=[last_id])
+
+        items = [
+            self._parse_fields(fields)
+            for _stream, _msg_id, fields in messages
+        ]
+
+        if len(messages):
+            last_id = messages[-1][1]
+
+        return items, last_id
+
+
+def get_storage(redis, backend=None, max_len=None):
+    conf = wotemu.config.get_env_config()
+    backend = backend if backend else conf.redis_backend
+    backend = StorageBackends(backend)
+
+    if backend == StorageBackends.STREAM:
+        max_len = max_len if max_len else conf.redis_stream_maxlen
+        return StreamStorage(redis, max_len=max_len)
+
+    return ZSetStorage(redis)
+
+
+async def read_telemetry(redis, key):
+    """Reads all the records stored in a key regardless of 
+    the backend that was originally used to write them."""
+
+    key_type = await redis.type(key)
+
+    if key_type == _TYPE_STREAM:
+        return await StreamStorage(redis).read(key)
+
+    return await ZSetStorage(redis).read(key)
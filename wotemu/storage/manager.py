@@ -0,0 +1,192 @@
+"""Process-wide Redis connection manager.
+
+All the Redis writers of a process (telemetry writer, node monitor,
+readiness notifier and thing callbacks) share one bounded connection
+pool per Redis URL. Health checks run in a background task instead of
+in the hot path, and reconnections are attempted with exponential
+backoff (callers fail fast while the backoff is active).
+"""
+
+import asyncio
+import logging
+import time
+
+import aioredis
+import wotemu.config
+
+_BACKOFF_MIN = 0.5
+_BACKOFF_MAX = 30.0
+
+_logger = logging.getLogger(__name__)
+_managers = {}
+
+
+class RedisUnavailable(ConnectionError):
+    pass
+
+
+class RedisManager:
+    def __init__(self, redis_url, pool_size=None, health_interval=None):
+        conf = wotemu.config.get_env_config()
+        self.redis_url = redis_url
+        self.pool_size = pool_size or conf.redis_pool_size
+
+        self.health_interval = health_interval \
+            if health_interval is not None else conf.redis_health_interval
+
+        self._pool = None
+        self._lock = None
+        self._task_health = None
+        self._backoff = 0
+        self._next_attempt = 0
+
+        self._counters = {
+            "connects": 0,
+            "failures": 0,
+            "health_errors": 0
+        }
+
+    @property
+    def stats(self):
+        return {
+            **self._counters,
+            "connected": self.is_connected,
+            "backoff": self._backoff
+        }
+
+    @property
+    def is_connected(self):
+        return self._pool is not None and not self._pool.closed
+
+    def _schedule_retry(self):
+        self._backoff = min(
+            max(self._backoff * 2, _BACKOFF_MIN),
+            _BACKOFF_MAX)
+
+        self._next_attempt = time.time() + self._backoff
+
+    def _ensure_health_task(self):
+        if self._task_health or not self.health_interval:
+            return
+
+        self._task_health = asyncio.ensure_future(self._run_health())
+
+    async def _connect(self):
+        now = time.time()
+
+        if now < self._next_attempt:
+            raise RedisUnavailable("Redis unavailable (retry in {:.1f} s): {}".format(
+                self._next_attempt - now, self.redis_url))
+
+        try:
+            self._pool = await aioredis.create_redis_pool(
+                self.redis_url,
+                minsize=1,
+                maxsize=self.pool_size)
+        except Exception:
+            self._counters["failures"] += 1
+            self._schedule_retry()
+            raise
+
+        self._counters["connects"] += 1
+        self._backoff = 0
+        self._next_attempt = 0
+
+        _logger.debug(
+            "Opened Redis pool to: %s (maxsize=%s)",
+            self.redis_url, self.pool_size)
+
+    async def get(self):
+        """Returns the shared pool, connecting if necessary."""
+
+        if self.is_connected:
+            return self._pool
+
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            if not self.is_connected:
+                await self._connect()
+
+        self._ensure_health_task()
+
+        return self._pool
+
+    async def _discard(self):
+        pool = self._pool
+        self._pool = None
+
+        if pool is None:
+            return
+
+        pool.close()
+
+        try:
+            await pool.wait_closed()
+        except Exception as ex:
+            _logger.debug("Error closing Redis pool: %s", repr(ex))
+
+    async def report_error(self, ex=None):
+        """Called by the users of the pool on connection errors:
+        the pool is discarded and rebuilt after the backoff."""
+
+        _logger.warning("Redis error (%s): %s", self.redis_url, repr(ex))
+        self._counters["failures"] += 1
+        self._schedule_retry()
+        await self._discard()
+
+    async def _run_health(self):
+        try:
+            while True:
+                await asyncio.sleep(self.health_interval)
+
+                if not self.is_connected:
+                    continue
+
+                try:
+                    await asyncio.wait_for(
+                        self._pool.ping(),
+                        timeout=self.health_interval)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as ex:
+                    self._counters["health_errors"] += 1
+                    await self.report_error(ex)
+        except asyncio.CancelledError:
+            _logger.debug("Cancelled Redis health check task")
+
+    async def close(self):
+        if self._task_health:
+            self._task_health.cancel()
+            await asyncio.gather(self._task_health, return_exceptions=True)
+            self._task_health = None
+
+        await self._discard()
+
+        _logger.debug("Redis manager stats (%s): %s", self.redis_url, self.stats)
+
+
+def get_redis_manager(redis_url=None):
+    """Returns the Redis manager shared by the current process."""
+
+    if not redis_url:
+        redis_url = wotemu.config.get_env_config().redis_url
+
+    if not redis_url:
+        raise RuntimeError("Undefined Redis URL")
+
+    if redis_url not in _managers:
+        _managers[redis_url] = RedisManager(redis_url=redis_url)
+
+    return _managers[redis_url]
+
+
+async def close_redis_managers():
+    for redis_url in list(_managers.keys()):
+        manager = _managers.pop(redis_url)
+
+        try:
+            await manager.close()
+        except Exception:
+            _logger.warning("Error closing Redis manager", exc_info=True)
@@ -0,0 +1,339 @@
+"""Retention policies for the telemetry keys written to Redis.
+
+Policies are defined per key family (e.g. ``packet`` for all the
+``wotemu:packet:*`` keys) with a maximum age and/or a maximum number
+of records. They are enforced periodically by the telemetry writers on
+the keys they have written since the last run. Optionally, the records
+that are about to be trimmed are first aggregated in coarser buckets
+(mean of the numeric fields) under ``wotemu:rollup:<family>:*``. Only
+whole buckets are aggregated. Rollup keys are bounded as well: by
+default they keep ``ROLLUP_AGE_FACTOR`` times the max age of the family
+and the same max number of records (each one being a whole bucket).
+
+The writers also sample the memory usage of Redis so that
+it can be displayed in the report.
+"""
+
+import collections
+import json
+import logging
+import math
+import socket
+import time
+
+from wotemu.enums import RedisPrefixes, StorageBackends
+
+RETENTION_FAMILIES = [
+    RedisPrefixes.PACKET.value,
+    RedisPrefixes.SYSTEM.value,
+    RedisPrefixes.THING.value,
+    RedisPrefixes.LOOP.value,
+    RedisPrefixes.CPU.value,
+    RedisPrefixes.NETEM.value,
+    RedisPrefixes.APP.value
+]
+
+ROLLUP_AGE_FACTOR = 10
+
+_MEMORY_FIELDS = [
+    "used_memory",
+    "used_memory_rss",
+    "used_memory_peak",
+    "maxmemory"
+]
+
+_logger = logging.getLogger(__name__)
+
+
+class RetentionPolicy:
+    def __init__(
+            self, max_age=None, max_len=None, rollup=None,
+            rollup_max_age=None, rollup_max_len=None):
+        if max_age is None and max_len is None:
+            raise ValueError("Undefined max_age and max_len")
+
+        if rollup is not None and rollup <= 0:
+            raise ValueError("The rollup bucket size should be positive")
+
+        self.max_age = max_age
+        self.max_len = max_len
+        self.rollup = rollup
+
+        if rollup_max_age is None and max_age is not None:
+            rollup_max_age = max_age * ROLLUP_AGE_FACTOR
+
+        if rollup_max_len is None:
+            rollup_max_len = max_len
+
+        self.rollup_max_age = rollup_max_age
+        self.rollup_max_len = rollup_max_len
+
+    def to_dict(self):
+        return {
+            "max_age": self.max_age,
+            "max_len": self.max_len,
+            "rollup": self.rollup,
+            "rollup_max_age": self.rollup_max_age,
+            "rollup_max_len": self.rollup_max_len
+        }
+
+    @classmethod
+    def from_dict(cls, val):
+        return cls(**val)
+
+
+def parse_policies(val):
+    """Parses a family to policy mapping. Accepts
+    RetentionPolicy instances, dicts or JSON strings."""
+
+    if not val:
+        return {}
+
+    if isinstance(val, str):
+        val = json.loads(val)
+
+    policies = {}
+
+    for family, policy in val.items():
+        if family not in RETENTION_FAMILIES:
+            raise ValueError("Unknown key family: {}".format(family))
+
+        if not isinstance(policy, RetentionPolicy):
+            policy = RetentionPolicy.from_dict(policy)
+
+        policies[family] = policy
+
+    return policies
+
+
+def get_key_family(key):
+    parts = key.split(":")
+
+    if len(parts) < 3 or parts[0] != RedisPrefixes.NAMESPACE.value:
+        return None
+
+    return parts[1]
+
+
+def get_rollup_key(key):
+    parts = key.split(":")
+
+    return ":".join([
+        RedisPrefixes.NAMESPACE.value,
+        RedisPrefixes.ROLLUP.value,
+        *parts[1:]
+    ])
+
+
+def get_memory_key():
+    return "{}:{}".format(
+        RedisPrefixes.NAMESPACE.value,
+        RedisPrefixes.MEMORY.value)
+
+
+def _item_time(item, score):
+    return item.get("time", item.get("created_at", score))
+
+
+def rollup_items(items, bucket):
+    """Aggregates (item, score) tuples in buckets of the given size in seconds.
+    Returns one record per bucket with the mean of each numeric field."""
+
+    buckets = collections.OrderedDict()
+
+    for item, score in items:
+        tstamp = _item_time(item, score)
+        bucket_time = math.floor(tstamp / bucket) * bucket
+        buckets.setdefault(bucket_time, []).append(item)
+
+    rows = []
+
+    for bucket_time, bucket_items in buckets.items():
+        sums = collections.defaultdict(float)
+        counts = collections.defaultdict(int)
+
+        for item in bucket_items:
+            for field, val in item.items():
+                if isinstance(val, bool) or not isinstance(val, (int, float)):
+                    continue
+
+                sums[field] += val
+                counts[field] += 1
+
+        row = {field: sums[field] / counts[field] for field in sums}
+
+        row.update({
+            "time": bucket_time,
+            "bucket": bucket,
+            "count": len(bucket_items)
+        })
+
+        rows.append(row)
+
+    return rows
+
+
+class RetentionEnforcer:
+    def __init__(self, policies, interval):
+        self.policies = parse_policies(policies)
+        self.interval = interval
+        self._keys = set()
+        self._last_run = time.time()
+
+        self._counters = {
+            "runs": 0,
+            "trimmed": 0,
+            "rollups": 0
+        }
+
+    @property
+    def stats(self):
+        return dict(self._counters)
+
+    def track(self, keys):
+        if not self.policies:
+            return
+
+        self._keys.update(
+            key for key in keys
+            if get_key_family(key) in self.policies)
+
+    @property
+    def is_due(self):
+        return (time.time() - self._last_run) >= self.interval
+
+    async def _rollup_zset(self, redis, key, policy, max_score):
+        items = await redis.zrangebyscore(
+            key, max=max_score, withscores=True,
+            exclude=redis.ZSET_EXCLUDE_MAX)
+
+        if not items:
+            return
+
+        parsed = [(json.loads(member), score) for member, score in items]
+        rows = rollup_items(parsed, policy.rollup)
+
+        tr = redis.multi_exec()
+
+        for row in rows:
+            tr.zadd(get_rollup_key(key), row["time"], json.dumps(row))
+
+        await tr.execute()
+
+        self._counters["rollups"] += len(rows)
+
+    async def _trim_rollup_zset(self, redis, key, policy, now):
+        rollup_key = get_rollup_key(key)
+
+        if policy.rollup_max_age is not None:
+            await redis.zremrangebyscore(
+                rollup_key, max=now - policy.rollup_max_age,
+                exclude=redis.ZSET_EXCLUDE_MAX)
+
+        if policy.rollup_max_len is not None:
+            await redis.zremrangebyrank(
+                rollup_key, 0, -(policy.rollup_max_len + 1))
+
+    def _bucket_start(self, policy, score):
+        return math.floor(score / policy.rollup) * policy.rollup
+
+    async def _enforce_zset(self, redis, key, policy, now):
+        trimmed = 0
+
+        if policy.max_age is not None:
+            max_score = now - policy.max_age
+
+            # Aligned to the buckets so that these are not split across runs
+
+            if policy.rollup:
+                max_score = self._bucket_start(policy, max_score)
+                await self._rollup_zset(redis, key, policy, max_score)
+
+            trimmed += await redis.zremrangebyscore(
+                key, max=max_score, exclude=redis.ZSET_EXCLUDE_MAX)
+
+        if policy.max_len is not None and policy.rollup:
+            # The bucket of the newest record over the limit is kept
+            # until the next run, so that only whole buckets are trimmed
+
+            last = await redis.zrange(
+                key, -(policy.max_len + 1), -(policy.max_len + 1),
+                withscores=True)
+
+            if last:
+                max_score = self._bucket_start(policy, last[0][1])
+                await self._rollup_zset(redis, key, policy, max_score)
+
+                trimmed += await redis.zremrangebyscore(
+                    key, max=max_score, exclude=redis.ZSET_EXCLUDE_MAX)
+        elif policy.max_len is not None:
+            trimmed += await redis.zremrangebyrank(key, 0, -(policy.max_len + 1))
+
+        if policy.rollup:
+            await self._trim_rollup_zset(redis, key, policy, now)
+
+        return trimmed
+
+    async def _enforce_stream(self, redis, key, policy):
+        # Redis 5 streams can only be trimmed by length (there is no MINID)
+
+        if policy.max_len is None:
+            return 0
+
+        return await redis.xtrim(key, policy.max_len, exact_len=False)
+
+    async def enforce(self, redis, backend=None):
+        backend = StorageBackends(backend) if backend else StorageBackends.ZSET
+        keys, self._keys = self._keys, set()
+        now = time.time()
+
+        for key in keys:
+            policy = self.policies[get_key_family(key)]
+
+            try:
+                if backend == StorageBackends.STREAM:
+                    trimmed = await self._enforce_stream(redis, key, policy)
+                else:
+                    trimmed = await self._enforce_zset(redis, key, policy, now)
+
+                self._counters["trimmed"] += trimmed or 0
+            except Exception as ex:
+                _logger.warning("Error enforcing retention (%s): %s", key, repr(ex))
+
+        self._counters["runs"] += 1
+        self._last_run = time.time()
+
+    async def sample_memory(self, redis):
+        """Appends a sample of the memory usage of Redis. A lock with the
+        interval as TTL ensures one sample per interval across all writers."""
+
+        lock_key = "{}:lock".format(get_memory_key())
+        ttl = max(int(self.interval), 1)
+
+        if not (await redis.set(lock_key, socket.gethostname(), expire=ttl, exist=redis.SET_IF_NOT_EXIST)):
+            return
+
+        info = await redis.info("memory")
+        info = info.get("memory", {})
+        now = time.time()
+
+        row = {
+            field: int(info[field])
+            for field in _MEMORY_FIELDS
+            if field in info
+        }
+
+        row.update({"time": now})
+
+        await redis.zadd(get_memory_key(), now, json.dumps(row))
+
+    async def run(self, redis, backend=None):
+        if not self.is_due:
+            return
+
+        await self.enforce(redis, backend=backend)
+
+        try:
+            await self.sample_memory(redis)
+        except Exception as ex:
+            _logger.debug("Error sampling Redis memory: %s", repr(ex))
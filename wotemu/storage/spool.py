@@ -0,0 +1,145 @@
+"""Append-only local spool for telemetry that could not be written to Redis.
+
+Records are encoded as JSON lines (``[key, item]``) and appended to a
+file with a bounded size. Records that do not fit are discarded and
+counted as lost. The spool is replayed in chunks once Redis is
+available again, and truncated when it has been fully replayed.
+"""
+
+import json
+import logging
+import os
+
+_logger = logging.getLogger(__name__)
+
+
+class TelemetrySpool:
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._size = 0
+        self._offset = 0
+
+        self._counters = {
+            "spooled": 0,
+            "replayed": 0,
+            "lost": 0
+        }
+
+        self._init_file()
+
+    def _init_file(self):
+        dir_path = os.path.dirname(self.path)
+
+        if dir_path:
+            os.makedirs(dir_path, exist_ok=True)
+
+        try:
+            self._size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            self._size = 0
+
+        if self._size:
+            _logger.info(
+                "Found spooled telemetry (%s bytes): %s",
+                self._size, self.path)
+
+    @property
+    def stats(self):
+        return {
+            **self._counters,
+            "pending_bytes": self.pending_bytes
+        }
+
+    @property
+    def pending_bytes(self):
+        return self._size - self._offset
+
+    @property
+    def has_pending(self):
+        return self.pending_bytes > 0
+
+    def append(self, batch):
+        """Appends the (key, item) records of the batch.
+        Returns the number of records that were spooled."""
+
+        lines = []
+        size = self._size
+
+        for key, item in batch:
+            try:
+                line = (json.dumps([key, item]) + "\n").encode()
+            except (TypeError, ValueError) as ex:
+                _logger.warning("Unserializable telemetry record: %s", repr(ex))
+                self._counters["lost"] += 1
+                continue
+
+            if size + len(line) > self.max_bytes:
+                self._counters["lost"] += 1
+                continue
+
+            lines.append(line)
+            size += len(line)
+
+        if not lines:
+            return 0
+
+        try:
+            with open(self.path, "ab") as fh:
+                fh.write(b"".join(lines))
+        except OSError as ex:
+            _logger.warning("Error writing spool (%s): %s", self.path, repr(ex))
+            self._counters["lost"] += len(lines)
+            return 0
+
+        self._size = size
+        self._counters["spooled"] += len(lines)
+
+        return len(lines)
+
+    def read(self, max_items):
+        """Returns the next chunk of records and the offset that
+        should be committed once the chunk has been written."""
+
+        batch = []
+        offset = self._offset
+
+        try:
+            with open(self.path, "rb") as fh:
+                fh.seek(offset)
+
+                while len(batch) < max_items:
+                    line = fh.readline()
+
+                    if not line or not line.endswith(b"\n"):
+                        break
+
+                    offset += len(line)
+
+                    try:
+                        key, item = json.loads(line)
+                        batch.append((key, item))
+                    except ValueError:
+                        self._counters["lost"] += 1
+        except FileNotFoundError:
+            _logger.warning("Spool file not found: %s", self.path)
+            self.clear()
+            return [], 0
+
+        return batch, offset
+
+    def commit(self, offset, num_items):
+        self._offset = offset
+        self._counters["replayed"] += num_items
+
+        if self._offset >= self._size:
+            self.clear()
+
+    def clear(self):
+        try:
+            os.truncate(self.path, 0)
+        except FileNotFoundError:
+            pass
+
+        self._size = 0
+        self._offset = 0
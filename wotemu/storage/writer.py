@@ -0,0 +1,375 @@
+"""Per-process telemetry writer.
+
+Records are appended to a bounded in-memory buffer and written to Redis
+in batches (one MULTI transaction per flush) by a background task.
+Flushes are triggered when the buffer reaches the flush size or
+when the flush interval expires, whatever happens first.
+
+When the buffer is full the writer either drops the incoming
+records (``drop`` policy) or makes the producers wait until there
+is free space (``block`` policy). Both cases are tracked in the counters.
+Producers can only wait in ``put``: ``put_nowait`` always drops.
+
+Batches that fail or exceed the write timeout are appended to a local
+spool (see :mod:`wotemu.storage.spool`) and replayed after the next
+successful flush. A timeout discards the connection, given that the
+transaction may have been interrupted midway.
+"""
+
+import asyncio
+import collections
+import hashlib
+import logging
+import os
+import socket
+
+import wotemu.config
+from wotemu.enums import WriterPolicies
+from wotemu.storage.base import get_storage
+from wotemu.storage.manager import RedisUnavailable, get_redis_manager
+from wotemu.storage.retention import RetentionEnforcer
+from wotemu.storage.spool import TelemetrySpool
+
+_STOP_TIMEOUT = 10
+
+_logger = logging.getLogger(__name__)
+_writers = {}
+
+
+class TelemetryWriter:
+    def __init__(
+            self, redis_url, backend=None, buffer_size=None,
+            flush_size=None, flush_interval=None, policy=None,
+            write_timeout=None, spool_path=None, spool_max_bytes=None,
+            retention=None):
+        conf = wotemu.config.get_env_config()
+        self._redis_url = redis_url
+        self._backend = backend
+        self._buffer_size = buffer_size or conf.writer_buffer_size
+        self._flush_size = flush_size or conf.writer_flush_size
+        self._flush_interval = flush_interval or conf.writer_flush_interval
+        self._policy = WriterPolicies(policy or conf.writer_policy)
+        self._write_timeout = write_timeout or conf.writer_write_timeout
+        self._buffer = collections.deque()
+        self._redis = None
+        self._storage = None
+        self._task = None
+        self._stopping = False
+        self._flush_event = None
+        self._space_event = None
+        self._flush_lock = None
+
+        self._spool = self._build_spool(
+            redis_url=redis_url,
+            spool_path=spool_path,
+            spool_max_bytes=spool_max_bytes,
+            conf=conf)
+
+        self._retention = RetentionEnforcer(
+            policies=retention if retention is not None else conf.redis_retention,
+            interval=conf.redis_retention_interval)
+
+        self._counters = {
+            "queued": 0,
+            "written": 0,
+            "dropped": 0,
+            "blocked": 0,
+            "failed": 0,
+            "slow": 0,
+            "flushes": 0
+        }
+
+    @classmethod
+    def _build_spool(cls, redis_url, spool_path, spool_max_bytes, conf):
+        max_bytes = spool_max_bytes \
+            if spool_max_bytes is not None else conf.writer_spool_max_bytes
+
+        if not max_bytes:
+            return None
+
+        if not spool_path:
+            url_hash = hashlib.md5(redis_url.encode()).hexdigest()[:8]
+            file_name = "{}-{}.jsonl".format(socket.gethostname(), url_hash)
+            spool_path = os.path.join(conf.writer_spool_dir, file_name)
+
+        try:
+            return TelemetrySpool(path=spool_path, max_bytes=max_bytes)
+        except OSError as ex:
+            _logger.warning("Telemetry spool disabled (%s): %s", spool_path, repr(ex))
+            return None
+
+    @property
+    def stats(self):
+        return {
+            **self._counters,
+            "buffered": len(self._buffer),
+            "spool": self._spool.stats if self._spool else None,
+            "retention": self._retention.stats
+        }
+
+    @property
+    def policy(self):
+        return self._policy
+
+    @property
+    def is_running(self):
+        return self._task is not None and not self._task.done()
+
+    @property
+    def is_full(self):
+        return len(self._buffer) >= self._buffer_size
+
+    def _ensure_started(self):
+        if self.is_running:
+            return
+
+        self._flush_event = asyncio.Event()
+        self._space_event = asyncio.Event()
+        self._space_event.set()
+        self._flush_lock = asyncio.Lock()
+        self._task = asyncio.ensure_future(self._run())
+
+    def _append(self, key, item):
+        self._buffer.append((key, item))
+        self._counters["queued"] += 1
+
+        if self.is_full:
+            self._space_event.clear()
+
+        if len(self._buffer) >= self._flush_size:
+            self._flush_event.set()
+
+    def put_nowait(self, key, item):
+        """Enqueues a record without blocking. Returns False if the
+        record was dropped because the buffer was full, regardless
+        of the policy (producers that should wait must use put)."""
+
+        self._ensure_started()
+
+        if not self.is_full:
+            self._append(key, item)
+            return True
+
+        self._counters["dropped"] += 1
+        return False
+
+    async def put(self, key, item):
+        self._ensure_started()
+
+        if self.is_full and self._policy == WriterPolicies.BLOCK:
+            self._counters["blocked"] += 1
+
+            while self.is_full:
+                await self._space_event.wait()
+
+        if self.is_full:
+            self._counters["dropped"] += 1
+            return False
+
+        self._append(key, item)
+
+        return True
+
+    async def put_many(self, key, items):
+        results = [await self.put(key, item) for item in items]
+        return all(results)
+
+    async def _open(self):
+        redis = await get_redis_manager(self._redis_url).get()
+
+        if redis is self._redis:
+            return
+
+        self._redis = redis
+        self._storage = get_storage(self._redis, backend=self._backend)
+
+        _logger.debug(
+            "Using telemetry writer connection to: %s (backend: %s)",
+            self._redis_url, self._storage.backend)
+
+    async def _close(self, ex=None):
+        if not self._redis:
+            return
+
+        self._redis = None
+        self._storage = None
+
+        if ex is not None and not isinstance(ex, RedisUnavailable):
+            await get_redis_manager(self._redis_url).report_error(ex)
+
+    def _pop_batch(self):
+        size = min(len(self._buffer), self._flush_size)
+        batch = [self._buffer.popleft() for _ in range(size)]
+
+        if not self.is_full:
+            self._space_event.set()
+
+        return batch
+
+    async def _write_batch(self, batch):
+        grouped = collections.OrderedDict()
+
+        for key, item in batch:
+            grouped.setdefault(key, []).append(item)
+
+        tr = self._redis.multi_exec()
+
+        for key, items in grouped.items():
+            self._storage.add_to(tr, key, items)
+
+        await tr.execute()
+
+        self._retention.track(grouped.keys())
+
+    async def _try_write(self, batch):
+        try:
+            await self._open()
+            await asyncio.wait_for(self._write_batch(batch), self._write_timeout)
+            return True
+        except asyncio.TimeoutError as ex:
+            self._counters["slow"] += 1
+
+            _logger.warning(
+                "Telemetry batch exceeded the write timeout (%s s)",
+                self._write_timeout)
+
+            # The transaction may have been interrupted midway: the connection
+            # is discarded and the spool is not replayed until the next write
+
+            await self._close(ex=ex)
+        except Exception as ex:
+            _logger.warning(
+                "Error writing telemetry batch (%s items): %s",
+                len(batch), repr(ex))
+
+            await self._close(ex=ex)
+
+        return False
+
+    async def _replay(self):
+        while self._spool and self._spool.has_pending:
+            batch, offset = self._spool.read(self._flush_size)
+
+            if not batch:
+                self._spool.commit(offset, 0)
+                break
+
+            if not (await self._try_write(batch)):
+                break
+
+            self._spool.commit(offset, len(batch))
+
+            _logger.debug("Replayed %s spooled records", len(batch))
+
+    async def _run_retention(self):
+        try:
+            await self._retention.run(self._redis, backend=self._storage.backend)
+        except Exception as ex:
+            _logger.warning("Error running retention policies: %s", repr(ex))
+
+    def _fail_batch(self, batch):
+        self._counters["failed"] += len(batch)
+
+        if self._spool:
+            self._spool.append(batch)
+
+    async def flush(self):
+        if not self._flush_lock:
+            return
+
+        async with self._flush_lock:
+            while len(self._buffer):
+                batch = self._pop_batch()
+
+                try:
+                    written = await self._try_write(batch)
+                except asyncio.CancelledError:
+                    # The batch has already been popped from the buffer
+                    self._fail_batch(batch)
+                    raise
+
+                if written:
+                    self._counters["written"] += len(batch)
+                else:
+                    self._fail_batch(batch)
+
+                self._counters["flushes"] += 1
+
+            # Spooled records are only replayed when Redis is available
+
+            if self._redis:
+                await self._replay()
+
+            if self._redis:
+                await self._run_retention()
+
+    async def _run(self):
+        try:
+            while not self._stopping:
+                try:
+                    await asyncio.wait_for(
+                        self._flush_event.wait(),
+                        timeout=self._flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+                self._flush_event.clear()
+                await self.flush()
+        except asyncio.CancelledError:
+            _logger.debug("Cancelled telemetry writer task")
+
+    async def stop(self):
+        """Signals the background task to drain the buffer and waits for it.
+        The task is only cancelled if it does not finish within the timeout."""
+
+        self._stopping = True
+
+        if self._task:
+            self._flush_event.set()
+            done, _ = await asyncio.wait([self._task], timeout=_STOP_TIMEOUT)
+
+            if not done:
+                _logger.warning("Timeout draining telemetry writer: Cancelling")
+                self._task.cancel()
+                await asyncio.gather(self._task, return_exceptions=True)
+            elif self._task.exception():
+                _logger.warning(
+                    "Error in telemetry writer task: %s",
+                    repr(self._task.exception()))
+
+            self._task = None
+
+        # Records that were put while the task was finishing
+
+        await self.flush()
+        await self._close()
+        self._stopping = False
+
+        _logger.debug("Telemetry writer stats: %s", self.stats)
+
+
+def get_writer(redis_url=None, **kwargs):
+    """Returns the telemetry writer shared by all
+    the Redis writers of the current process."""
+
+    if not redis_url:
+        redis_url = wotemu.config.get_env_config().redis_telemetry_url
+
+    if not redis_url:
+        raise RuntimeError("Undefined Redis URL")
+
+    if redis_url not in _writers:
+        _logger.debug("Creating telemetry writer for: %s", redis_url)
+        _writers[redis_url] = TelemetryWriter(redis_url=redis_url, **kwargs)
+
+    return _writers[redis_url]
+
+
+async def stop_writers():
+    for redis_url in list(_writers.keys()):
+        writer = _writers.pop(redis_url)
+
+        try:
+            await writer.stop()
+        except Exception:
+            _logger.warning("Error stopping telemetry writer", exc_info=True)
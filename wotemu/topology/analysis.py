@@ -0,0 +1,405 @@
+"""Static capacity analysis of a topology before it is deployed.
+
+The offered load of each node is estimated from the rates declared in the
+params of the built-in apps (e.g. the clock interval or the caller lambda)
+or from an explicit NodeApp load. The load is placed on the network that
+connects the node with its target and compared with the netem rate of that
+network. The estimates are coarse by design: the goal is to find links and
+resources that are obviously undersized without running the experiment.
+"""
+
+import collections
+import json
+import logging
+import re
+
+from wotemu.enums import BuiltinApps
+from wotemu.topology.compose import PARAM_INDEX, PARAM_SLOT
+
+DEFAULT_THRESHOLD = 0.8
+
+ISSUE_LINK = "link"
+ISSUE_RESOURCES = "resources"
+ISSUE_TARGET = "target"
+ISSUE_CONFIG = "config"
+
+_MESSAGE_SIZE = 1024
+_EVENT_SIZE = 256
+_FRAME_SIZE = 48 * 1024
+_CPU_SECS_MESSAGE = 2e-3
+_CPU_SECS_FRAME = 1e-2
+_MEM_BASE = 100 * 1024 ** 2
+
+_MEM_APPS = {
+    BuiltinApps.CAMERA: 256 * 1024 ** 2,
+    BuiltinApps.DETECTOR: 512 * 1024 ** 2,
+    BuiltinApps.MONGO_HISTORIAN: 150 * 1024 ** 2
+}
+
+_RATE_UNITS = {
+    "": 1.0,
+    "bit": 1.0,
+    "kbit": 1e3,
+    "mbit": 1e6,
+    "gbit": 1e9,
+    "tbit": 1e12,
+    "bps": 8.0,
+    "kbps": 8e3,
+    "mbps": 8e6,
+    "gbps": 8e9
+}
+
+_MEM_UNITS = {
+    "": 1,
+    "k": 1024,
+    "m": 1024 ** 2,
+    "g": 1024 ** 3,
+    "t": 1024 ** 4
+}
+
+_REGEX_RATE = r"^(\d+(?:\.\d+)?)\s*([a-z]*)$"
+_REGEX_MEM = r"^(\d+(?:\.\d+)?)\s*([kmgt]?)b?$"
+_BUILTIN_PATHS = {item.value: item for item in BuiltinApps}
+
+AppLoad = collections.namedtuple("AppLoad", ["rate", "size", "target"])
+
+LinkLoad = collections.namedtuple(
+    "LinkLoad", ["network", "capacity", "load", "utilization", "sources"])
+
+AnalysisIssue = collections.namedtuple(
+    "AnalysisIssue", ["kind", "name", "message"])
+
+_logger = logging.getLogger(__name__)
+
+
+def parse_rate(val):
+    """Parses a tc rate (e.g. 50kbit) into bits per second."""
+
+    match = re.match(_REGEX_RATE, str(val).strip().lower())
+
+    if not match or match.group(2) not in _RATE_UNITS:
+        raise ValueError("Invalid rate: {}".format(val))
+
+    return float(match.group(1)) * _RATE_UNITS[match.group(2)]
+
+
+def parse_memory(val):
+    """Parses a Compose memory value (e.g. 150M) into bytes."""
+
+    match = re.match(_REGEX_MEM, str(val).strip().lower())
+
+    if not match:
+        raise ValueError("Invalid memory: {}".format(val))
+
+    return float(match.group(1)) * _MEM_UNITS[match.group(2)]
+
+
+def get_network_capacity(network):
+    """Returns the netem rate of the network in bits per
+    second or None if the network is not rate limited."""
+
+    rates = []
+
+    for item in network.netem_args:
+        netem = json.loads(item) if isinstance(item, str) else item
+
+        if netem.get("rate") is not None:
+            rates.append(parse_rate(netem["rate"]))
+
+    return min(rates) if rates else None
+
+
+def _get_builtin(app):
+    return _BUILTIN_PATHS.get(app.path)
+
+
+def _split_host(host):
+    if not host or "." not in host:
+        return host, None
+
+    name, network = host.split(".", 1)
+
+    return name, network
+
+
+def get_emitted_load(app):
+    """Returns the events emitted by a producer app."""
+
+    builtin = _get_builtin(app)
+    params = app.params
+
+    if builtin == BuiltinApps.CLOCK:
+        rate = 2.0 / float(params.get("interval", 2))
+        return AppLoad(rate=rate, size=_EVENT_SIZE, target=None)
+
+    if builtin == BuiltinApps.CAMERA:
+        rate = float(params.get("target_fps", 12))
+        return AppLoad(rate=rate, size=_FRAME_SIZE, target=None)
+
+    return None
+
+
+def _get_consumer_loads(app, params, emitted):
+    builtin = _get_builtin(app)
+
+    if builtin == BuiltinApps.READER:
+        rate = 1.0 / float(params.get("interval", 5))
+        return [AppLoad(rate=rate, size=_MESSAGE_SIZE, target=params.get("servient_host"))]
+
+    if builtin == BuiltinApps.CALLER:
+        rate = float(params.get("lambd", 2))
+        return [AppLoad(rate=rate, size=_MESSAGE_SIZE, target=params.get("servient_host"))]
+
+    if builtin == BuiltinApps.SUBSCRIBER:
+        targets = [params.get("servient_host")]
+    elif builtin == BuiltinApps.DETECTOR:
+        cameras = params.get("cameras", "[]")
+        cameras = json.loads(cameras) if isinstance(cameras, str) else cameras
+        targets = [item.get("servient_host") if isinstance(item, dict) else item for item in cameras]
+    else:
+        return []
+
+    loads = []
+
+    for target in targets:
+        name, _ = _split_host(target)
+        load = emitted.get(name)
+
+        if load:
+            loads.append(load._replace(target=target))
+
+    return loads
+
+
+def _get_declared_load(app):
+    declared = getattr(app, "load", None)
+
+    if not declared or isinstance(declared, AppLoad):
+        return declared
+
+    return AppLoad(
+        rate=float(declared["rate"]),
+        size=float(declared.get("size", _MESSAGE_SIZE)),
+        target=declared.get("target"))
+
+
+def _get_node_params(node):
+    """Yields the params of each replica of the node along with
+    the number of replicas that share those same params."""
+
+    params = node.app.params
+    replicas = node.scale if node.scale else 1
+    templated = any(
+        PARAM_SLOT in str(val) or PARAM_INDEX in str(val)
+        for val in params.values())
+
+    if templated and hasattr(node, "get_params"):
+        for slot in range(1, replicas + 1):
+            yield node.get_params(slot), 1
+    else:
+        yield params, replicas
+
+
+class TopologyAnalysis:
+    def __init__(self, links, issues, threshold=DEFAULT_THRESHOLD):
+        self.links = links
+        self.issues = issues
+        self.threshold = threshold
+
+    @property
+    def saturated_links(self):
+        return [
+            item for item in self.links.values()
+            if item.utilization is not None and item.utilization >= self.threshold
+        ]
+
+    @property
+    def ok(self):
+        return len(self.issues) == 0
+
+    def to_dict(self):
+        return {
+            "threshold": self.threshold,
+            "links": [item._asdict() for item in self.links.values()],
+            "issues": [item._asdict() for item in self.issues]
+        }
+
+    def log(self):
+        for issue in self.issues:
+            _logger.warning("[%s] %s: %s", issue.kind, issue.name, issue.message)
+
+
+class _Analyzer:
+    def __init__(self, topology, threshold):
+        self.index = topology.build_index()
+        self.threshold = threshold
+        self.nodes = {node.name: node for node in self.index.nodes}
+        self.networks = {net.name: net for net in self.index.networks}
+        self.loads = collections.defaultdict(float)
+        self.sources = collections.defaultdict(int)
+        self.served = collections.defaultdict(float)
+        self.rates = collections.defaultdict(float)
+        self.issues = []
+        self.emitted = {}
+
+    def _add_config_issue(self, name, ex):
+        self.issues.append(AnalysisIssue(
+            kind=ISSUE_CONFIG,
+            name=name,
+            message="Skipped in the analysis: {}".format(ex)))
+
+    def _add_load(self, network, load, replicas):
+        bits = load.rate * load.size * 8.0 * replicas
+        self.loads[network] += bits
+        self.sources[network] += replicas
+
+    def _get_load_network(self, node, target_network):
+        if node.broker and node.app.enabled_mqtt:
+            return node.broker_network.name
+
+        if target_network in self.networks:
+            return target_network
+
+        return node.networks[0].name if node.networks else None
+
+    def _add_node(self, node):
+        replicas = node.scale if node.scale else 1
+        emitted = self.emitted.get(node.name)
+
+        if emitted:
+            self.rates[node.name] += emitted.rate * replicas
+
+            if node.broker and node.app.enabled_mqtt:
+                self._add_load(node.broker_network.name, emitted, replicas)
+
+        declared = _get_declared_load(node.app)
+
+        for params, count in _get_node_params(node):
+            loads = _get_consumer_loads(node.app, params, self.emitted)
+
+            if declared:
+                loads.append(declared)
+
+            for load in loads:
+                target_name, target_network = _split_host(load.target)
+
+                if load.target and target_name not in self.nodes:
+                    self.issues.append(AnalysisIssue(
+                        kind=ISSUE_TARGET,
+                        name=node.name,
+                        message="Unknown target host: {}".format(load.target)))
+
+                network = self._get_load_network(node, target_network)
+
+                if network:
+                    self._add_load(network, load, count)
+
+                self.rates[node.name] += load.rate * count
+
+                if target_name in self.nodes:
+                    self.served[target_name] += load.rate * count
+
+    def _check_resources(self, node):
+        resources = node.resources
+
+        if not resources:
+            return
+
+        replicas = node.scale if node.scale else 1
+        builtin = _get_builtin(node.app)
+
+        if resources.mem_limit:
+            mem_required = _MEM_APPS.get(builtin, _MEM_BASE)
+
+            try:
+                mem_limit = parse_memory(resources.mem_limit)
+            except ValueError as ex:
+                self._add_config_issue(node.name, ex)
+                mem_limit = None
+
+            if mem_limit is not None and mem_limit < mem_required:
+                self.issues.append(AnalysisIssue(
+                    kind=ISSUE_RESOURCES,
+                    name=node.name,
+                    message="Memory limit ({}) below the estimated {:.0f}M".format(
+                        resources.mem_limit, mem_required / 1024 ** 2)))
+
+        if resources.cpu_limit:
+            rate = (self.rates[node.name] + self.served[node.name]) / replicas
+            cpu_required = rate * _CPU_SECS_MESSAGE
+
+            if builtin == BuiltinApps.CAMERA:
+                cpu_required += self.emitted[node.name].rate * _CPU_SECS_FRAME
+
+            if float(resources.cpu_limit) < cpu_required:
+                self.issues.append(AnalysisIssue(
+                    kind=ISSUE_RESOURCES,
+                    name=node.name,
+                    message="CPU limit ({}) below the estimated {:.2f} cores".format(
+                        resources.cpu_limit, cpu_required)))
+
+    def _get_links(self):
+        links = {}
+
+        for name, network in self.networks.items():
+            try:
+                capacity = get_network_capacity(network)
+            except ValueError as ex:
+                self._add_config_issue(name, ex)
+                capacity = None
+
+            load = self.loads.get(name, 0.0)
+            utilization = load / capacity if capacity else None
+
+            links[name] = LinkLoad(
+                network=name,
+                capacity=capacity,
+                load=load,
+                utilization=utilization,
+                sources=self.sources.get(name, 0))
+
+            if utilization is not None and utilization >= self.threshold:
+                brokers = [brk.name for brk in self.index.get_network_brokers(network)]
+
+                self.issues.append(AnalysisIssue(
+                    kind=ISSUE_LINK,
+                    name=name,
+                    message="Offered load {:.0f} bit/s is {:.0%} of {:.0f} bit/s ({} sources{})".format(
+                        load, utilization, capacity, links[name].sources,
+                        "; brokers: {}".format(", ".join(brokers)) if brokers else "")))
+
+        return links
+
+    def run(self):
+        # The analysis is advisory: invalid values in the params of a
+        # node are reported instead of aborting the whole analysis
+
+        for node in self.index.nodes:
+            try:
+                self.emitted[node.name] = get_emitted_load(node.app)
+            except (ValueError, TypeError) as ex:
+                self._add_config_issue(node.name, repr(ex))
+                self.emitted[node.name] = None
+
+        for node in self.index.nodes:
+            try:
+                self._add_node(node)
+            except (ValueError, TypeError, KeyError) as ex:
+                self._add_config_issue(node.name, repr(ex))
+
+        for node in self.index.nodes:
+            try:
+                self._check_resources(node)
+            except (ValueError, TypeError) as ex:
+                self._add_config_issue(node.name, repr(ex))
+
+        links = self._get_links()
+
+        return TopologyAnalysis(
+            links=links,
+            issues=self.issues,
+            threshold=self.threshold)
+
+
+def analyze_topology(topology, threshold=DEFAULT_THRESHOLD):
+    return _Analyzer(topology, threshold=threshold).run()
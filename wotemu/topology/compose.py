@@ -1,9 +1,10 @@
-import copy
 import os
 
 from deepmerge import always_merger
-from wotemu.config import DEFAULT_DOCKER_SOCKET, ConfigVars
-from wotemu.enums import Labels
+from wotemu.config import (DEFAULT_CALIBRATION_DIR, DEFAULT_DOCKER_SOCKET,
+                           ConfigVars)
+from wotemu.enums import Labels, RedisShardStrategies
+from wotemu.topology.schedule import SCHEDULE_TARGET
 
 COMPOSE_VERSION = "3.7"
 IMAGE_ENV_VAR = "WOTEMU_IMAGE_OVERRIDE"
@@ -13,14 +14,21 @@ TEMPLATE_NODE_HOST = "{{.Node.Hostname}}"
 TEMPLATE_NODE_ID = "{{.Node.ID}}"
 TEMPLATE_SERVICE_ID = "{{.Service.ID}}"
 TEMPLATE_SERVICE_NAME = "{{.Service.Name}}"
+TEMPLATE_TASK_SLOT = "{{.Task.Slot}}"
 ENV_KEY_CPU_SPEED = "TARGET_CPU_SPEED"
 ENV_KEY_NODE_HOST = "NODE_HOSTNAME"
 ENV_KEY_NODE_ID = "NODE_ID"
 ENV_KEY_SERVICE_ID = "SERVICE_ID"
 ENV_KEY_SERVICE_NAME = "SERVICE_NAME"
+ENV_KEY_TASK_SLOT = "TASK_SLOT"
+ENV_KEY_NETWORK_NAME = "NETWORK_NAME"
 ENV_KEY_CPU_SPEED = "TARGET_CPU_SPEED"
 ENV_VAL_TRUTHY = "1"
+PARAM_SLOT = "{slot}"
+PARAM_INDEX = "{index}"
 VOL_DOCKER_SOCK = "{}:{}".format(DEFAULT_DOCKER_SOCKET, DEFAULT_DOCKER_SOCKET)
+VOL_CALIBRATION_NAME = "wotemu_calibration"
+VOL_CALIBRATION = "{}:{}".format(VOL_CALIBRATION_NAME, DEFAULT_CALIBRATION_DIR)
 
 SERVICE_BASE_DOCKER_PROXY = {
     "image": "tecnativa/docker-socket-proxy",
@@ -40,6 +48,17 @@ SERVICE_BASE_DOCKER_PROXY = {
     "volumes": [VOL_DOCKER_SOCK]
 }
 
+SERVICE_BASE_DOCKER_WATCH = {
+    "command": ["wotemu", "watch"],
+    "deploy": {
+        "placement": {
+            "constraints": ["node.role == manager"]
+        }
+    }
+}
+
+REDIS_MAXMEMORY_POLICY = "noeviction"
+
 SERVICE_BASE_REDIS = {
     "image": "redis:5",
     "labels": {Labels.WOTEMU_REDIS.value: ""}
@@ -95,41 +114,129 @@ NETWORK_SERVICE_BASE = {
 }
 
 
-def _merge_topology_config(service, topology):
+def render_slot_param(val, slot):
+    """Replaces the replica placeholders of a node group parameter.
+    The Swarm task slot is 1-based while the index is 0-based."""
+
+    if not isinstance(val, str):
+        return val
+
+    return val \
+        .replace(PARAM_SLOT, str(slot)) \
+        .replace(PARAM_INDEX, str(int(slot) - 1))
+
+
+def _clone_template(val):
+    """Copies the nested dicts and lists of a service template.
+    Much faster than copy.deepcopy for the plain templates in this module."""
+
+    if isinstance(val, dict):
+        return {key: _clone_template(item) for key, item in val.items()}
+
+    if isinstance(val, list):
+        return [_clone_template(item) for item in val]
+
+    return val
+
+
+def _get_index(topology, index):
+    return index if index is not None else topology.build_index()
+
+
+def _merge_topology_config(service, topology, index=None):
     envr = service.get("environment", {})
+    envr.update(_get_index(topology, index).config_env)
+    service["environment"] = envr
+
 
-    envr.update({
-        key: str(val)
-        for key, val in topology.config.items()
-        if val is not None
+def _merge_redis_shard(service, topology, name, network=None):
+    topology_redis = topology.redis
+
+    if topology_redis.shards <= 1:
+        return
+
+    is_network = topology_redis.shard_by == RedisShardStrategies.NETWORK
+    shard = topology_redis.get_shard(network if is_network and network else name)
+
+    service["environment"].update({
+        ConfigVars.REDIS_TELEMETRY_URL.value: topology_redis.internal_urls[shard]
     })
 
-    service["environment"] = envr
+    if not topology_redis.enabled:
+        return
 
+    shard_host = topology_redis.shard_hosts[shard]
+    depends_on = service.get("depends_on", [])
 
-def get_docker_proxy_definition(topology):
-    service = copy.deepcopy(SERVICE_BASE_DOCKER_PROXY)
+    if shard_host not in depends_on:
+        depends_on.append(shard_host)
+
+    service["depends_on"] = depends_on
+
+
+def get_docker_proxy_definition(topology, index=None):
+    index = _get_index(topology, index)
+    service = _clone_template(SERVICE_BASE_DOCKER_PROXY)
 
     service.update({
-        "networks": [net.name for net in topology.networks]
+        "networks": list(index.network_names)
     })
 
     return {topology.docker_proxy.host: service}
 
 
-def get_redis_definition(topology, topology_redis):
-    service = copy.deepcopy(SERVICE_BASE_REDIS)
+def get_docker_watch_definition(topology, index=None):
+    index = _get_index(topology, index)
+    service = _clone_template(SERVICE_BASE_DOCKER_WATCH)
+
+    # The Docker API proxy and Redis are attached to all the networks:
+    # the watch service only needs one of them to reach both
+
+    depends_on = [topology.docker_proxy.host]
+
+    if topology.redis.enabled:
+        depends_on.append(topology.redis.host)
 
     service.update({
-        "networks": [net.name for net in topology.networks],
-        "ports": ["6379"]
+        "image": os.getenv(IMAGE_ENV_VAR, BASE_IMAGE),
+        "networks": list(index.network_names[:1]),
+        "depends_on": depends_on
     })
 
-    return {topology.redis.host: service}
+    _merge_topology_config(service, topology, index=index)
+
+    return {topology.docker_proxy.watch_host: service}
+
+
+def get_redis_definition(topology, topology_redis, index=None):
+    index = _get_index(topology, index)
+    services = {}
+
+    for idx, host in enumerate(topology_redis.shard_hosts):
+        service = _clone_template(SERVICE_BASE_REDIS)
+
+        service.update({
+            "networks": list(index.network_names),
+            "ports": ["6379"]
+        })
+
+        service["labels"].update({Labels.WOTEMU_REDIS.value: str(idx)})
+
+        if topology_redis.maxmemory:
+            service.update({"command": [
+                "redis-server",
+                "--maxmemory", str(topology_redis.maxmemory),
+                "--maxmemory-policy", topology_redis.maxmemory_policy or REDIS_MAXMEMORY_POLICY
+            ]})
+
+        services[host] = service
 
+    return services
 
-def get_generic_service_definition(topology, srv):
-    service = copy.deepcopy(SERVICE_BASE_GENERIC)
+
+def get_generic_service_definition(topology, srv, index=None):
+    index = _get_index(topology, index)
+    service = _clone_template(SERVICE_BASE_GENERIC)
 
     if srv.params.get("env"):
         service["environment"].update(srv.params["env"])
@@ -159,15 +266,15 @@ def get_generic_service_definition(topology, srv):
         "image": srv.image,
         "networks": [
             srv.get_node_network_name(node)
-            for node in topology.get_service_nodes(srv)
+            for node in index.get_service_nodes(srv)
         ]
     })
 
     return {srv.name: service}
 
 
-def get_network_gateway_definition(topology, network):
-    service = copy.deepcopy(SERVICE_BASE_GATEWAY)
+def get_network_gateway_definition(topology, network, index=None):
+    service = _clone_template(SERVICE_BASE_GATEWAY)
 
     depends_on = []
 
@@ -184,22 +291,35 @@ def get_network_gateway_definition(topology, network):
         "depends_on": depends_on
     })
 
+    service["environment"].update({ENV_KEY_NETWORK_NAME: network.name})
+
+    if network.schedule:
+        service.update({"configs": [{
+            "source": network.schedule_config,
+            "target": SCHEDULE_TARGET
+        }]})
+
     if network.args_compose_gw:
         always_merger.merge(service, network.args_compose_gw)
 
-    _merge_topology_config(service, topology)
+    _merge_topology_config(service, topology, index=index)
+
+    _merge_redis_shard(
+        service, topology,
+        name=network.name_gateway,
+        network=network.name)
 
     return {network.name_gateway: service}
 
 
-def get_network_definition(topology, network):
-    definition = copy.deepcopy(NETWORK_BASE)
+def get_network_definition(topology, network, index=None):
+    definition = _clone_template(NETWORK_BASE)
     definition.update({"name": network.name})
     return {network.name: definition}
 
 
-def get_broker_definition(topology, broker):
-    service = copy.deepcopy(SERVICE_BASE_BROKER)
+def get_broker_definition(topology, broker, index=None):
+    service = _clone_template(SERVICE_BASE_BROKER)
 
     depends_on = [
         *[net.name_gateway for net in broker.networks]
@@ -221,7 +341,12 @@ def get_broker_definition(topology, broker):
     if broker.args_compose:
         always_merger.merge(service, broker.args_compose)
 
-    _merge_topology_config(service, topology)
+    _merge_topology_config(service, topology, index=index)
+
+    _merge_redis_shard(
+        service, topology,
+        name=broker.name,
+        network=broker.networks[0].name if broker.networks else None)
 
     return {broker.name: service}
 
@@ -254,8 +379,8 @@ def get_node_resources_definition(node_resources):
     return ret if len(ret) > 0 else None
 
 
-def get_node_definition(topology, node):
-    service = copy.deepcopy(SERVICE_BASE_NODE)
+def get_node_definition(topology, node, index=None):
+    service = _clone_template(SERVICE_BASE_NODE)
 
     networks = [net.name for net in node.networks]
 
@@ -299,6 +424,11 @@ def get_node_definition(topology, node):
         if node.resources.target_cpu_speed:
             env_speed = {ENV_KEY_CPU_SPEED: node.resources.target_cpu_speed}
             always_merger.merge(service, {"environment": env_speed})
+            service["volumes"].append(VOL_CALIBRATION)
+
+        if node.resources.cpu_control:
+            env_control = {ConfigVars.CPU_CONTROL.value: "1"}
+            always_merger.merge(service, {"environment": env_control})
 
     if node.scale:
         deploy.update({"replicas": node.scale})
@@ -309,17 +439,32 @@ def get_node_definition(topology, node):
     if node.args_compose:
         always_merger.merge(service, node.args_compose)
 
-    _merge_topology_config(service, topology)
+    _merge_topology_config(service, topology, index=index)
+
+    _merge_redis_shard(
+        service, topology,
+        name=node.name,
+        network=node.networks[0].name if node.networks else None)
 
     return {node.name: service}
 
 
-def _service_networks(topology, srv):
+def get_node_group_definition(topology, group, index=None):
+    definition = get_node_definition(topology, group, index=index)
+    service = definition[group.name]
+
+    service["environment"].update({ENV_KEY_TASK_SLOT: TEMPLATE_TASK_SLOT})
+    service["labels"].update({Labels.WOTEMU_NODE_GROUP.value: str(group.size)})
+
+    return definition
+
+
+def _service_networks(topology, srv, index):
     nets = {}
 
-    for node in topology.get_service_nodes(srv):
+    for node in index.get_service_nodes(srv):
         net_name = srv.get_node_network_name(node)
-        definition = copy.deepcopy(NETWORK_SERVICE_BASE)
+        definition = _clone_template(NETWORK_SERVICE_BASE)
         definition.update({"name": net_name})
         nets.update({net_name: definition})
 
@@ -329,37 +474,63 @@ def _service_networks(topology, srv):
 def get_topology_definition(topology):
     definition = {"version": COMPOSE_VERSION}
 
+    # Built once: the models derived from the nodes and
+    # the config are shared by all the service definitions
+
+    index = topology.build_index()
+
     services = {}
 
     if topology.docker_proxy.enabled:
-        services.update(topology.docker_proxy_compose_dict)
+        services.update(topology.docker_proxy.to_compose_dict(topology, index=index))
+
+    if topology.docker_proxy.enabled and topology.docker_proxy.watch:
+        services.update(get_docker_watch_definition(topology, index=index))
 
     if topology.redis.enabled:
-        services.update(topology.redis_compose_dict)
+        services.update(topology.redis.to_compose_dict(topology, index=index))
 
-    for net in topology.networks:
-        services.update(net.to_gateway_compose_dict(topology))
+    for net in index.networks:
+        services.update(net.to_gateway_compose_dict(topology, index=index))
 
-    for srv in topology.services:
-        services.update(srv.to_compose_dict(topology))
+    for srv in index.services:
+        services.update(srv.to_compose_dict(topology, index=index))
 
-    for node in topology.nodes:
-        services.update(node.to_compose_dict(topology))
+    for node in index.nodes:
+        services.update(node.to_compose_dict(topology, index=index))
 
-    for broker in topology.brokers:
-        services.update(broker.to_compose_dict(topology))
+    for broker in index.brokers:
+        services.update(broker.to_compose_dict(topology, index=index))
 
     networks = {}
 
-    for net in topology.networks:
-        networks.update(net.to_compose_dict(topology))
+    for net in index.networks:
+        networks.update(net.to_compose_dict(topology, index=index))
 
-    for srv in topology.services:
-        networks.update(_service_networks(topology, srv))
+    for srv in index.services:
+        networks.update(_service_networks(topology, srv, index))
 
     definition.update({
         "services": services,
         "networks": networks
     })
 
+    # Relative to the Compose file (see Topology.write_schedule_files)
+
+    configs = {
+        net.schedule_config: {"file": "./{}".format(net.schedule_file)}
+        for net in index.networks
+        if net.schedule
+    }
+
+    if configs:
+        definition.update({"configs": configs})
+
+    # Named so that the calibrations are shared across stacks
+
+    if any(VOL_CALIBRATION in srv.get("volumes", []) for srv in services.values()):
+        definition.update({"volumes": {
+            VOL_CALIBRATION_NAME: {"name": VOL_CALIBRATION_NAME}
+        }})
+
     return definition
@@ -1,5 +1,7 @@
+import concurrent.futures
 import logging
 import pprint
+import queue
 import re
 import warnings
 
@@ -11,36 +13,46 @@ _SYSBENCH_THREADS = 1
 _SYSBENCH_TIME = 10
 _CPU_PERIOD = 100000
 _REGEX_SPEED = r"events\sper\ssecond:\s*(\d+\.\d+)"
+_CI_Z = 1.96
+_SOLVE_MIN = 1e-2
+
+MODEL_POLY = "poly"
+MODEL_PIECEWISE = "piecewise"
 
 _cache = dict()
 _logger = logging.getLogger(__name__)
 
 
-def get_cpu_core_speed(cpus):
+def get_cpu_core_speed(cpus, cpuset=None, duration=None):
     client = docker.from_env()
 
     command = "sysbench --threads={} --time={} cpu run".format(
         _SYSBENCH_THREADS,
-        _SYSBENCH_TIME)
+        duration if duration else _SYSBENCH_TIME)
 
     cpu_quota = int(_CPU_PERIOD * cpus)
 
-    _logger.info("Running for [cpus=%s]: %s", cpus, command)
+    _logger.info("Running for [cpus=%s cpuset=%s]: %s", cpus, cpuset, command)
+
+    run_kwargs = {
+        "remove": True,
+        "image": _SYSBENCH_IMAGE,
+        "command": command,
+        "cpu_period": _CPU_PERIOD,
+        "cpu_quota": cpu_quota
+    }
 
-    output = client.containers.run(
-        remove=True,
-        image=_SYSBENCH_IMAGE,
-        command=command,
-        cpu_period=_CPU_PERIOD,
-        cpu_quota=cpu_quota)
+    if cpuset is not None:
+        run_kwargs.update({"cpuset_cpus": str(cpuset)})
 
+    output = client.containers.run(**run_kwargs)
     output = output.decode()
 
     _logger.debug("[cpus=%s] %s\n%s", cpus, command, output)
 
     speed_match = re.search(_REGEX_SPEED, output)
 
-    if len(speed_match.groups()) != 1:
+    if not speed_match or len(speed_match.groups()) != 1:
         raise Exception("CPU speed not found in sysbench output")
 
     cpu_speed = float(speed_match.group(1))
@@ -50,42 +62,345 @@ def get_cpu_core_speed(cpus):
     return cpu_speed
 
 
-def get_cpu_core_speed_poly(num=6, start=0.1, stop=1.0, cache=True):
-    cache_key = (num, start, stop)
+def _get_benchmark_cores():
+    num_cpus = docker.from_env().info().get("NCPU", 1)
+
+    # The first core is left free for the Docker daemon and the host
+    return list(range(1, num_cpus)) if num_cpus > 1 else [0]
+
+
+def _split_samples(samples):
+    xs = numpy.array([item[0] for item in samples], dtype=float)
+    ys = numpy.array([item[1] for item in samples], dtype=float)
+    return xs, ys
+
+
+def _goodness_of_fit(predicted, ys, num_params):
+    residuals = ys - predicted
+    ss_res = float(numpy.sum(residuals ** 2))
+    ss_tot = float(numpy.sum((ys - numpy.mean(ys)) ** 2))
+    num = len(ys)
+    r2 = 1.0 - ss_res / ss_tot if ss_tot > 0 else 1.0
+    dof = num - num_params - 1
+
+    adj_r2 = 1.0 - (1.0 - r2) * (num - 1) / dof if dof > 0 else r2
+
+    return {
+        "r2": r2,
+        "adj_r2": adj_r2,
+        "rmse": float(numpy.sqrt(ss_res / num)) if num else 0.0,
+        "samples": num
+    }
+
+
+class CpuSpeedModel:
+    """Maps a CPU core fraction to the expected sysbench speed.
+    Either a polynomial or a monotonic piecewise linear function."""
+
+    def __init__(self, kind, params, metrics=None):
+        if kind not in (MODEL_POLY, MODEL_PIECEWISE):
+            raise ValueError("Unknown CPU speed model: {}".format(kind))
+
+        self.kind = kind
+        self.params = params
+        self.metrics = metrics if metrics else {}
+
+    @classmethod
+    def from_poly(cls, poly, metrics=None):
+        return cls(
+            kind=MODEL_POLY,
+            params={"coeffs": [float(item) for item in poly.coeffs]},
+            metrics=metrics)
+
+    @classmethod
+    def fit_poly(cls, samples, degree=1):
+        xs, ys = _split_samples(samples)
+        poly = numpy.poly1d(numpy.polyfit(xs, ys, deg=degree))
+        metrics = _goodness_of_fit(poly(xs), ys, num_params=degree)
+        return cls.from_poly(poly, metrics=metrics)
+
+    @classmethod
+    def fit_piecewise(cls, samples):
+        xs, ys = _split_samples(samples)
+        knots = numpy.unique(xs)
+        speeds = numpy.array([numpy.mean(ys[xs == knot]) for knot in knots])
+        speeds = numpy.maximum.accumulate(speeds)
+
+        params = {
+            "cpus": knots.tolist(),
+            "speeds": speeds.tolist()
+        }
+
+        model = cls(kind=MODEL_PIECEWISE, params=params)
+        model.metrics = _goodness_of_fit(model(xs), ys, num_params=len(knots) - 1)
+
+        return model
+
+    @classmethod
+    def from_dict(cls, val):
+        return cls(**val)
+
+    def to_dict(self):
+        return {
+            "kind": self.kind,
+            "params": self.params,
+            "metrics": self.metrics
+        }
+
+    @property
+    def poly(self):
+        if self.kind != MODEL_POLY:
+            return None
+
+        return numpy.poly1d(self.params["coeffs"])
+
+    def _piecewise(self, cpus):
+        knots = numpy.array(self.params["cpus"])
+        speeds = numpy.array(self.params["speeds"])
+        cpus = numpy.asarray(cpus, dtype=float)
+        ret = numpy.interp(cpus, knots, speeds)
+
+        # Linear extrapolation from the last segment
+
+        if len(knots) > 1:
+            slope = (speeds[-1] - speeds[-2]) / (knots[-1] - knots[-2])
+            ret = numpy.where(cpus > knots[-1], speeds[-1] + slope * (cpus - knots[-1]), ret)
+
+        return ret
+
+    def __call__(self, cpus):
+        if self.kind == MODEL_POLY:
+            return self.poly(cpus)
+
+        ret = self._piecewise(cpus)
+
+        return float(ret) if numpy.ndim(ret) == 0 else ret
+
+    def _solve_poly(self, target):
+        coeffs = numpy.array(self.params["coeffs"], dtype=float)
+        coeffs[-1] -= target
+        roots = numpy.roots(coeffs)
+
+        _logger.debug("Poly roots: %s", roots)
+
+        reals = numpy.real(roots[numpy.isreal(roots)])
+        positive = reals[reals > 0]
+
+        if len(positive):
+            return float(numpy.min(positive))
+
+        if len(reals):
+            return float(reals[0])
+
+        # Targets above the maximum of a concave fit have no real roots:
+        # extrapolate linearly along the chord of the fitted interval
+
+        poly = self.poly
+        slope = poly(1.0) - poly(0.0)
+
+        _logger.debug("No real roots: Extrapolating linearly (slope=%s)", slope)
+
+        if slope <= 0:
+            return 1.0
+
+        return float((target - poly(0.0)) / slope)
+
+    def _solve_piecewise(self, target):
+        knots = self.params["cpus"]
+        speeds = self.params["speeds"]
+
+        if target <= speeds[-1] or len(knots) < 2:
+            return float(numpy.interp(target, speeds, knots))
+
+        slope = (speeds[-1] - speeds[-2]) / (knots[-1] - knots[-2])
+
+        return float(knots[-1] + (target - speeds[-1]) / slope)
+
+    def solve(self, target):
+        """Returns the CPU core fraction that matches the target speed."""
+
+        if self.kind == MODEL_POLY:
+            return self._solve_poly(target)
 
-    if start <= 0:
-        raise ValueError("Parameter 'start' should be > 0")
+        return self._solve_piecewise(target)
+
+    def __repr__(self):
+        return "<CpuSpeedModel {} {}>".format(self.kind, self.metrics)
+
+
+def select_cpu_speed_model(samples, max_degree=2, piecewise=True):
+    """Fits the candidate models and returns the one with the highest
+    adjusted R2 (ties are resolved in favour of the simplest model)."""
+
+    candidates = [
+        CpuSpeedModel.fit_poly(samples, degree=degree)
+        for degree in range(1, max_degree + 1)
+        if len(samples) > degree + 1
+    ]
+
+    if piecewise:
+        candidates.append(CpuSpeedModel.fit_piecewise(samples))
+
+    for model in candidates:
+        _logger.debug("CPU speed model candidate: %s", model)
+
+    best = candidates[0]
+
+    for model in candidates[1:]:
+        if model.metrics["adj_r2"] > best.metrics["adj_r2"] + 1e-3:
+            best = model
+
+    return best
+
+
+def get_confidence_interval(samples, cpus=1.0):
+    """Relative half-width of the confidence interval of
+    the speed predicted by a linear fit at the given fraction."""
+
+    xs, ys = _split_samples(samples)
+
+    if len(xs) < 4:
+        return numpy.inf
+
+    coeffs, cov = numpy.polyfit(xs, ys, deg=1, cov=True)
+    jac = numpy.array([cpus, 1.0])
+    var = float(jac @ cov @ jac)
+    pred = float(numpy.polyval(coeffs, cpus))
+
+    if pred <= 0 or var < 0:
+        return numpy.inf
+
+    return _CI_Z * numpy.sqrt(var) / pred
+
+
+class CpuCalibrator:
+    """Runs the sysbench samples concurrently, each pinned to a distinct
+    core, in rounds over the grid of CPU fractions until the confidence
+    interval of the linear fit is tight enough or max_rounds is reached."""
+
+    def __init__(
+            self, num=6, start=0.1, stop=1.0, duration=5, tolerance=0.02,
+            min_rounds=1, max_rounds=4, max_degree=2, piecewise=True,
+            cores=None, benchmark=None):
+        if start <= 0:
+            raise ValueError("Parameter 'start' should be > 0")
+
+        self.fractions = numpy.linspace(start=start, stop=stop, num=num).tolist()
+        self.duration = duration
+        self.tolerance = tolerance
+        self.min_rounds = min_rounds
+        self.max_rounds = max_rounds
+        self.max_degree = max_degree
+        self.piecewise = piecewise
+        self._cores = cores
+        self._benchmark = benchmark if benchmark else get_cpu_core_speed
+        self.samples = [(0.0, 0.0)]
+        self.rounds = 0
+        self.interval = numpy.inf
+
+    @property
+    def cores(self):
+        if self._cores is None:
+            self._cores = _get_benchmark_cores()
+
+        return self._cores
+
+    def _run_sample(self, cores, cpus):
+        core = cores.get()
+
+        try:
+            return cpus, self._benchmark(cpus, cpuset=core, duration=self.duration)
+        finally:
+            cores.put(core)
+
+    def run_round(self):
+        cores = queue.Queue()
+
+        for core in self.cores:
+            cores.put(core)
+
+        workers = min(len(self.cores), len(self.fractions))
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(self._run_sample, cores, cpus)
+                for cpus in self.fractions
+            ]
+
+            samples = [fut.result() for fut in futures]
+
+        self.samples.extend(samples)
+        self.rounds += 1
+        self.interval = get_confidence_interval(self.samples)
+
+        _logger.info(
+            "CPU calibration round %s (cores=%s): CI=%.4f",
+            self.rounds, self.cores, self.interval)
+
+        return samples
+
+    @property
+    def is_done(self):
+        if self.rounds < self.min_rounds:
+            return False
+
+        return self.rounds >= self.max_rounds or self.interval <= self.tolerance
+
+    def run(self):
+        while not self.is_done:
+            self.run_round()
+
+        _logger.debug("CPU speed dataset:\n%s", pprint.pformat(self.samples))
+
+        model = select_cpu_speed_model(
+            self.samples,
+            max_degree=self.max_degree,
+            piecewise=self.piecewise)
+
+        model.metrics.update({
+            "rounds": self.rounds,
+            "interval": float(self.interval)
+        })
+
+        _logger.info("CPU speed model: %s %s", model.kind, model.metrics)
+
+        return model
+
+
+def get_cpu_core_speed_model(cache=True, **kwargs):
+    cache_key = tuple(sorted(kwargs.items()))
 
     if cache and _cache.get(cache_key):
-        _logger.debug("Using cached CPU core speed poly")
+        _logger.debug("Using cached CPU core speed model")
         return _cache.get(cache_key)
 
-    _logger.info("Building CPU core speed poly")
+    _logger.info("Building CPU core speed model")
 
-    cpu_samples = numpy.linspace(start=start, stop=stop, num=num)
+    model = CpuCalibrator(**kwargs).run()
 
-    speeds = [(0.0, 0.0)] + [
-        (cpus, get_cpu_core_speed(cpus))
-        for cpus in cpu_samples
-    ]
+    _cache[cache_key] = model
 
-    _logger.debug("CPU speed dataset:\n%s", pprint.pformat(speeds))
+    return model
 
-    cpu_ratio = [item[0] for item in speeds]
-    cpu_speed = [item[1] for item in speeds]
-    coeffs = numpy.polyfit(cpu_ratio, cpu_speed, deg=1)
-    poly = numpy.poly1d(coeffs)
 
-    _logger.debug("CPU speed poly: %s", poly)
+def get_cpu_core_speed_poly(num=6, start=0.1, stop=1.0, cache=True):
+    model = get_cpu_core_speed_model(
+        cache=cache,
+        num=num,
+        start=start,
+        stop=stop,
+        max_degree=1,
+        piecewise=False)
 
-    _cache[cache_key] = poly
+    return model.poly
 
-    return poly
 
+def get_cpu_core_scale(target_core_speed, core_poly=None, model=None):
+    if model is None:
+        model = CpuSpeedModel.from_poly(core_poly) \
+            if core_poly is not None else get_cpu_core_speed_model()
 
-def get_cpu_core_scale(target_core_speed, core_poly=None):
-    core_poly = core_poly if core_poly else get_cpu_core_speed_poly()
-    max_core_speed = core_poly(1.0)
+    max_core_speed = model(1.0)
 
     if target_core_speed > max_core_speed:
         warn_msg = (
@@ -96,16 +411,9 @@ def get_cpu_core_scale(target_core_speed, core_poly=None):
         _logger.warning(warn_msg)
         warnings.warn(warn_msg, Warning)
 
-    _logger.debug("Solving %s for %s", core_poly, target_core_speed)
-
-    coeffs = core_poly.coeffs.copy()
-    coeffs[-1] -= target_core_speed
-    roots = numpy.roots(coeffs)
-
-    _logger.debug("Poly roots: %s", roots)
+    _logger.debug("Solving %s for %s", model, target_core_speed)
 
-    cpus = float(numpy.real(roots[numpy.isreal(roots)][0]))
-    cpus = max(cpus, 1e-2)
+    cpus = max(model.solve(target_core_speed), _SOLVE_MIN)
 
     _logger.debug(
         "Target CPU core speed: %s ~ CPU core scale factor: %s",
@@ -0,0 +1,76 @@
+"""Indexed view of a topology that is built in a single pass.
+
+The collections of networks, brokers and services of a topology are
+derived from its nodes. Deriving them on every access (and looking up the
+nodes of each service by scanning all nodes) makes the generation of the
+Compose file quadratic on the size of the topology. The index computes
+them once, along with the adjacency maps between the models.
+"""
+
+import collections
+
+
+def _unique(items):
+    return list(dict.fromkeys(items))
+
+
+class TopologyIndex:
+    def __init__(self, topology):
+        nodes = topology.nodes
+        brokers_extra = topology._brokers if topology._brokers else []
+
+        self.nodes = list(nodes)
+
+        self.brokers = _unique([
+            *brokers_extra,
+            *(node.broker for node in nodes if node.broker)
+        ])
+
+        self.networks = _unique([
+            *(net for node in nodes for net in node.networks),
+            *(net for brk in self.brokers for net in brk.networks)
+        ])
+
+        self.services = _unique(
+            srv for node in nodes for srv in node.services)
+
+        self.network_nodes = collections.defaultdict(list)
+        self.network_brokers = collections.defaultdict(list)
+        self.service_nodes = collections.defaultdict(list)
+        self.broker_nodes = collections.defaultdict(list)
+
+        for node in nodes:
+            for net in node.networks:
+                self.network_nodes[net].append(node)
+
+            for srv in node.services:
+                self.service_nodes[srv].append(node)
+
+            if node.broker:
+                self.broker_nodes[node.broker].append(node)
+
+        for brk in self.brokers:
+            for net in brk.networks:
+                self.network_brokers[net].append(brk)
+
+        self.config = topology.config
+
+        self.config_env = {
+            key: str(val)
+            for key, val in self.config.items()
+            if val is not None
+        }
+
+        self.network_names = [net.name for net in self.networks]
+
+    def get_network_nodes(self, network):
+        return self.network_nodes.get(network, [])
+
+    def get_network_brokers(self, network):
+        return self.network_brokers.get(network, [])
+
+    def get_service_nodes(self, service):
+        return self.service_nodes.get(service, [])
+
+    def get_broker_nodes(self, broker):
+        return self.broker_nodes.get(broker, [])
@@ -1,20 +1,34 @@
+import json
 import logging
 import os
 import warnings
+import zlib
 
 import inflection
 import yaml
 from wotemu.config import (DEFAULT_CONFIG_VARS, DEFAULT_HOST_DOCKER_PROXY,
-                           DEFAULT_HOST_REDIS, ConfigVars)
-from wotemu.enums import NETEM_CONDITIONS, BuiltinApps, NetworkConditions
+                           DEFAULT_HOST_DOCKER_WATCH, DEFAULT_HOST_REDIS,
+                           ConfigVars)
+from wotemu.enums import (NETEM_CONDITIONS, BuiltinApps, NetworkConditions,
+                          RedisShardStrategies, StorageBackends)
+from wotemu.storage.retention import parse_policies
 from wotemu.topology.compose import (BASE_IMAGE, IMAGE_ENV_VAR,
                                      get_broker_definition,
                                      get_docker_proxy_definition,
                                      get_generic_service_definition,
                                      get_network_definition,
                                      get_network_gateway_definition,
-                                     get_node_definition, get_redis_definition,
-                                     get_topology_definition)
+                                     get_node_definition,
+                                     get_node_group_definition,
+                                     get_redis_definition,
+                                     get_topology_definition,
+                                     render_slot_param)
+from wotemu.topology.analysis import DEFAULT_THRESHOLD, analyze_topology
+from wotemu.topology.index import TopologyIndex
+from wotemu.topology.schedule import (KEY_PERIOD, KEY_SCHEDULE,
+                                      SCHEDULE_MAX_BYTES, SCHEDULE_TARGET,
+                                      dump_schedule, get_schedule_digest,
+                                      normalize_schedule)
 
 _DEFAULT_CATALOGUE = DEFAULT_CONFIG_VARS[ConfigVars.PORT_CATALOGUE]
 _DEFAULT_HTTP = DEFAULT_CONFIG_VARS[ConfigVars.PORT_HTTP]
@@ -30,15 +44,20 @@ class NodeResources:
 
     def __init__(
             self, cpu_limit=None, mem_limit=None,
-            cpu_reservation=None, mem_reservation=None, target_cpu_speed=None):
+            cpu_reservation=None, mem_reservation=None, target_cpu_speed=None,
+            cpu_control=False):
         if cpu_limit and target_cpu_speed:
             raise ValueError("Use either CPU limit or target CPU speed")
 
+        if cpu_control and not target_cpu_speed:
+            raise ValueError("CPU control requires a target CPU speed")
+
         self._cpu_limit = cpu_limit
         self._mem_limit = mem_limit
         self._cpu_reservation = cpu_reservation
         self._mem_reservation = mem_reservation
         self.target_cpu_speed = target_cpu_speed
+        self.cpu_control = cpu_control
 
     @property
     def cpu_limit(self):
@@ -66,14 +85,19 @@ class NodeApp:
     ARG_WS = "--enable-ws"
     ARG_MQTT = "--enable-mqtt"
     ARG_COAP = "--enable-coap"
+    ARG_LOOP_MONITOR = "--enable-loop-monitor"
 
-    def __init__(self, path, http=False, ws=False, mqtt=False, coap=False, params=None):
+    def __init__(
+            self, path, http=False, ws=False, mqtt=False, coap=False,
+            params=None, loop_monitor=False, load=None):
         self._path = path
         self.params = params if params else {}
+        self.load = load
         self._http = http
         self._ws = ws
         self._mqtt = mqtt
         self._coap = coap
+        self.loop_monitor = loop_monitor
 
     @property
     def path(self):
@@ -96,6 +120,9 @@ class NodeApp:
 
         parts += [flag for enabled, flag in protocol_flags if enabled]
 
+        if self.loop_monitor:
+            parts.append(self.ARG_LOOP_MONITOR)
+
         return parts
 
     @property
@@ -159,8 +186,8 @@ class Service(BaseNamedModel):
     def get_node_network_name(self, node):
         return f"srvnet_{self.name}_{node.name}"
 
-    def to_compose_dict(self, topology):
-        return get_generic_service_definition(topology, self)
+    def to_compose_dict(self, topology, index=None):
+        return get_generic_service_definition(topology, self, index=index)
 
 
 class Node(BaseNamedModel):
@@ -254,8 +281,37 @@ class Node(BaseNamedModel):
         assert srv not in self._services, "Duplicated service"
         self._services.add(srv)
 
-    def to_compose_dict(self, topology):
-        return get_node_definition(topology, self)
+    def to_compose_dict(self, topology, index=None):
+        return get_node_definition(topology, self, index=index)
+
+
+class NodeGroup(Node):
+    """Represents a group of identical nodes that is deployed as a single
+    replicated service. The app params may contain the {slot} (1-based)
+    and {index} (0-based) placeholders, which are replaced at runtime
+    with the Swarm task slot of each replica."""
+
+    def __init__(self, name, app, networks, size, **kwargs):
+        if size < 1:
+            raise ValueError("Group size should be >= 1")
+
+        if kwargs.get("scale"):
+            raise ValueError("Use the group size instead of scale")
+
+        super().__init__(name, app, networks, scale=size, **kwargs)
+
+    @property
+    def size(self):
+        return self.scale
+
+    def get_params(self, slot):
+        return {
+            key: render_slot_param(val, slot)
+            for key, val in self.app.params.items()
+        }
+
+    def to_compose_dict(self, topology, index=None):
+        return get_node_group_definition(topology, self, index=index)
 
 
 class Broker(BaseNamedModel):
@@ -272,13 +328,14 @@ class Broker(BaseNamedModel):
     def cmd(self):
         return [self.ENTRY_BROKER]
 
-    def to_compose_dict(self, topology):
-        return get_broker_definition(topology, self)
+    def to_compose_dict(self, topology, index=None):
+        return get_broker_definition(topology, self, index=index)
 
 
 class Network(BaseNamedModel):
     """Represents a network that may contain multiple nodes. 
-    Each network has a predefined set of conditions that determine its performance."""
+    Each network has a predefined set of conditions that determine its performance.
+    The conditions may vary over time following a schedule (see wotemu.topology.schedule)."""
 
     GATEWAY_PREFIX = "gw"
     assert inflection.underscore(GATEWAY_PREFIX) == GATEWAY_PREFIX
@@ -286,7 +343,8 @@ class Network(BaseNamedModel):
 
     def __init__(
             self, name, netem=None, conditions=None,
-            args_compose_net=None, args_compose_gw=None):
+            args_compose_net=None, args_compose_gw=None,
+            schedule=None, schedule_period=None):
         if conditions and conditions not in NetworkConditions:
             raise ValueError("Unexpected conditions value")
 
@@ -294,6 +352,8 @@ class Network(BaseNamedModel):
             netem = NETEM_CONDITIONS[conditions]
 
         self._netem = netem
+        self.schedule = normalize_schedule(schedule) if schedule else None
+        self.schedule_period = schedule_period
         self.args_compose_net = args_compose_net
         self.args_compose_gw = args_compose_gw
         super().__init__(name)
@@ -302,19 +362,52 @@ class Network(BaseNamedModel):
     def name_gateway(self):
         return "{}_{}".format(self.GATEWAY_PREFIX, self.name)
 
+    @property
+    def schedule_content(self):
+        return dump_schedule(self.schedule) if self.schedule else None
+
+    @property
+    def schedule_config(self):
+        """Name of the Docker config that contains the schedule. Configs
+        cannot be updated, so the name changes with the content."""
+
+        if not self.schedule:
+            return None
+
+        return "{}_schedule_{}".format(
+            self.name, get_schedule_digest(self.schedule_content))
+
+    @property
+    def schedule_file(self):
+        if not self.schedule:
+            return None
+
+        return "{}.json".format(self.schedule_config)
+
     @property
     def netem_args(self):
-        return self._netem if self._netem else []
+        if not self.schedule:
+            return self._netem if self._netem else []
+
+        # The gateway reads the schedule from the file of the Docker config
+
+        netem = json.loads(self._netem[0]) if self._netem else {}
+        netem.update({KEY_SCHEDULE: SCHEDULE_TARGET})
+
+        if self.schedule_period:
+            netem.update({KEY_PERIOD: self.schedule_period})
+
+        return [json.dumps(netem)]
 
     @property
     def cmd_gateway(self):
         return [self.ENTRY_GATEWAY] + list(self.netem_args)
 
-    def to_compose_dict(self, topology):
-        return get_network_definition(topology, self)
+    def to_compose_dict(self, topology, index=None):
+        return get_network_definition(topology, self, index=index)
 
-    def to_gateway_compose_dict(self, topology):
-        return get_network_gateway_definition(topology, self)
+    def to_gateway_compose_dict(self, topology, index=None):
+        return get_network_gateway_definition(topology, self, index=index)
 
 
 class TopologyPorts:
@@ -339,40 +432,122 @@ class TopologyPorts:
 
 
 class TopologyRedis:
+    """Redis instances used to store the telemetry of the topology.
+    Telemetry can be split across multiple shards: each service is assigned
+    a shard deterministically (by service name or by network). The first
+    shard is also used for the emulation metadata and coordination keys."""
+
     WARN_MSG = "Disabled built-in topology Redis service"
 
-    def __init__(self, enabled=True, host=DEFAULT_HOST_REDIS, redis_url=None):
+    def __init__(
+            self, enabled=True, host=DEFAULT_HOST_REDIS, redis_url=None,
+            backend=None, stream_maxlen=None, retention=None,
+            maxmemory=None, maxmemory_policy=None, shards=1, shard_by=None):
         if not enabled and not redis_url:
             raise ValueError((
                 "An explicit Redis URL has to be provided "
                 "when the built-in Redis service is disabled"
             ))
 
+        if isinstance(redis_url, (list, tuple)):
+            redis_url = list(redis_url)
+
+        # External shards are given by the list of URLs
+
+        if not enabled:
+            num_urls = len(redis_url) if isinstance(redis_url, list) else 1
+
+            if shards > 1 and shards != num_urls:
+                raise ValueError((
+                    "The number of shards ({}) does not match the "
+                    "number of Redis URLs ({})"
+                ).format(shards, num_urls))
+
+            shards = num_urls
+
+        if shards < 1:
+            raise ValueError("There should be at least one Redis shard")
+
         self.enabled = bool(enabled)
         self.host = host
         self.redis_url = redis_url
+        self.backend = StorageBackends(backend) if backend else None
+        self.stream_maxlen = stream_maxlen
+        self.retention = parse_policies(retention)
+        self.maxmemory = maxmemory
+        self.maxmemory_policy = maxmemory_policy
+        self.shards = shards
+
+        self.shard_by = RedisShardStrategies(shard_by) \
+            if shard_by else RedisShardStrategies.SERVICE
 
         if not self.enabled:
             warnings.warn(self.WARN_MSG, Warning)
 
+    @property
+    def retention_json(self):
+        if not self.retention:
+            return None
+
+        return json.dumps({
+            family: policy.to_dict()
+            for family, policy in self.retention.items()
+        })
+
+    @property
+    def shard_hosts(self):
+        if not self.enabled:
+            return []
+
+        return [self.host] + [
+            "{}_{}".format(self.host, idx)
+            for idx in range(1, self.shards)
+        ]
+
+    @property
+    def internal_urls(self):
+        if self.enabled:
+            return [f"redis://{host}" for host in self.shard_hosts]
+
+        if isinstance(self.redis_url, list):
+            return self.redis_url
+
+        return [self.redis_url]
+
     @property
     def internal_url(self):
-        return f"redis://{self.host}" if self.enabled else self.redis_url
+        return self.internal_urls[0]
+
+    def get_shard(self, name):
+        # CRC32 is stable across processes (unlike the built-in hash)
+        return zlib.crc32(name.encode()) % self.shards
 
     @property
     def config(self):
-        return {ConfigVars.REDIS_URL.value: self.internal_url}
+        return {
+            ConfigVars.REDIS_URL.value: self.internal_url,
+            ConfigVars.REDIS_BACKEND.value: self.backend.value if self.backend else None,
+            ConfigVars.REDIS_STREAM_MAXLEN.value: self.stream_maxlen,
+            ConfigVars.REDIS_RETENTION.value: self.retention_json
+        }
 
-    def to_compose_dict(self, topology):
-        return get_redis_definition(topology, self)
+    def to_compose_dict(self, topology, index=None):
+        return get_redis_definition(topology, self, index=index)
 
 
 class TopologyDockerProxy:
     WARN_MSG = "Disabled built-in topology Docker API Proxy service"
 
-    def __init__(self, enabled=True, host=DEFAULT_HOST_DOCKER_PROXY):
+    def __init__(
+            self, enabled=True, host=DEFAULT_HOST_DOCKER_PROXY,
+            watch=False, watch_host=DEFAULT_HOST_DOCKER_WATCH):
+        if watch and not enabled:
+            raise ValueError("The watch service requires the Docker API Proxy")
+
         self.enabled = bool(enabled)
         self.host = host
+        self.watch = bool(watch)
+        self.watch_host = watch_host
 
         if not self.enabled:
             warnings.warn(self.WARN_MSG, Warning)
@@ -380,10 +555,14 @@ class TopologyDockerProxy:
     @property
     def config(self):
         docker_url = "tcp://{}:2375/".format(self.host)
-        return {ConfigVars.DOCKER_PROXY_URL.value: docker_url}
 
-    def to_compose_dict(self, topology):
-        return get_docker_proxy_definition(topology)
+        return {
+            ConfigVars.DOCKER_PROXY_URL.value: docker_url,
+            ConfigVars.DOCKER_WATCH.value: 1 if self.watch else None
+        }
+
+    def to_compose_dict(self, topology, index=None):
+        return get_docker_proxy_definition(topology, index=index)
 
 
 class Topology:
@@ -399,8 +578,10 @@ class Topology:
 
         assert len(set(self.nodes)) == len(self.nodes)
 
-        assert len(set(self.services).union(self.nodes)) \
-            == len([*self.services, *self.nodes])
+        services = self.services
+
+        assert len(set(services).union(self.nodes)) \
+            == len([*services, *self.nodes])
 
     @property
     def config(self):
@@ -418,27 +599,66 @@ class Topology:
     def docker_proxy_compose_dict(self):
         return self.docker_proxy.to_compose_dict(self)
 
+    def build_index(self):
+        """Builds an index of the relations between the models. The index
+        is a snapshot: a new one should be built after mutating them."""
+
+        return TopologyIndex(self)
+
     @property
     def brokers(self):
         brokers = self._brokers if self._brokers else []
-        brokers += [node.broker for node in self.nodes if node.broker]
-        return list(set(brokers))
+        brokers = [*brokers, *(node.broker for node in self.nodes if node.broker)]
+        return list(dict.fromkeys(brokers))
 
     @property
     def networks(self):
-        nets_node = set(net for node in self.nodes for net in node.networks)
-        nets_brkr = set(net for brk in self.brokers for net in brk.networks)
-        return list(nets_node.union(nets_brkr))
+        nets_node = [net for node in self.nodes for net in node.networks]
+        nets_brkr = [net for brk in self.brokers for net in brk.networks]
+        return list(dict.fromkeys([*nets_node, *nets_brkr]))
 
     @property
     def services(self):
-        return list(set(srv for node in self.nodes for srv in node.services))
+        return list(dict.fromkeys(srv for node in self.nodes for srv in node.services))
 
     def get_service_nodes(self, service):
-        return list(set(node for node in self.nodes for item in node.services if item is service))
+        return [
+            node for node in self.nodes
+            if any(item is service for item in node.services)
+        ]
+
+    def analyze(self, threshold=DEFAULT_THRESHOLD):
+        """Estimates the offered load of each network and reports
+        saturated links, unknown targets and undersized resources."""
+
+        return analyze_topology(self, threshold=threshold)
 
     def to_compose_dict(self):
         return get_topology_definition(self)
 
     def to_compose_yaml(self):
         return yaml.dump(self.to_compose_dict())
+
+    @property
+    def schedule_files(self):
+        return {
+            net.schedule_file: net.schedule_content
+            for net in self.networks
+            if net.schedule
+        }
+
+    def write_schedule_files(self, path):
+        """Writes the files of the Docker configs that contain the network
+        schedules. These should be next to the Compose file (see configs)."""
+
+        for file_name, content in self.schedule_files.items():
+            if len(content) > SCHEDULE_MAX_BYTES:
+                _logger.warning(
+                    "Schedule %s (%s bytes) exceeds the size of a Docker config",
+                    file_name, len(content))
+
+            file_path = os.path.join(path, file_name)
+            _logger.info("Writing network schedule to: %s", file_path)
+
+            with open(file_path, "w") as fh:
+                fh.write(content)
@@ -0,0 +1,144 @@
+"""Time-varying network conditions.
+
+A schedule is a list of netem settings with a ``time`` offset (seconds
+since the gateway started). Each entry only needs to define the settings
+that change: the conditions at any given time are the accumulation of
+all the previous entries over the base netem settings of the network.
+Schedules may also be read from CSV traces with a ``time`` column and
+one column for each setting (rates without units are read as kbit/s).
+
+Traces are too long to be passed in the command of the gateway (a single
+argument is limited to 128 KiB), so schedules are shipped to the gateway
+as a JSON file in a Docker config.
+"""
+
+import csv
+import hashlib
+import json
+
+NETEM_KEYS = (
+    "latency",
+    "jitter",
+    "correlation",
+    "loss",
+    "duplicate",
+    "reorder",
+    "corrupt",
+    "rate",
+    "rate_burst",
+    "rate_latency"
+)
+
+KEY_TIME = "time"
+KEY_SCHEDULE = "schedule"
+KEY_PERIOD = "schedule_period"
+SCHEDULE_TARGET = "/etc/wotemu/schedule.json"
+
+# Size limit of Docker configs
+
+SCHEDULE_MAX_BYTES = 500 * 1024
+
+_RATE_UNIT = "kbit"
+_NETEM_QDISC_KEYS = ("latency", "loss", "duplicate", "reorder", "corrupt")
+
+
+def _parse_value(key, val):
+    if val is None or val == "":
+        return None
+
+    if key == "rate":
+        try:
+            return "{}{}".format(float(val), _RATE_UNIT)
+        except ValueError:
+            return str(val).strip()
+
+    if key == "rate_burst":
+        return str(val).strip()
+
+    return float(val)
+
+
+def read_schedule_csv(path):
+    with open(path, "r", newline="") as fh:
+        reader = csv.DictReader(fh)
+
+        return [
+            {
+                key: _parse_value(key, val)
+                for key, val in row.items()
+                if key in NETEM_KEYS or key == KEY_TIME
+            }
+            for row in reader
+        ]
+
+
+def read_schedule_json(path):
+    with open(path, "r") as fh:
+        return json.load(fh)
+
+
+def dump_schedule(schedule):
+    return json.dumps(schedule, separators=(",", ":"))
+
+
+def get_schedule_digest(content):
+    return hashlib.sha1(content.encode()).hexdigest()[:12]
+
+
+def normalize_schedule(schedule):
+    """Validates the entries of a schedule and sorts them by time.
+    Accepts a list of dicts or the path to a CSV or JSON trace."""
+
+    if isinstance(schedule, str) and schedule.lower().endswith(".json"):
+        schedule = read_schedule_json(schedule)
+    elif isinstance(schedule, str):
+        schedule = read_schedule_csv(schedule)
+
+    entries = []
+
+    for item in schedule:
+        if item.get(KEY_TIME) is None or float(item[KEY_TIME]) < 0:
+            raise ValueError("Invalid schedule time: {}".format(item))
+
+        unknown = set(item.keys()).difference(NETEM_KEYS).difference([KEY_TIME])
+
+        if unknown:
+            raise ValueError("Unknown schedule keys: {}".format(unknown))
+
+        entry = {key: val for key, val in item.items() if val is not None}
+        entry[KEY_TIME] = float(entry[KEY_TIME])
+        entries.append(entry)
+
+    return sorted(entries, key=lambda item: item[KEY_TIME])
+
+
+def get_schedule_states(base, schedule=None):
+    """Returns the list of (time, netem settings) pairs that result
+    from applying each schedule entry over the previous settings."""
+
+    state = {key: val for key, val in base.items() if key in NETEM_KEYS}
+    states = [(0.0, dict(state))]
+
+    for entry in normalize_schedule(schedule or []):
+        state.update({key: val for key, val in entry.items() if key != KEY_TIME})
+
+        if entry[KEY_TIME] <= 0:
+            states[0] = (0.0, dict(state))
+        else:
+            states.append((entry[KEY_TIME], dict(state)))
+
+    return states
+
+
+def get_netem_shape(states):
+    """Returns the qdiscs (netem, tbf) that are required by any of the
+    settings so that all of them can be applied with 'tc qdisc change'."""
+
+    has_netem = any(
+        item.get(key) is not None
+        for item in states
+        for key in _NETEM_QDISC_KEYS)
+
+    has_rate = any(item.get("rate") is not None for item in states)
+
+    return has_netem, has_rate
@@ -7,20 +7,26 @@ import pprint
 import re
 import sys
 import time
+from collections import namedtuple
 
 import docker
 import netaddr
 import netifaces
-import sh
-import tornado.httpclient
-
+import wotemu.config
+from wotemu.dockerapi import get_docker_api
 from wotemu.enums import Labels
+from wotemu.httpclient import get_http_client
 
 _CGROUP_PATH = "/proc/self/cgroup"
 _STACK_NAMESPACE = "com.docker.stack.namespace"
 _CID_HOST_LEN = 12
 _STATE_RUNNING = "running"
 
+_ThingCacheEntry = namedtuple(
+    "_ThingCacheEntry",
+    ["td_url", "etag", "consumed", "time"])
+
+_thing_cache = {}
 _logger = logging.getLogger(__name__)
 
 
@@ -28,9 +34,13 @@ class NodeHTTPTimeout(Exception):
     pass
 
 
+class NodeReadyTimeout(Exception):
+    pass
+
+
 async def _ping_catalogue(catalogue_url, thing_ids=None):
     thing_ids = thing_ids or []
-    http_client = tornado.httpclient.AsyncHTTPClient()
+    http_client = get_http_client()
 
     try:
         catalogue_res = await http_client.fetch(catalogue_url)
@@ -41,8 +51,6 @@ async def _ping_catalogue(catalogue_url, thing_ids=None):
     except Exception as ex:
         _logger.debug("Catalogue ping error (%s): %s", catalogue_url, repr(ex))
         return False
-    finally:
-        http_client.close()
 
 
 async def _ping_catalogue_timeout(catalogue_url, wait, timeout, thing_ids=None):
@@ -75,8 +83,25 @@ async def _ping_catalogue_timeout(catalogue_url, wait, timeout, thing_ids=None):
         await asyncio.sleep(wait)
 
 
+async def _wait_ready(conf, hosts, timeout, thing_ids=None):
+    # Imported here to avoid a circular import (readiness depends on utils)
+    from wotemu.readiness import wait_ready
+
+    _logger.debug("Waiting for readiness notifications: %s", hosts)
+
+    try:
+        await wait_ready(
+            redis_url=conf.redis_url,
+            hosts=hosts,
+            thing_ids=thing_ids,
+            timeout=timeout)
+    except asyncio.TimeoutError:
+        raise NodeReadyTimeout(f"Readiness timeout ({timeout} s): {hosts}")
+
+
 async def wait_node(conf, name, wait=2, timeout=120, find_replicas=True, thing_ids=None):
     cont_hosts = [name]
+    resolved = False
 
     if find_replicas:
         _logger.debug((
@@ -85,14 +110,30 @@ async def wait_node(conf, name, wait=2, timeout=120, find_replicas=True, thing_i
             "replicas for that service"
         ), name)
 
+        # Imported here to avoid a circular import (metadata depends on utils)
+        from wotemu.metadata import read_service_hostnames
+
         try:
-            cont_hosts = get_service_container_hostnames(
-                docker_url=conf.docker_proxy_url,
-                name=name)
+            cont_hosts = await read_service_hostnames(conf, name)
+            resolved = True
         except Exception as ex:
             _logger.warning("Error finding container hostnames: %s", ex)
             _logger.warning("Using untranslated service name: %s", cont_hosts)
 
+    # Readiness records are indexed by container hostname: HTTP polling is
+    # kept for names that have not been translated and when Redis is unavailable
+
+    if resolved and conf.redis_url:
+        try:
+            await _wait_ready(conf, cont_hosts, timeout, thing_ids=thing_ids)
+            return
+        except NodeReadyTimeout:
+            raise
+        except Exception as ex:
+            _logger.warning(
+                "Error waiting for readiness notifications (%s): "
+                "Falling back to HTTP polling", repr(ex))
+
     catalogue_urls = [
         "http://{}:{}".format(host, conf.port_catalogue)
         for host in cont_hosts
@@ -112,20 +153,18 @@ async def wait_node(conf, name, wait=2, timeout=120, find_replicas=True, thing_i
     await asyncio.gather(*ping_awaitables)
 
 
-def _find_service_container_hosts(docker_api_client, service_name):
-    task_filters = {
-        "service": service_name,
-        "desired-state": _STATE_RUNNING
-    }
-
-    _logger.debug("Filtering Docker tasks using filters: %s", task_filters)
+def _find_service_container_hosts(docker_api, service_name):
+    _logger.debug("Finding running Docker tasks for service: %s", service_name)
 
     try:
-        service_tasks = docker_api_client.tasks(filters=task_filters)
+        service_tasks = docker_api.find_tasks(
+            service=service_name,
+            desired_state=_STATE_RUNNING,
+            fresh=True)
     except Exception as ex:
         _logger.warning(
-            "Error finding Docker tasks (filters: %s): %s",
-            task_filters, ex)
+            "Error finding Docker tasks (service: %s): %s",
+            service_name, ex)
 
         return []
 
@@ -133,21 +172,20 @@ def _find_service_container_hosts(docker_api_client, service_name):
         "Found %s tasks for service: %s",
         len(service_tasks), service_name)
 
-    return [
-        task["Status"]["ContainerStatus"]["ContainerID"][:_CID_HOST_LEN]
-        for task in service_tasks
-    ]
+    cids = [get_task_container_id(task) for task in service_tasks]
+
+    return [cid[:_CID_HOST_LEN] for cid in cids if cid]
 
 
 def get_service_container_hostnames(docker_url, name):
-    docker_api_client = docker.APIClient(base_url=docker_url)
+    docker_api = get_docker_api(docker_url)
 
     _logger.debug("Finding container hostnames for: %s", name)
     service_parts = name.split(".")
 
     try:
         network_candidate = service_parts[-1]
-        docker_api_client.inspect_network(network_candidate)
+        docker_api.inspect_network(network_candidate)
         _logger.debug("Found network: %s", network_candidate)
         base_name = ".".join(service_parts[:-1])
     except docker.errors.NotFound:
@@ -162,7 +200,7 @@ def get_service_container_hostnames(docker_url, name):
 
     ret = [
         _find_service_container_hosts(
-            docker_api_client=docker_api_client,
+            docker_api=docker_api,
             service_name=service_name)
         for service_name in service_names
     ]
@@ -209,17 +247,29 @@ def get_current_container_id():
     return cid
 
 
+def get_current_container_hostname():
+    return get_current_container_id()[:_CID_HOST_LEN]
+
+
 def get_task_container_id(task_dict):
     return task_dict.get("Status", {}).get("ContainerStatus", {}).get("ContainerID", None)
 
 
 def get_current_task(docker_url):
-    docker_api_client = docker.APIClient(base_url=docker_url)
+    docker_api = get_docker_api(docker_url)
     cid = get_current_container_id()
 
-    task = next((
-        task for task in docker_api_client.tasks()
-        if get_task_container_id(task) == cid), None)
+    def find_task():
+        return next((
+            task for task in docker_api.tasks()
+            if get_task_container_id(task) == cid), None)
+
+    task = find_task()
+
+    if task is None:
+        _logger.debug("Task not found in cached tasks: Refreshing")
+        docker_api.invalidate(("tasks",))
+        task = find_task()
 
     if task is None:
         raise Exception("Could not find task for container: {}".format(cid))
@@ -233,7 +283,7 @@ def get_current_stack_namespace(docker_url):
 
 
 def get_task_networks(docker_url, task):
-    docker_api_client = docker.APIClient(base_url=docker_url)
+    docker_api = get_docker_api(docker_url)
 
     network_ids = [
         net["Network"]["ID"]
@@ -241,7 +291,7 @@ def get_task_networks(docker_url, task):
     ]
 
     networks = {
-        net_id: docker_api_client.inspect_network(net_id)
+        net_id: docker_api.inspect_network(net_id)
         for net_id in network_ids
     }
 
@@ -254,16 +304,14 @@ def get_task_networks(docker_url, task):
 
 
 def get_task_labels(docker_url, task_name):
-    docker_api_client = docker.APIClient(base_url=docker_url)
-    task_info = docker_api_client.inspect_task(task_name)
+    task_info = get_docker_api(docker_url).inspect_task(task_name)
 
     return task_info["Spec"]["ContainerSpec"]["Labels"]
 
 
 def get_network_gateway_task(docker_url, network_id):
-    docker_api_client = docker.APIClient(base_url=docker_url)
-
-    network_info = docker_api_client.inspect_network(network_id, verbose=True)
+    docker_api = get_docker_api(docker_url)
+    network_info = docker_api.inspect_network(network_id, verbose=True, fresh=True)
 
     service_infos = {
         net_name: info
@@ -351,8 +399,39 @@ def import_func(module_path, func_name):
     return getattr(mod_import, func_name)
 
 
-async def consume_from_catalogue(wot, port_catalogue, servient_host, thing_id):
-    http_client = tornado.httpclient.AsyncHTTPClient()
+def _thing_cache_key(wot, servient_host, port_catalogue, thing_id):
+    # ConsumedThings are bound to the servient of the WoT entrypoint
+    return (id(wot), servient_host, int(port_catalogue), thing_id)
+
+
+def invalidate_consumed_thing(servient_host, thing_id, port_catalogue=None):
+    """Removes the cached TD and ConsumedThing of the given thing
+    (i.e. after an interaction error that may be due to a stale TD)."""
+
+    keys = [
+        key for key in _thing_cache
+        if key[1] == servient_host and key[3] == thing_id and
+        (port_catalogue is None or key[2] == int(port_catalogue))
+    ]
+
+    for key in keys:
+        _logger.debug("Invalidating cached thing: %s", key)
+        _thing_cache.pop(key, None)
+
+
+async def _fetch_td(http_client, td_url, etag=None):
+    headers = {"If-None-Match": etag} if etag else None
+    res = await http_client.fetch(td_url, headers=headers, raise_error=False)
+
+    if etag and res.code == 304:
+        return None, etag
+
+    res.rethrow()
+
+    return res.body, res.headers.get("Etag", None)
+
+
+async def _fetch_td_url(http_client, port_catalogue, servient_host, thing_id):
     cat_url = "http://{}:{}".format(servient_host, port_catalogue)
 
     _logger.debug("Fetching catalogue: %s", cat_url)
@@ -365,24 +444,63 @@ async def consume_from_catalogue(wot, port_catalogue, servient_host, thing_id):
     if thing_id not in catalogue:
         raise Exception(f"Thing '{thing_id}' not in catalogue: {cat_url}")
 
-    td_url = "http://{}:{}/{}".format(
+    return "http://{}:{}/{}".format(
         servient_host,
         port_catalogue,
         catalogue[thing_id].strip("/"))
 
+
+async def consume_from_catalogue(wot, port_catalogue, servient_host, thing_id, ttl=None):
+    """Returns a ConsumedThing for the given thing. Both the TD and the
+    ConsumedThing are cached in the current process: a cached entry is
+    returned as is during the TTL, and revalidated with the ETag of the
+    TD once the TTL has expired (the catalogue is only fetched on misses)."""
+
+    ttl = ttl if ttl is not None else wotemu.config.get_env_config().thing_cache_ttl
+    key = _thing_cache_key(wot, servient_host, port_catalogue, thing_id)
+    entry = _thing_cache.get(key, None)
+
+    if entry and (time.time() - entry.time) <= ttl:
+        return entry.consumed
+
+    http_client = get_http_client()
+
+    if entry:
+        try:
+            td_str, etag = await _fetch_td(
+                http_client, entry.td_url, etag=entry.etag)
+
+            if td_str is None:
+                _logger.debug("Revalidated cached TD: %s", entry.td_url)
+                consumed = entry.consumed
+            else:
+                _logger.debug("Updated cached TD: %s", entry.td_url)
+                consumed = wot.consume(td_str)
+
+            _thing_cache[key] = _ThingCacheEntry(
+                td_url=entry.td_url,
+                etag=etag,
+                consumed=consumed,
+                time=time.time())
+
+            return consumed
+        except Exception as ex:
+            _logger.debug("Error revalidating TD (%s): %s", entry.td_url, repr(ex))
+            _thing_cache.pop(key, None)
+
+    td_url = await _fetch_td_url(
+        http_client, port_catalogue, servient_host, thing_id)
+
     _logger.debug("Consuming from URL: %s", td_url)
 
-    return await wot.consume_from_url(td_url)
+    td_str, etag = await _fetch_td(http_client, td_url)
+    consumed = wot.consume(td_str)
 
+    if ttl > 0:
+        _thing_cache[key] = _ThingCacheEntry(
+            td_url=td_url,
+            etag=etag,
+            consumed=consumed,
+            time=time.time())
 
-def cgget(name):
-    try:
-        sh_cgget = sh.Command("cgget")
-        cmd_parts = ["-v", "-r", name, "/"]
-        proc = sh_cgget(cmd_parts, _err_to_out=True)
-        _logger.debug("%s: %s", proc.ran, proc.stdout)
-        match = re.search(r"(-?\d+)\n", proc.stdout.decode("utf8"))
-        return int(match.group(1)) if match else None
-    except:
-        _logger.warning("Error running cgget for: %s", exc_info=True)
-        return None
+    return consumed
@@ -1,39 +1,59 @@
-import json
+import functools
 import logging
-import os
 
-import aioredis
 import wotemu.config
-from wotemu.enums import RedisPrefixes
+from wotemu.enums import RedisPrefixes, WriterPolicies
+from wotemu.storage.base import get_storage
+from wotemu.storage.manager import get_redis_manager
 
 _logger = logging.getLogger(__name__)
 
 
-async def redis_from_env():
-    env_config = wotemu.config.get_env_config()
+def _thing_key(data):
+    return "{}:{}:{}".format(
+        RedisPrefixes.NAMESPACE.value,
+        RedisPrefixes.THING.value,
+        data["host"])
 
-    if not env_config.redis_url:
-        raise Exception("Undefined Redis URL")
 
-    return await aioredis.create_redis_pool(env_config.redis_url)
+def redis_thing_enqueue(data, writer):
+    """Non-blocking thing callback: the interaction item is appended
+    to the buffer of the telemetry writer (dropped if it is full)."""
+
+    try:
+        writer.put_nowait(_thing_key(data), data)
+    except Exception as ex:
+        _logger.warning("Error in Redis callback: %s", ex)
 
 
-async def redis_thing_callback(data, client=None):
+async def redis_thing_put(data, writer):
+    """Thing callback that waits until there is
+    free space in the buffer of the telemetry writer."""
+
     try:
-        redis = None
-        redis = client if client else await redis_from_env()
+        await writer.put(_thing_key(data), data)
+    except Exception as ex:
+        _logger.warning("Error in Redis callback: %s", ex)
 
-        key = "{}:{}:{}".format(
-            RedisPrefixes.NAMESPACE.value,
-            RedisPrefixes.THING.value,
-            data["host"])
 
-        score = data["time"]
-        member = json.dumps(data)
-        await redis.zadd(key=key, score=score, member=member)
+def get_writer_thing_callback(writer):
+    """Returns the thing callback that enqueues the interaction
+    items in the given telemetry writer according to its policy."""
+
+    if writer.policy == WriterPolicies.BLOCK:
+        return functools.partial(redis_thing_put, writer=writer)
+
+    return functools.partial(redis_thing_enqueue, writer=writer)
+
+
+async def redis_thing_callback(data, client=None, backend=None):
+    """Thing callback that writes the interaction item
+    directly (without the telemetry writer buffer)."""
+
+    try:
+        redis_url = wotemu.config.get_env_config().redis_telemetry_url
+        redis = client if client else await get_redis_manager(redis_url).get()
+        storage = get_storage(redis, backend=backend)
+        await storage.write(key=_thing_key(data), items=[data])
     except Exception as ex:
         _logger.warning("Error in Redis callback: %s", ex)
-    finally:
-        if client is None and redis:
-            redis.close()
-            await redis.wait_closed()
@@ -25,6 +25,17 @@ def _truncate_key(data_dict, key, max_len=512):
     data_dict.update({key: str_val})
 
 
+def _dispatch(callback, data, loop):
+    """Callbacks may be plain functions (e.g. enqueueing the item
+    in the telemetry writer) or coroutine functions. A task
+    is only created for the latter."""
+
+    result = callback(data)
+
+    if asyncio.iscoroutine(result):
+        loop.create_task(result)
+
+
 class VerbCallback:
     def __init__(self, verb, func, call_args, call_kwargs):
         self.verb = verb
@@ -155,7 +166,7 @@ class RequestVerbCallback(VerbCallback):
 
         data = self.data
         self._log_item(data)
-        self.loop.create_task(self.callback(data))
+        _dispatch(self.callback, data, self.loop)
 
 
 class SubscriptionVerbCallback(VerbCallback):
@@ -190,7 +201,7 @@ class SubscriptionVerbCallback(VerbCallback):
         def callback_task(data):
             data.update(self.data)
             self._log_item(data)
-            self.loop.create_task(self.callback(data))
+            _dispatch(self.callback, data, self.loop)
 
         event_key = "event"
 
@@ -291,8 +302,15 @@ def _subscribe_deco(verb):
 class ExposedThing(wotpy.wot.exposed.thing.ExposedThing):
     def __init__(self, *args, **kwargs):
         self.deco_cb = kwargs.pop("deco_cb", None)
+        self.expose_cb = kwargs.pop("expose_cb", None)
         super().__init__(*args, **kwargs)
 
+    def expose(self):
+        super().expose()
+
+        if self.expose_cb:
+            _dispatch(self.expose_cb, self, asyncio.get_event_loop())
+
     @_request_deco(InteractionVerbs.INVOKE_ACTION)
     async def invoke_action(self, *args, **kwargs):
         return await super().invoke_action(*args, **kwargs)
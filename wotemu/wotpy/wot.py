@@ -17,6 +17,7 @@ class WoT(wotpy.wot.wot.WoT):
     def __init__(self, *args, **kwargs):
         self.exposed_cb = kwargs.pop("exposed_cb", None)
         self.consumed_cb = kwargs.pop("consumed_cb", None)
+        self.expose_cb = kwargs.pop("expose_cb", None)
         super().__init__(*args, **kwargs)
 
     def consume(self, td_str):
@@ -33,7 +34,8 @@ class WoT(wotpy.wot.wot.WoT):
         exposed_thing = ExposedThing(
             servient=self._servient,
             thing=thing,
-            deco_cb=self.exposed_cb)
+            deco_cb=self.exposed_cb,
+            expose_cb=self.expose_cb)
 
         self._servient.add_exposed_thing(exposed_thing)
         return exposed_thing
@@ -41,7 +43,8 @@ class WoT(wotpy.wot.wot.WoT):
 
 def wot_entrypoint(
         port_catalogue=9090, hostname=None, exposed_cb=None, consumed_cb=None,
-        port_http=None, port_ws=None, port_coap=None, mqtt_url=None):
+        port_http=None, port_ws=None, port_coap=None, mqtt_url=None,
+        expose_cb=None):
     servient = wotpy.wot.servient.Servient(
         hostname=hostname,
         catalogue_port=port_catalogue)
@@ -74,4 +77,5 @@ def wot_entrypoint(
     return WoT(
         servient=servient,
         exposed_cb=exposed_cb,
-        consumed_cb=consumed_cb)
+        consumed_cb=consumed_cb,
+        expose_cb=expose_cb)